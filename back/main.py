@@ -2,27 +2,56 @@
 # ** works great dont change it**
 
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Dict
 import os
 import google.generativeai as genai
-from yt_dlp import YoutubeDL
 import ffmpeg
 from dotenv import load_dotenv
 import uuid 
 import logging
 import time
+import asyncio
+import hashlib
 import re
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 # Add these imports at the top
 import stripe
 from fastapi import Request
 # Add to your main.py imports
 from supabase import create_client, Client
 from datetime import datetime
+import sys
+
+# Shared pipeline helpers live in backend/utils
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from utils.source_cache import SourceCache
+from utils.ingest import PROXY_FORMAT, download_sections
+from utils.singleflight import InFlightJobs, request_key
+from utils.preflight import MetadataCache, check_admission
+from utils.transcript import TRANSCRIPT_PROMPT_VERSION, fetch_transcript, build_transcript_prompt
+from utils.analysis_proxy import PROXY_MODES, UploadStats, create_analysis_proxy
+from utils.gemini_files import GeminiFileRegistry, RemoteFileCache, file_digest
+from utils.analysis_cache import AnalysisCache
+from utils.file_waiter import FileWaiter
+from utils.ffmpeg_async import run_ffmpeg
+from utils.gemini_parser import CLIP_FORMAT_VERSION, StreamingClipParser, parse_gemini_response
+from utils.windowed_analysis import WINDOWED_ANALYSIS_MIN_SECONDS, plan_windows, cut_window, analyze_windowed
+from utils.quota import QuotaManager, estimate_tokens
+from utils.structured_analysis import (STRUCTURED_OUTPUT_FORMAT, STRUCTURED_PROMPT_VERSION, ParseStats,
+                                       analyze_structured, structured_generation_config)
+from utils.usage import JobUsage, UsageLedger
+from utils.clip_normalizer import ClipSet, ClipStats
+from utils.clip_extractor import ExtractionStats, extract_clips
+from utils.ffmpeg_pool import FfmpegPool, OrderedTasks
+from utils.keyframe_index import KeyframeIndexStore
+from utils.smart_render import SmartRenderer
+from utils.virtual_clip import MANIFEST_SUFFIX, VirtualClipStore, parse_range
+from utils.renditions import RenditionRenderer
+from utils.analysis_backend import create_analysis_backend
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -66,8 +95,19 @@ supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 # Configure Gemini AI
 genai.configure(api_key=os.getenv("GOOGLE_AI_API_KEY"))
 
+# Every upload, file lookup and generate call goes through this; ANALYSIS_BACKEND=fake runs offline
+analysis_backend = create_analysis_backend(os.getenv("ANALYSIS_BACKEND", "gemini"))
+
+class ClipFiles(StaticFiles):
+    """The clips directory, without the virtual clip manifests kept in it; they hold server paths"""
+
+    async def get_response(self, path: str, scope):
+        if MANIFEST_SUFFIX in path:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return await super().get_response(path, scope)
+
 # Mount the clips directory to serve files
-app.mount("/clips", StaticFiles(directory="clips"), name="clips")
+app.mount("/clips", ClipFiles(directory="clips"), name="clips")
 
 # Add these new models
 class CheckoutSession(BaseModel):
@@ -89,80 +129,84 @@ class ProcessingJob:
         self.highlights = None
         self.error = None
         self.message = None
+        self.usage = JobUsage()
 
 active_jobs = {}
 
-def convert_timestamp_to_seconds(timestamp: str) -> int:
-    """Convert MM:SS or HH:MM:SS format to seconds"""
-    parts = timestamp.strip().split(':')
-    if len(parts) == 2:  # MM:SS
-        return int(parts[0]) * 60 + int(parts[1])
-    elif len(parts) == 3:  # HH:MM:SS
-        return int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
-    raise ValueError(f"Invalid timestamp format: {timestamp}")
-
-def parse_gemini_response(response_text: str) -> list:
-    """Parse Gemini's response into structured clip data"""
-    logging.info("Starting to parse Gemini response...")
-    clips = []
-    current_clip = None
-    
-    for line in response_text.split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Remove markdown formatting if present
-        line = line.replace('**', '')
-            
-        # Look for timestamp pattern (MM:SS - MM:SS)
-        timestamp_match = re.search(r'(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})', line)
-        if timestamp_match:
-            if current_clip:
-                clips.append(current_clip)
-            
-            start_str, end_str = timestamp_match.groups()
-            try:
-                # Add 1 second to the end time
-                end_seconds = convert_timestamp_to_seconds(end_str) + 1
-                current_clip = {
-                    'start_time': convert_timestamp_to_seconds(start_str),
-                    'end_time': end_seconds,
-                    'original_end': end_str,  # Keep original for reference
-                    'description': '',
-                    'viral_potential': 0,
-                    'platforms': []
-                }
-                logging.debug(f"Found timestamp: {start_str} - {end_str} (adjusted end to +1 second)")
-            except ValueError as e:
-                logging.error(f"Error parsing timestamp: {e}")
-                continue
-        
-        elif current_clip:
-            # Handle description
-            if 'Description:' in line:
-                current_clip['description'] = line.split('Description:', 1)[1].strip()
-            
-            # Handle viral potential
-            elif 'Viral Potential:' in line:
-                try:
-                    potential_str = line.split('Viral Potential:', 1)[1].strip()
-                    potential = int(potential_str.split('/')[0])
-                    current_clip['viral_potential'] = potential
-                except (ValueError, IndexError) as e:
-                    logging.error(f"Error parsing viral potential: {e}")
-                    
-            # Handle platforms
-            elif 'Best Platforms:' in line:
-                platforms_str = line.split('Best Platforms:', 1)[1].strip()
-                platforms = [p.strip(' ,') for p in re.split(r'[,\s]+', platforms_str) if p.strip(' ,')]
-                current_clip['platforms'] = platforms
-    
-    # Don't forget to add the last clip
-    if current_clip:
-        clips.append(current_clip)
-    
-    return clips
+# Strong references to running pipeline tasks so they are not garbage collected
+running_tasks = set()
+
+# Downloaded sources are shared across jobs, keyed by canonical video id and format
+source_cache = SourceCache(max_bytes=int(float(os.getenv("SOURCE_CACHE_MAX_GB", "20")) * 1024 ** 3))
+
+# Identical submissions (same normalized URL and options) attach to the job already running them
+in_flight = InFlightJobs()
+
+# Metadata-only probes, reused by the download that follows admission
+metadata_cache = MetadataCache()
+
+# Upload bytes and time-to-ACTIVE per analysis proxy mode
+upload_stats = UploadStats()
+
+# Uploaded Gemini files reused across jobs, keyed by source content hash and proxy mode
+remote_files = RemoteFileCache(get_file=analysis_backend.get_file)
+
+# Leases on uploaded Gemini files per job; a background reaper deletes them once nothing uses them
+file_registry = GeminiFileRegistry(
+    analysis_backend.delete_file,
+    max_bytes=int(float(os.getenv("GEMINI_STORAGE_MAX_GB", "18")) * 1024 ** 3),
+    on_delete=remote_files.discard,
+)
+# How long an uploaded file is kept for reuse by later jobs after the last job using it finishes
+GEMINI_FILE_RETENTION = float(os.getenv("GEMINI_FILE_RETENTION_HOURS", "24")) * 60 * 60
+
+# Videos longer than this are analyzed as overlapping windows unless the job sets windowedAnalysis
+WINDOWED_ANALYSIS_THRESHOLD = float(os.getenv("WINDOWED_ANALYSIS_MIN_MINUTES", WINDOWED_ANALYSIS_MIN_SECONDS / 60)) * 60
+
+# Parsed analyses reused across jobs, keyed by content hash, prompt version and model
+analysis_cache = AnalysisCache(max_bytes=int(float(os.getenv("ANALYSIS_CACHE_MAX_MB", "256")) * 1024 ** 2))
+
+# Waits for uploads to leave PROCESSING; every job's wait shares the event loop
+file_waiter = FileWaiter(analysis_backend.get_file)
+
+# Gemini requests/min, tokens/min and concurrent uploads shared by every job; waiters are served by tier
+gemini_quota = QuotaManager(
+    requests_per_minute=float(os.getenv("GEMINI_RPM", "15")),
+    tokens_per_minute=float(os.getenv("GEMINI_TPM", "1000000")),
+    max_concurrent_uploads=int(os.getenv("GEMINI_MAX_CONCURRENT_UPLOADS", "4")),
+)
+
+# How often each response format leaves a job with no usable clips
+parse_stats = ParseStats()
+
+# Gemini tokens, upload bytes and estimated cost totalled per tier
+usage_ledger = UsageLedger()
+
+# How many suggested clips were merged, trimmed or dropped before cutting, and the seconds saved
+clip_stats = ClipStats()
+
+# Clips cut by one-pass batch extraction versus falling back to an ffmpeg process each
+extraction_stats = ExtractionStats()
+
+# Cores' worth of ffmpeg work allowed to run at once, shared by every job
+ffmpeg_pool = FfmpegPool()
+
+# Keyframe indexes kept next to each downloaded source, built with ffprobe on first use
+keyframe_indexes = KeyframeIndexStore(ffmpeg_pool.slot)
+
+# Frame-exact clip starts: only the frames before the first keyframe are re-encoded
+smart_renderer = SmartRenderer(ffmpeg_pool.slot, ffmpeg_pool.encode_threads)
+
+# Clips served straight from their cached source until they are downloaded
+virtual_clips = VirtualClipStore(source_cache.touch, source_cache.hold, source_cache.drop)
+
+# Each clip's platform formats (9:16, 1:1, 16:9 sizes) encoded from one decode of its source
+rendition_renderer = RenditionRenderer(ffmpeg_pool.slot, ffmpeg_pool.encode_threads)
+
+GEMINI_MODEL = 'gemini-1.5-flash'
+
+# Bump when build_video_prompt changes so cached analyses are not reused
+VIDEO_PROMPT_VERSION = 'video-v1'
 
 def sanitize_filename(filename: str) -> str:
     """Remove invalid characters from filename"""
@@ -175,7 +219,7 @@ def sanitize_filename(filename: str) -> str:
         filename = filename[:200]
     return filename.strip('_')
 
-def create_highlights_reel(video_folder: str, clips: list, min_viral_potential: int = 7):
+async def create_highlights_reel(video_folder: str, clips: list, min_viral_potential: int = 7):
     """Create a highlights reel from clips with high viral potential"""
     try:
         logging.info(f"Creating highlights reel from clips with viral potential >= {min_viral_potential}")
@@ -193,16 +237,24 @@ def create_highlights_reel(video_folder: str, clips: list, min_viral_potential:
         concat_file = os.path.join(video_folder, "concat_list.txt")
         with open(concat_file, 'w', encoding='utf-8') as f:
             for clip in highlight_clips:
-                safe_path = os.path.abspath(clip['url']).replace('\\', '/')
-                f.write(f"file '{safe_path}'\n")
+                manifest = virtual_clips.manifest(clip['url'])
+                if manifest:
+                    # A virtual clip has no file of its own; its stretch of the source is read instead
+                    safe_path = manifest['source'].replace('\\', '/')
+                    f.write(f"file '{safe_path}'\ninpoint {manifest['start']}\noutpoint {manifest['end']}\n")
+                else:
+                    safe_path = os.path.abspath(clip['url']).replace('\\', '/')
+                    f.write(f"file '{safe_path}'\n")
         
         logging.info(f"Concatenating {len(highlight_clips)} clips for highlights reel")
         
         try:
-            ffmpeg.input(concat_file, format='concat', safe=0) \
-                  .output(highlights_path, c='copy') \
-                  .overwrite_output() \
-                  .run(capture_stdout=True, capture_stderr=True)
+            async with ffmpeg_pool.slot():
+                await run_ffmpeg(
+                    ffmpeg.input(concat_file, format='concat', safe=0)
+                          .output(highlights_path, c='copy')
+                          .overwrite_output()
+                )
                   
             logging.info(f"Successfully created highlights reel: {highlights_path}")
             return highlights_path
@@ -218,107 +270,435 @@ def create_highlights_reel(video_folder: str, clips: list, min_viral_potential:
         if 'concat_file' in locals() and os.path.exists(concat_file):
             os.remove(concat_file)
 
-def process_video_task(job_id: str, url: str, options: dict):
+def build_video_prompt(analysis_mode: str, output_format: str = None) -> str:
+    """Prompt for analyzing an uploaded video (or its audio-only proxy)"""
+    media = "audio track from a video" if analysis_mode == 'audio' else "video"
+    output_format = output_format or """For each moment, provide the information in EXACTLY this format:
+
+        MM:SS - MM:SS
+        Description: [Describe what happens in this clip]
+        Viral Potential: [Rate from 1-10]
+        Best Platforms: [List suitable social platforms]"""
+    return f"""Analyze this {media} and identify the most engaging moments.
+        {output_format}
+
+        Keep clips between 1-5 minutes long. 
+        Let them make sense in context of the video.
+        Focus on moments that would be engaging on social media."""
+
+def report_queue_position(job: ProcessingJob, action: str):
+    """on_position callback that shows a job its place in the Gemini queue"""
+    def report(position: int):
+        job.message = f"Waiting for Gemini {action} capacity: position {position} in queue"
+    return report
+
+def report_cut_progress(job: ProcessingJob):
+    """on_progress callback that shows a job how many of its clips are cut"""
+    def report(done: int, started: int):
+        job.message = f"Cut {done} of {started} clips"
+    return report
+
+async def upload_for_analysis(job: ProcessingJob, job_id: str, video_path: str, analysis_mode: str, file_key: str,
+                              tier: str):
+    """Return an ACTIVE Gemini file for video_path, reusing an earlier upload when possible"""
+    # Reuse an earlier upload of the same content while Gemini still has it
+    video_file = await asyncio.to_thread(remote_files.get, file_key)
+    if video_file is not None and file_registry.acquire(video_file.name, job_id):
+        job.usage.record_upload(0, reused=True)
+        return video_file
+
+    # Optionally shrink what we upload: 'video' (low fps/resolution) or 'audio' (speech only)
+    upload_path = video_path
+    if analysis_mode in PROXY_MODES:
+        job.message = "Preparing analysis proxy..."
+        logging.info(job.message)
+        # Only the video proxy runs a multi-threaded encoder
+        weight = ffmpeg_pool.encode_threads if analysis_mode == 'video' else 1
+        async with ffmpeg_pool.slot(weight):
+            upload_path = await create_analysis_proxy(video_path, analysis_mode, f"downloads/proxies/{job_id}",
+                                                      threads=ffmpeg_pool.encode_threads)
+
+    # Upload to Gemini
+    try:
+        upload_bytes = os.path.getsize(upload_path)
+        async with gemini_quota.upload(tier, report_queue_position(job, "upload")):
+            job.message = "Uploading to Gemini..."
+            logging.info(job.message)
+            upload_started = time.time()
+            # The Gemini SDK has no async upload, so it runs on a worker thread
+            video_file = await asyncio.to_thread(analysis_backend.upload_file, path=upload_path)
+    finally:
+        # The proxy is only needed for the upload, whether or not it went through
+        if upload_path != video_path:
+            os.remove(upload_path)
+    expiration = getattr(video_file, 'expiration_time', None)
+    file_registry.register(video_file.name, job_id, upload_bytes, expiration.timestamp() if expiration else None)
+
+    job.message = "Waiting for Gemini processing..."
+    logging.info(job.message)
+    video_file = await file_waiter.wait_active(video_file, upload_bytes)
+
+    if video_file.state.name != "ACTIVE":
+        raise Exception(f"Video processing failed: {video_file.state.name}")
+    upload_stats.record(analysis_mode, upload_bytes, time.time() - upload_started)
+    job.usage.record_upload(upload_bytes)
+    remote_files.put(file_key, video_file)
+    file_registry.retain(video_file.name, GEMINI_FILE_RETENTION)
+    return video_file
+
+def get_authenticated_user_id(auth_header: Optional[str]) -> Optional[str]:
+    """The Supabase user a Bearer token belongs to; None without a token, 401 for an invalid one"""
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    try:
+        return supabase.auth.get_user(auth_header.split(' ')[1]).user.id
+    except Exception as e:
+        logging.error(f"Auth error: {str(e)}")
+        raise HTTPException(status_code=401, detail="Invalid authentication token")
+
+def get_subscription_tier(user_id: Optional[str]) -> str:
+    """Look up a user's subscription tier, defaulting to free"""
+    if not user_id:
+        return 'free'
+    try:
+        user_data = supabase.table('users').select('subscription_tier').eq('user_id', user_id).single().execute()
+        return user_data.data.get('subscription_tier') or 'free'
+    except Exception as e:
+        logging.error(f"Error fetching subscription tier for {user_id}: {str(e)}")
+        return 'free'
+
+async def generate_with_quota(job: ProcessingJob, tier: str, model, contents, estimated_tokens: int, **kwargs):
+    """generate_content_async behind the Gemini quota, settling the token reservation afterwards"""
+    async with gemini_quota.generate(tier, estimated_tokens, report_queue_position(job, "analysis")) as used:
+        job.message = "Analyzing with Gemini..."
+        response = await model.generate_content_async(contents, **kwargs)
+        used(response.usage_metadata.total_token_count)
+    job.usage.record_generate(GEMINI_MODEL, response.usage_metadata)
+    return response
+
+def write_analysis_report(video_folder: str, video_title: str, job_id: str, response_text: str, usage: JobUsage):
+    """Save Gemini's response and what it cost as analysis.md next to the clips"""
+    analysis_path = os.path.join(video_folder, "analysis.md")
+    with open(analysis_path, 'w', encoding='utf-8') as f:
+        f.write(f"# AI Analysis for: {video_title}\n\n")
+        f.write(f"Job ID: {job_id}\n")
+        f.write(f"Analysis Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        f.write("## Identified Clips\n\n")
+        f.write(response_text)
+        f.write("\n\n")
+        f.write(usage.to_markdown())
+
+async def process_video_task(job_id: str, url: str, options: dict):
     """Main video processing task"""
     job = active_jobs[job_id]
     video_path = None
+    subscription_tier = None
+    keyframes_ready = None
+    clip_tasks = None
     
     try:
-        # Download video
-        logging.info("Starting video download...")
-        ydl_opts = {
-            'format': 'best',
-            'quiet': True,
-            'no_warnings': True,
-            'outtmpl': f'downloads/{job_id}_%(title)s.%(ext)s'
-        }
-        
-        os.makedirs('downloads', exist_ok=True)
-        
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            video_path = ydl.prepare_filename(info)
-            video_title = sanitize_filename(info.get('title', 'unknown_video'))
+        # Pre-flight: check the metadata against the user's plan before downloading anything
+        job.message = "Checking video..."
+        logging.info(job.message)
+        probed_info = await asyncio.to_thread(metadata_cache.probe, url)
+        subscription_tier = await asyncio.to_thread(get_subscription_tier, options.get('user_id'))
+        # 'proxy' analyzes the smallest rendition and later fetches only the chosen segments at full quality
+        ingest_mode = options.get('ingestMode', 'full')
+        rejection = check_admission(probed_info, subscription_tier, PROXY_FORMAT if ingest_mode == 'proxy' else 'best')
+        if rejection:
+            raise Exception(rejection)
+
+        # Transcript-first: when the video has captions, analyze them as text instead of uploading the video
+        transcript = None
+        if options.get('useTranscript', True):
+            transcript = await asyncio.to_thread(fetch_transcript, probed_info)
+
+        if ingest_mode == 'proxy' and transcript:
+            logging.info("Analyzing transcript, skipping proxy download")
+        elif ingest_mode == 'proxy':
+            logging.info("Starting proxy download...")
+            video_path, info = await asyncio.to_thread(source_cache.fetch, url, PROXY_FORMAT, probed_info)
             logging.info(f"Video downloaded: {video_path}")
+        else:
+            logging.info("Starting video download...")
+            video_path, info = await asyncio.to_thread(source_cache.fetch, url, 'best', probed_info)
+            logging.info(f"Video downloaded: {video_path}")
+            # Indexed while the analysis runs; clips are cut starting on its keyframes
+            keyframes_ready = asyncio.create_task(keyframe_indexes.get(video_path))
+        video_title = sanitize_filename(probed_info.get('title', 'unknown_video'))
 
         # Create video folder
         video_folder = f"clips/{video_title}_{job_id}"
         os.makedirs(video_folder, exist_ok=True)
         
-        # Upload to Gemini
-        logging.info("Uploading to Gemini...")
-        video_file = genai.upload_file(path=video_path)
-        
-        while video_file.state.name == "PROCESSING":
-            logging.info("Waiting for Gemini processing...")
-            time.sleep(5)
-            video_file = genai.get_file(video_file.name)
+        # Analyses are cached by what was analyzed, how, and with which model
+        analysis_mode = options.get('analysisProxy', 'none')
+        if transcript:
+            content_key = hashlib.sha256(transcript.encode('utf-8')).hexdigest()
+            prompt_version = TRANSCRIPT_PROMPT_VERSION
+        else:
+            content_key = f"{await asyncio.to_thread(file_digest, video_path)}:{analysis_mode}"
+            prompt_version = VIDEO_PROMPT_VERSION
+
+        # Long videos are analyzed as overlapping windows, all in flight at once
+        windows = None
+        duration = probed_info.get('duration') or 0
+        if not transcript and duration and options.get('windowedAnalysis', duration > WINDOWED_ANALYSIS_THRESHOLD):
+            windows = plan_windows(duration)
+            prompt_version = f"{VIDEO_PROMPT_VERSION}:windows-{len(windows)}"
+
+        # JSON output validated clip by clip; streamed responses keep the text format
+        structured = options.get('structuredOutput', not options.get('streamResponse', False))
+        output_format = None
+        if structured:
+            output_format = STRUCTURED_OUTPUT_FORMAT
+            prompt_version = f"{prompt_version}:{STRUCTURED_PROMPT_VERSION}"
+        prompt_version = f"{prompt_version}:{CLIP_FORMAT_VERSION}"
+
+        cached_analysis = await asyncio.to_thread(analysis_cache.get, content_key, prompt_version, GEMINI_MODEL)
+
+        # Cuts run concurrently within ffmpeg_pool's limit; results come back in the order cuts started
+        clip_tasks = OrderedTasks(report_cut_progress(job))
+        # Suggestions are merged, trimmed and clamped to the video before anything is cut
+        clip_set = ClipSet(duration)
+        # Clips start on the exact requested frame instead of the keyframe before it; cut one by one
+        smart_render = options.get('smartRender', False)
+        # Clips are served from the cached source and only written out when downloaded
+        keep_virtual = options.get('virtualClips', False)
+        # Every clip is also rendered in the formats its suggested platforms use
+        render_platforms = options.get('renditions', False)
+
+        async def cut_clip(clip_number: int, clip: dict, section_path: str = None):
+            """Cut one clip into video_folder; returns the clip with its url, or None on failure"""
+            try:
+                logging.info(f"Processing clip {clip_number}...")
+
+                if ingest_mode == 'proxy':
+                    # In proxy mode the clip is its full-quality section download
+                    if section_path is None:
+                        section_path = (await asyncio.to_thread(
+                            download_sections,
+                            url,
+                            [(clip['start_time'], clip['end_time'])],
+                            video_folder,
+                            info=probed_info
+                        ))[0]
+                    if not section_path:
+                        raise Exception("Segment download failed")
+                    output_path = section_path
+                else:
+                    # Already cut by the batch extraction unless it failed for this clip
+                    output_path = section_path
+                    if output_path is None:
+                        clip_filename = f"clip_{clip_number}_{clip['start_time']}_{clip['end_time']}.mp4"
+                        output_path = os.path.join(video_folder, clip_filename)
+                        rendered = None
+                        if keep_virtual:
+                            rendered = await asyncio.to_thread(virtual_clips.create, output_path, video_path,
+                                                               clip['start_time'], clip['end_time'])
+                        keyframes = None
+                        if not rendered:
+                            keyframes = await keyframes_ready if keyframes_ready else None
+                        if keyframes and smart_render:
+                            rendered = await smart_renderer.render(video_path, clip['start_time'], clip['end_time'],
+                                                                   output_path, keyframes)
+                            if rendered:
+                                keyframe_indexes.record_cut(0)
+                        if not rendered:
+                            # Seeking exactly to a keyframe leaves no pre-roll frames for players to show frozen
+                            start = clip['start_time']
+                            if keyframes:
+                                start = keyframes.before(clip['start_time'])
+                                keyframe_indexes.record_cut(clip['start_time'] - start)
+                            async with ffmpeg_pool.slot():
+                                await run_ffmpeg(
+                                    ffmpeg.input(video_path, ss=start, t=clip['end_time'] - start)
+                                          .output(output_path, acodec='copy', vcodec='copy')
+                                          .overwrite_output()
+                                )
 
-        if video_file.state.name != "ACTIVE":
-            raise Exception(f"Video processing failed: {video_file.state.name}")
+                clip['url'] = output_path
+                if render_platforms:
+                    if ingest_mode == 'proxy':
+                        # The proxy is too small to render from; the full-quality section is the clip itself
+                        source_path, start, end = output_path, 0, clip['end_time'] - clip['start_time']
+                    else:
+                        source_path, start, end = video_path, clip['start_time'], clip['end_time']
+                    clip['renditions'] = await rendition_renderer.render(
+                        source_path, start, end, os.path.splitext(output_path)[0], clip.get('platforms', [])
+                    )
+                logging.info(f"Processed clip {clip_number}")
+                return clip
 
-        # Generate content
-        logging.info("Analyzing video content...")
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        prompt = """Analyze this video and identify the most engaging moments.
-        For each moment, provide the information in EXACTLY this format:
+            except Exception as e:
+                logging.error(f"Error processing clip {clip_number}: {e}")
+                return None
 
-        MM:SS - MM:SS
-        Description: [Describe what happens in this clip]
-        Viral Potential: [Rate from 1-10]
-        Best Platforms: [List suitable social platforms]
+        def start_cut(clip: dict, section_path: str = None):
+            # Each cut is its own task so it can overlap with a still-streaming response
+            clip_tasks.start(cut_clip(len(clip_tasks) + 1, dict(clip), section_path))
 
-        Keep clips between 1-5 minutes long. 
-        Let them make sense in context of the video.
-        Focus on moments that would be engaging on social media."""
+        if cached_analysis:
+            logging.info("Using cached analysis, skipping Gemini")
+            job.usage.cached_analysis = True
+            response_text, clips = cached_analysis
+        else:
+            model = analysis_backend.generative_model(GEMINI_MODEL)
+
+            async def analyze(parts: list, media_duration: float, estimated_tokens: int):
+                """One Gemini analysis in this job's response format; returns (response_text, clips)"""
+                if structured:
+                    response_text, clips, retries, dropped = await analyze_structured(
+                        lambda contents: generate_with_quota(job, subscription_tier, model, contents, estimated_tokens,
+                                                             generation_config=structured_generation_config()),
+                        parts,
+                        media_duration
+                    )
+                    parse_stats.record_attempt('structured', retries, dropped)
+                    return response_text, clips
+                response = await generate_with_quota(job, subscription_tier, model, parts, estimated_tokens)
+                return response.text, parse_gemini_response(response.text)
+
+            if windows:
+                job.message = f"Analyzing {len(windows)} windows..."
+                logging.info(job.message)
+                window_dir = f"downloads/windows/{job_id}"
+                window_responses = {}
+
+                async def analyze_window(start, end):
+                    keyframes = await keyframes_ready if keyframes_ready else None
+                    async with ffmpeg_pool.slot():
+                        window_path, origin = await cut_window(video_path, start, end, window_dir, keyframes)
+                    try:
+                        window_file = await upload_for_analysis(
+                            job, job_id, window_path, analysis_mode, f"{content_key}:{int(start)}-{int(end)}",
+                            subscription_tier
+                        )
+                    finally:
+                        os.remove(window_path)
+                    window_text, window_clips = await analyze(
+                        [window_file, build_video_prompt(analysis_mode, output_format)],
+                        end - start,
+                        estimate_tokens(end - start, analysis_mode)
+                    )
+                    window_responses[start] = f"## Window {int(start)}-{int(end)}s\n\n{window_text}"
+                    return origin, window_clips
+
+                clips = await analyze_windowed(windows, analyze_window)
+                response_text = '\n\n'.join(window_responses[start] for start in sorted(window_responses))
+            else:
+                if transcript:
+                    # Text-only analysis: no upload and no PROCESSING wait
+                    job.message = "Analyzing transcript..."
+                    logging.info(job.message)
+                    prompt = build_transcript_prompt(transcript, output_format)
+                    contents = [prompt]
+                    estimated_tokens = estimate_tokens(text=prompt)
+                else:
+                    video_file = await upload_for_analysis(job, job_id, video_path, analysis_mode, content_key,
+                                                           subscription_tier)
+                    logging.info("Analyzing video content...")
+                    contents = [video_file, build_video_prompt(analysis_mode, output_format)]
+                    estimated_tokens = estimate_tokens(duration, analysis_mode)
+
+                if options.get('streamResponse', False) and not structured:
+                    async with gemini_quota.generate(subscription_tier, estimated_tokens,
+                                                     report_queue_position(job, "analysis")) as used:
+                        job.message = "Analyzing with Gemini..."
+                        # Start cutting each clip as soon as its block has streamed in
+                        parser = StreamingClipParser()
+                        response_chunks = []
+                        response = await model.generate_content_async(contents, stream=True)
+                        async for chunk in response:
+                            response_chunks.append(chunk.text)
+                            for clip in parser.feed(chunk.text):
+                                # Clips already being cut stay as they are; only the newcomer is trimmed
+                                clip = clip_set.add(clip, merge=False)
+                                if clip:
+                                    start_cut(clip)
+                        for clip in parser.close():
+                            clip = clip_set.add(clip, merge=False)
+                            if clip:
+                                start_cut(clip)
+                        response_text = ''.join(response_chunks)
+                        clips = parser.clips
+                        used(response.usage_metadata.total_token_count)
+                    job.usage.record_generate(GEMINI_MODEL, response.usage_metadata)
+                else:
+                    response_text, clips = await analyze(contents, duration, estimated_tokens)
+
+            parse_stats.record_job('structured' if structured else 'text', len(clips))
+            if clips:
+                await asyncio.to_thread(analysis_cache.put, content_key, prompt_version, GEMINI_MODEL, response_text, clips)
+
+        write_analysis_report(video_folder, video_title, job_id, response_text, job.usage)
+
+        # Streamed clips were fitted in one by one as they arrived; the rest are normalized together
+        if not clip_tasks:
+            clips = clip_set.normalize(clips)
+        clip_stats.record(clip_set.get_stats())
 
-        response = model.generate_content([video_file, prompt])
-        
-        # Parse clips from response
-        clips = parse_gemini_response(response.text)
         if not clips:
             raise Exception("No valid clips identified")
-        
-        # Process clips
-        processed_clips = []
-        for i, clip in enumerate(clips, 1):
-            try:
-                job.message = f"Processing clip {i}/{len(clips)}..."
+
+        # Clips that were not already started from the stream are cut now
+        if not clip_tasks:
+            section_paths = [None] * len(clips)
+            if ingest_mode == 'proxy':
+                job.message = "Downloading selected segments at full quality..."
                 logging.info(job.message)
-                
-                clip_filename = f"clip_{i}_{clip['start_time']}_{clip['end_time']}.mp4"
-                output_path = os.path.join(video_folder, clip_filename)
-                
-                duration = clip['end_time'] - clip['start_time']
-                
-                ffmpeg.input(video_path, ss=clip['start_time'], t=duration) \
-                      .output(output_path, acodec='copy', vcodec='copy') \
-                      .overwrite_output() \
-                      .run(capture_stdout=True, capture_stderr=True)
-                
-                clip['url'] = output_path
-                processed_clips.append(clip)
-                logging.info(f"Processed clip {i}/{len(clips)}")
-                
-            except Exception as e:
-                logging.error(f"Error processing clip {i}: {e}")
-                continue
+                section_paths = await asyncio.to_thread(
+                    download_sections,
+                    url,
+                    [(clip['start_time'], clip['end_time']) for clip in clips],
+                    video_folder,
+                    info=probed_info
+                )
+            elif len(clips) > 1 and options.get('batchExtract', False) and not (smart_render or keep_virtual):
+                # One ffmpeg process reads the source once for every clip. Off by default: concurrent
+                # per-clip cuts were as fast or faster in bench_clip_extraction, except on long 60 fps sources
+                job.message = f"Cutting {len(clips)} clips..."
+                logging.info(job.message)
+                keyframes = await keyframes_ready if keyframes_ready else None
+                extract_started = time.time()
+                async with ffmpeg_pool.slot():
+                    section_paths = await extract_clips(video_path, clips, [
+                        os.path.join(video_folder, f"clip_{number}_{clip['start_time']}_{clip['end_time']}.mp4")
+                        for number, clip in enumerate(clips, 1)
+                    ], keyframes=keyframes)
+                if keyframes:
+                    for clip, section_path in zip(clips, section_paths):
+                        if section_path:
+                            keyframe_indexes.record_cut(clip['start_time'] - keyframes.before(clip['start_time']))
+                extraction_stats.record(len(clips), sum(1 for path in section_paths if path),
+                                        time.time() - extract_started)
+            for clip, section_path in zip(clips, section_paths):
+                start_cut(clip, section_path)
+
+        clip_results = [clip for clip in await clip_tasks.results() if clip]
         
-        if not processed_clips:
+        if not clip_results:
             raise Exception("Failed to process any clips")
         
         # Create highlights reel
         job.message = "Creating highlights reel..."
-        highlights_path = create_highlights_reel(video_folder, processed_clips)
+        highlights_path = await create_highlights_reel(video_folder, clip_results)
         
         # Update clip URLs
         processed_clips = []
-        for clip in clips:
+        for clip in clip_results:
             relative_path = os.path.relpath(clip['url'], 'clips').replace('\\', '/')
+            # Virtual clips have no file yet and are served from their source
+            route = 'clips' if os.path.exists(clip['url']) else 'virtual-clips'
             processed_clips.append({
                 **clip,
-                'url': f"/clips/{relative_path}"
+                'url': f"/{route}/{relative_path}"
             })
+            if clip.get('renditions'):
+                processed_clips[-1]['renditions'] = [
+                    {**rendition, 'url': '/clips/' + os.path.relpath(rendition['url'], 'clips').replace('\\', '/')}
+                    for rendition in clip['renditions']
+                ]
 
         job.clips = processed_clips
 
@@ -338,7 +718,8 @@ def process_video_task(job_id: str, url: str, options: dict):
                     user_id=options['user_id'],
                     clips=processed_clips,
                     highlights_url=job.highlights,
-                    video_url=url
+                    video_url=url,
+                    usage=job.usage.to_dict()
                 )
                 logging.info("Successfully saved video history")
             except Exception as e:
@@ -354,21 +735,43 @@ def process_video_task(job_id: str, url: str, options: dict):
         
     except Exception as e:
         logging.error(f"Processing error: {str(e)}")
+        if clip_tasks:
+            # Cuts started from the stream would otherwise keep writing clips and holding ffmpeg_pool
+            await clip_tasks.cancel()
         job.state = "failed"
         job.error = str(e)
 
+    finally:
+        in_flight.finish(job_id)
+        file_registry.release_job(job_id)
+        # Failed jobs are counted too: whatever Gemini calls they made were still billed
+        usage_ledger.record(subscription_tier, job.usage.to_dict())
+        # The source stays in the shared cache for later jobs; just release our hold on it
+        source_cache.release(video_path)
+
 @app.post("/process-video")
-async def process_video(request: VideoRequest, background_tasks: BackgroundTasks):
+async def process_video(request: VideoRequest, http_request: Request):
     """Endpoint to start video processing"""
+    # The plan, queue priority and history follow the signed-in user, never a user_id the client sends
+    options = {key: value for key, value in request.options.items() if key != 'user_id'}
+    user_id = await asyncio.to_thread(get_authenticated_user_id, http_request.headers.get('Authorization'))
+    if user_id:
+        options['user_id'] = user_id
+    elif 'user_id' in request.options:
+        logging.warning("Ignoring user_id sent without an authentication token; processing on the free plan")
+
     job_id = str(uuid.uuid4())
+    running_job_id = in_flight.attach_or_register(request_key(request.url, options), job_id)
+    if running_job_id != job_id:
+        logging.info(f"Attaching duplicate submission to running job {running_job_id}")
+        return {"jobId": running_job_id}
+
     active_jobs[job_id] = ProcessingJob()
     
-    background_tasks.add_task(
-        process_video_task,
-        job_id,
-        request.url,
-        request.options
-    )
+    # Jobs run as tasks on the event loop; only blocking library calls go to threads
+    task = asyncio.create_task(process_video_task(job_id, request.url, options))
+    running_tasks.add(task)
+    task.add_done_callback(running_tasks.discard)
     
     return {"jobId": job_id}
 
@@ -384,7 +787,8 @@ async def get_status(job_id: str):
         "message": job.message,
         "clips": job.clips if job.state == "completed" else [],
         "highlights": job.highlights if job.state == "completed" else None,
-        "error": job.error if job.state == "failed" else None
+        "error": job.error if job.state == "failed" else None,
+        "usage": job.usage.to_dict()
     }
 
 
@@ -605,6 +1009,70 @@ async def cancel_subscription(request: Request):
         logging.error(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
 
+@app.get("/metrics")
+async def get_metrics():
+    """Endpoint exposing cache counters"""
+    return {
+        "source_cache": source_cache.get_stats(),
+        "uploads": upload_stats.get_stats(),
+        "remote_files": remote_files.get_stats(),
+        "gemini_files": file_registry.get_stats(),
+        "analysis_cache": analysis_cache.get_stats(),
+        "file_waiter": file_waiter.get_stats(),
+        "gemini_quota": gemini_quota.get_stats(),
+        "parsing": parse_stats.get_stats(),
+        "usage": usage_ledger.get_stats(),
+        "clips": clip_stats.get_stats(),
+        "extraction": extraction_stats.get_stats(),
+        "ffmpeg": ffmpeg_pool.get_stats(),
+        "keyframes": keyframe_indexes.get_stats(),
+        "smart_render": smart_renderer.get_stats(),
+        "virtual_clips": virtual_clips.get_stats(),
+        "renditions": rendition_renderer.get_stats()
+    }
+
+def virtual_clip_response(clip, range_header: Optional[str], headers: dict) -> StreamingResponse:
+    """Serve a virtual clip, or the part of it a player asked for with a Range header"""
+    try:
+        byte_range = parse_range(range_header, clip.size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{clip.size}"})
+    first, last = byte_range or (0, clip.size - 1)
+    headers = {**headers, "Content-Length": str(last - first + 1)}
+    if byte_range:
+        headers["Content-Range"] = f"bytes {first}-{last}/{clip.size}"
+    return StreamingResponse(virtual_clips.stream(clip, first, last), status_code=206 if byte_range else 200,
+                             media_type="video/mp4", headers=headers)
+
+@app.get("/virtual-clips/{file_path:path}")
+async def get_virtual_clip(file_path: str, request: Request, download: bool = False):
+    """A clip kept virtual, served from its source; ?download=1 writes it out as a regular file first"""
+    video_path = os.path.join("clips", file_path)
+    # Unlike the /clips mount, nothing else keeps the path inside clips/ or away from the manifests
+    if (MANIFEST_SUFFIX in file_path
+            or os.path.commonpath([os.path.realpath("clips"), os.path.realpath(video_path)]) != os.path.realpath("clips")):
+        raise HTTPException(status_code=404, detail="Video not found")
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename={os.path.basename(file_path)}",
+        "Cross-Origin-Resource-Policy": "cross-origin",
+        "Cross-Origin-Embedder-Policy": "require-corp",
+        "Cross-Origin-Opener-Policy": "same-origin"
+    }
+    try:
+        if download and not os.path.exists(video_path):
+            await asyncio.to_thread(virtual_clips.materialize, video_path)
+        if not os.path.exists(video_path):
+            clip = await asyncio.to_thread(virtual_clips.open, video_path)
+            if clip is None:
+                raise HTTPException(status_code=404, detail="Video not found")
+            return virtual_clip_response(clip, request.headers.get("range"), headers)
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail="Clip source is no longer available")
+    # Already written out by a download
+    return FileResponse(video_path, media_type="video/mp4", headers=headers)
+
 @app.get("/clips/{file_path:path}")
 async def get_video(file_path: str):
     video_path = os.path.join("clips", file_path)
@@ -622,17 +1090,15 @@ async def get_video(file_path: str):
         }
     )
 # After successful video processing
-async def save_video_history(user_id: str, clips: list, highlights_url: str, video_url: str):
+async def save_video_history(user_id: str, clips: list, highlights_url: str, video_url: str,
+                             usage: Optional[dict] = None):
     try:
         logging.info(f"Attempting to save video history for user {user_id}")
         logging.info(f"Clips: {clips}")
         logging.info(f"Highlights URL: {highlights_url}")
         
         # Get current subscription tier
-        user_data = supabase.table('users').select('subscription_tier').eq('user_id', user_id).single().execute()
-        logging.info(f"User data response: {user_data}")
-        
-        subscription_tier = user_data.data.get('subscription_tier', 'free')
+        subscription_tier = await asyncio.to_thread(get_subscription_tier, user_id)
         logging.info(f"User subscription tier: {subscription_tier}")
 
         # Save to history
@@ -642,11 +1108,13 @@ async def save_video_history(user_id: str, clips: list, highlights_url: str, vid
             'highlights_url': highlights_url,
             'subscription_tier': subscription_tier,
             'video_url': video_url,
-            'video_title': 'Video Title'
+            'video_title': 'Video Title',
+            'gemini_usage': usage
         }
         logging.info(f"Attempting to insert history data: {history_data}")
         
-        response = supabase.table('video_history').insert(history_data).execute()
+        # supabase-py is synchronous, so the insert runs on a worker thread
+        response = await asyncio.to_thread(supabase.table('video_history').insert(history_data).execute)
         logging.info(f"Insert response: {response}")
         
         return response.data
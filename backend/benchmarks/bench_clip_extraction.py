@@ -0,0 +1,203 @@
+"""Benchmark cutting a job's clips one ffmpeg process each against utils.clip_extractor.
+
+Cuts --clips non-overlapping clips of 60-90 s from a source of --minutes,
+three ways: one process per clip in turn, one per clip all at once (what
+process_video_task does when batch extraction is off) and extract_clips.
+Each runs against the source as a local file and again served over HTTP
+with --latency-ms per request and --mbps of bandwidth shared by all
+readers, like a source on slow network storage. With --cold
+the page cache is dropped before every local run (Linux, as root) so the
+local file is read from disk.
+
+    python benchmarks/bench_clip_extraction.py --clips 20 --minutes 40 --cold
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ffmpeg
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.clip_extractor import extract_clips
+from utils.ffmpeg_async import run_ffmpeg
+
+
+def make_source(path, minutes):
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size=640x360:rate=25:duration={minutes * 60}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={minutes * 60}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '50', '-c:a', 'aac', '-movflags', '+faststart', path,
+    ], check=True)
+
+
+def drop_page_cache():
+    os.sync()
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def synthetic_clips(duration, count, rng):
+    """count clips of 60-90 s in random non-overlapping places, as ClipSet leaves them"""
+    lengths = [rng.randint(60, 90) for _ in range(count)]
+    slack = duration - sum(lengths) - 1
+    if slack < 0:
+        raise SystemExit(f"{count} clips do not fit in {duration} s; use a longer --minutes")
+    cuts = sorted(rng.uniform(0, slack) for _ in range(count))
+    clips, position, previous = [], 0.0, 0.0
+    for length, cut in zip(lengths, cuts):
+        position += cut - previous
+        previous = cut
+        clips.append({'start_time': int(position), 'end_time': int(position) + length})
+        position += length
+    return clips
+
+
+class Throttle:
+    """Bandwidth shared by every request, like one disk serving several readers"""
+
+    def __init__(self, bytes_per_second):
+        self.lock = threading.Lock()
+        self.bytes_per_second = bytes_per_second
+        self.available_at = time.monotonic()
+
+    def take(self, size):
+        with self.lock:
+            now = time.monotonic()
+            self.available_at = max(self.available_at, now) + size / self.bytes_per_second
+            wait = self.available_at - now
+        time.sleep(wait)
+
+
+def serve(path, latency, throttle):
+    size = os.path.getsize(path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_HEAD(self):
+            self.send_range(send_body=False)
+
+        def do_GET(self):
+            self.send_range(send_body=True)
+
+        def send_range(self, send_body):
+            time.sleep(latency)
+            start, end = 0, size - 1
+            header = self.headers.get('Range')
+            if header and header.startswith('bytes='):
+                first, _, last = header[6:].partition('-')
+                start = int(first or 0)
+                end = int(last) if last else size - 1
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                self.send_response(200)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Content-Type', 'video/mp4')
+            self.end_headers()
+            if not send_body:
+                return
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start + 1
+                try:
+                    while remaining:
+                        chunk = f.read(min(64 * 1024, remaining))
+                        throttle.take(len(chunk))
+                        self.wfile.write(chunk)
+                        remaining -= len(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/{os.path.basename(path)}'
+
+
+def cut_one(source, clip, output_path):
+    return run_ffmpeg(
+        ffmpeg.input(source, ss=clip['start_time'], t=clip['end_time'] - clip['start_time'])
+              .output(output_path, acodec='copy', vcodec='copy')
+              .overwrite_output()
+    )
+
+
+async def per_clip_sequential(source, clips, paths):
+    for clip, path in zip(clips, paths):
+        await cut_one(source, clip, path)
+    return len(clips)
+
+
+async def per_clip_concurrent(source, clips, paths):
+    await asyncio.gather(*(cut_one(source, clip, path) for clip, path in zip(clips, paths)))
+    return len(clips)
+
+
+async def batch(source, clips, paths):
+    return sum(1 for path in await extract_clips(source, clips, paths) if path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clips', type=int, default=20)
+    parser.add_argument('--minutes', type=int, default=40)
+    parser.add_argument('--source', help='existing mp4 to cut instead of generating one')
+    parser.add_argument('--latency-ms', type=float, default=20, help='per-request latency of the HTTP source')
+    parser.add_argument('--mbps', type=float, default=200, help='bandwidth of the HTTP source, megabits per second')
+    parser.add_argument('--cold', action='store_true', help='drop the page cache before each local run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_clip_extraction_')
+    try:
+        source = args.source
+        if not source:
+            source = os.path.join(work_dir, 'source.mp4')
+            print(f"Generating a {args.minutes} min source...")
+            make_source(source, args.minutes)
+        duration = float(ffmpeg.probe(source)['format']['duration']) if shutil.which('ffprobe') else args.minutes * 60
+        clips = synthetic_clips(duration, args.clips, random.Random(args.seed))
+        paths = [os.path.join(work_dir, f'clip_{number}.mp4') for number in range(1, len(clips) + 1)]
+
+        server, url = serve(source, args.latency_ms / 1000, Throttle(args.mbps * 1e6 / 8))
+        print(f"{len(clips)} clips, {sum(c['end_time'] - c['start_time'] for c in clips)} s in total, "
+              f"{os.path.getsize(source) / 1024 ** 2:.0f} MB source; best of {args.repeat}")
+        print(f"{'':<24}{'local file' + (' (cold)' if args.cold else ''):>20}{f'HTTP ({args.latency_ms:g} ms, {args.mbps:g} Mb/s)':>28}")
+        for name, cut in [('per-clip, in turn', per_clip_sequential),
+                          ('per-clip, all at once', per_clip_concurrent),
+                          ('extract_clips', batch)]:
+            row = f"{name:<24}"
+            for location, width in [(source, 20), (url, 28)]:
+                best = None
+                for _ in range(args.repeat):
+                    if args.cold and location == source:
+                        drop_page_cache()
+                    started = time.perf_counter()
+                    cut_count = asyncio.run(cut(location, clips, paths))
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                    for path in paths:
+                        if os.path.exists(path):
+                            os.remove(path)
+                row += f"{f'{best:.2f} s' + ('' if cut_count == len(clips) else f' ({cut_count} cut)'):>{width}}"
+            print(row)
+        server.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark ClipSet on synthetic suggestion lists with the model's usual overlaps.
+
+For each simulated video, --moments moments are planted and reported the
+way Gemini tends to: some twice with slightly different bounds, some with
+a nested sub-range, some too short or too long, and a few running past the
+end of the video. Reports ffmpeg cuts and seconds of footage cut and
+concatenated into the highlights reel, before and after normalizing, and
+how long normalizing takes.
+
+    python benchmarks/bench_clip_normalizer.py --videos 200 --moments 12
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.clip_normalizer import ClipSet, clip_length
+
+HIGHLIGHT_MIN_VIRAL_POTENTIAL = 7
+
+
+def suggestion(start, end, rng):
+    return {
+        'start_time': int(start), 'end_time': int(end), 'original_end': '',
+        'description': 'moment', 'viral_potential': rng.randint(3, 10),
+        'platforms': rng.sample(['TikTok', 'YouTube Shorts', 'Instagram Reels', 'X'], 2),
+    }
+
+
+def synthetic_suggestions(duration, moments, rng):
+    clips = []
+    for _ in range(moments):
+        start = rng.uniform(0, duration - 30)
+        length = rng.choice([rng.uniform(20, 55), rng.uniform(60, 300), rng.uniform(300, 420)])
+        end = min(start + length, duration + rng.choice([0, 0, 0, 15]))
+        clips.append(suggestion(start, end, rng))
+        if rng.random() < 0.3:
+            clips.append(suggestion(start + rng.uniform(-2, 2), end + rng.uniform(-2, 2), rng))
+        if rng.random() < 0.2 and end - start > 40:
+            clips.append(suggestion(start + 10, end - 10, rng))
+        if rng.random() < 0.2:
+            clips.append(suggestion(start + (end - start) / 2, end + rng.uniform(30, 90), rng))
+    return clips
+
+
+def reel_seconds(clips):
+    return sum(clip_length(clip) for clip in clips if clip['viral_potential'] >= HIGHLIGHT_MIN_VIRAL_POTENTIAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', type=int, default=200)
+    parser.add_argument('--moments', type=int, default=12)
+    parser.add_argument('--duration', type=int, default=40 * 60, help='video length in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    totals = {'cuts_before': 0, 'cuts_after': 0, 'seconds_before': 0.0, 'seconds_after': 0.0,
+              'reel_before': 0.0, 'reel_after': 0.0, 'normalize_seconds': 0.0}
+    for _ in range(args.videos):
+        clips = synthetic_suggestions(args.duration, args.moments, rng)
+        # Before: every suggestion cut as reported, with the old one-second end pad
+        before = [{**clip, 'end_time': clip['end_time'] + 1} for clip in clips]
+        started = time.perf_counter()
+        after = ClipSet(args.duration).normalize(clips)
+        totals['normalize_seconds'] += time.perf_counter() - started
+
+        totals['cuts_before'] += len(before)
+        totals['cuts_after'] += len(after)
+        totals['seconds_before'] += sum(clip_length(clip) for clip in before)
+        totals['seconds_after'] += sum(clip_length(clip) for clip in after)
+        totals['reel_before'] += reel_seconds(before)
+        totals['reel_after'] += reel_seconds(after)
+
+    per_video = {key: value / args.videos for key, value in totals.items()}
+    print(f"{args.videos} videos of {args.duration // 60} min, {args.moments} moments each (per-video averages)")
+    print(f"{'':<26}{'before':>10}{'after':>10}")
+    print(f"{'ffmpeg cuts':<26}{per_video['cuts_before']:>10.1f}{per_video['cuts_after']:>10.1f}")
+    print(f"{'seconds cut':<26}{per_video['seconds_before']:>10.0f}{per_video['seconds_after']:>10.0f}")
+    print(f"{'highlights reel seconds':<26}{per_video['reel_before']:>10.0f}{per_video['reel_after']:>10.0f}")
+    print(f"normalize: {per_video['normalize_seconds'] * 1000:.2f} ms per video")
+
+
+if __name__ == '__main__':
+    main()
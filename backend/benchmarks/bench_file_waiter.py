@@ -0,0 +1,109 @@
+"""Benchmark the fixed 5 second PROCESSING poll against FileWaiter, offline.
+
+Uses FakeFileService, so no API key or network is needed. All time constants
+are divided by --speedup so a run takes seconds instead of minutes.
+
+    python benchmarks/bench_file_waiter.py --jobs 50 --speedup 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.fake_file_service import FakeFileService
+from utils.file_waiter import FileWaiter
+
+GEMINI_PROCESSING_RATE = 8 * 1024 ** 2
+FIXED_POLL_SECONDS = 5
+
+
+def fixed_poll(service, remote_file, poll_seconds):
+    while remote_file.state.name == "PROCESSING":
+        time.sleep(poll_seconds)
+        remote_file = service.get_file(remote_file.name)
+    return remote_file
+
+
+def run(strategy, sizes, speedup):
+    service = FakeFileService(processing_rate=GEMINI_PROCESSING_RATE * speedup, latency=0.05 / speedup)
+    waiter = FileWaiter(
+        service.get_file,
+        min_delay=1.0 / speedup,
+        max_delay=5.0 / speedup,
+        processing_rate=GEMINI_PROCESSING_RATE * speedup,
+    )
+    lags = []
+    lock = threading.Lock()
+    peak_threads = threading.active_count()
+    done = threading.Event()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            time.sleep(0.01)
+
+    def record(remote_file):
+        lag = (time.monotonic() - service.ready_at(remote_file.name)) * speedup
+        with lock:
+            lags.append(lag)
+
+    def fixed_job(size):
+        # Today's behaviour: one worker thread parked per waiting job
+        record(fixed_poll(service, service.upload_file(size_bytes=size), FIXED_POLL_SECONDS / speedup))
+
+    async def adaptive_jobs():
+        # All waits multiplexed on one event loop
+        async def job(size):
+            record(await waiter.wait_active(service.upload_file(size_bytes=size), size))
+        await asyncio.gather(*(job(size) for size in sizes))
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+    started = time.monotonic()
+    if strategy == 'fixed':
+        threads = [threading.Thread(target=fixed_job, args=(size,)) for size in sizes]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    else:
+        asyncio.run(adaptive_jobs())
+    wall = (time.monotonic() - started) * speedup
+    done.set()
+
+    return {
+        'strategy': strategy,
+        'mean_lag': statistics.mean(lags),
+        'p95_lag': sorted(lags)[int(len(lags) * 0.95) - 1],
+        'polls': service.get_calls,
+        'peak_threads': peak_threads,
+        'wall': wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=50)
+    parser.add_argument('--speedup', type=float, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    sizes = [random.randint(5, 500) * 1024 ** 2 for _ in range(args.jobs)]
+
+    print(f"{args.jobs} uploads of 5-500 MB, times in simulated seconds")
+    print(f"{'strategy':<10}{'mean lag':>10}{'p95 lag':>10}{'polls':>8}{'threads':>9}{'wall':>8}")
+    for strategy in ('fixed', 'adaptive'):
+        r = run(strategy, sizes, args.speedup)
+        print(f"{r['strategy']:<10}{r['mean_lag']:>10.2f}{r['p95_lag']:>10.2f}"
+              f"{r['polls']:>8}{r['peak_threads']:>9}{r['wall']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
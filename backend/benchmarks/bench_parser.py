@@ -0,0 +1,106 @@
+"""Benchmark utils.gemini_parser on multi-megabyte text responses.
+
+Builds a reply of about --megabytes by repeating the response corpus in
+fixtures/responses, then times the previous per-line parser (kept below for
+reference), parse_gemini_response on the whole text and StreamingClipParser
+fed in --chunk-byte pieces the way a streamed response arrives.
+
+    python benchmarks/bench_parser.py --megabytes 4 --repeat 5
+"""
+import argparse
+import glob
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.gemini_parser import StreamingClipParser, parse_gemini_response
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'responses')
+
+
+def legacy_parse(response_text):
+    """parse_gemini_response as it was inlined in main.py: MM:SS only, re.search per line"""
+    def seconds(timestamp):
+        parts = timestamp.strip().split(':')
+        return int(parts[0]) * 60 + int(parts[1])
+
+    clips = []
+    current_clip = None
+    for line in response_text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        line = line.replace('**', '')
+        timestamp_match = re.search(r'(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})', line)
+        if timestamp_match:
+            if current_clip:
+                clips.append(current_clip)
+            start_str, end_str = timestamp_match.groups()
+            current_clip = {'start_time': seconds(start_str), 'end_time': seconds(end_str) + 1,
+                            'original_end': end_str, 'description': '', 'viral_potential': 0, 'platforms': []}
+        elif current_clip:
+            if 'Description:' in line:
+                current_clip['description'] = line.split('Description:', 1)[1].strip()
+            elif 'Viral Potential:' in line:
+                try:
+                    current_clip['viral_potential'] = int(line.split('Viral Potential:', 1)[1].strip().split('/')[0])
+                except (ValueError, IndexError):
+                    pass
+            elif 'Best Platforms:' in line:
+                platforms_str = line.split('Best Platforms:', 1)[1].strip()
+                current_clip['platforms'] = [p.strip(' ,') for p in re.split(r'[,\s]+', platforms_str) if p.strip(' ,')]
+    if current_clip:
+        clips.append(current_clip)
+    return clips
+
+
+def streamed_parse(text, chunk_bytes):
+    parser = StreamingClipParser()
+    for start in range(0, len(text), chunk_bytes):
+        parser.feed(text[start:start + chunk_bytes])
+    parser.close()
+    return parser.clips
+
+
+def best_time(parse, text, repeat):
+    best, clips = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        clips = parse(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(clips)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--megabytes', type=float, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--chunk-bytes', type=int, default=256)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.txt'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            corpus.append(f.read().strip())
+    block = '\n\n'.join(corpus) + '\n\n'
+    text = block * max(1, int(args.megabytes * 1024 ** 2 / len(block)))
+    megabytes = len(text.encode('utf-8')) / 1024 ** 2
+    print(f"{megabytes:.1f} MB reply, best of {args.repeat}")
+
+    print(f"{'parser':<22}{'seconds':>9}{'MB/s':>9}{'clips':>8}")
+    for name, parse in [
+        ('legacy per-line', legacy_parse),
+        ('parse_gemini_response', parse_gemini_response),
+        (f'streamed {args.chunk_bytes}B chunks', lambda t: streamed_parse(t, args.chunk_bytes)),
+    ]:
+        seconds, clips = best_time(parse, text, args.repeat)
+        print(f"{name:<22}{seconds:>9.3f}{megabytes / seconds:>9.1f}{clips:>8}")
+
+
+if __name__ == '__main__':
+    main()
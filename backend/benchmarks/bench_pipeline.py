@@ -0,0 +1,127 @@
+"""Load-test process_video_task offline against FakeGeminiBackend.
+
+Generates small synthetic source videos with ffmpeg's lavfi test source,
+replaces only the YouTube side (metadata probe and download) with local
+files, and runs --jobs jobs concurrently against the recorded Gemini
+fixtures in benchmarks/fixtures/gemini. Gemini timings are divided by
+--speedup; ffmpeg cutting runs at real speed. Jobs cycle over --videos
+distinct sources and the whole set runs --waves times, so later waves show
+the upload and analysis caches at work.
+
+    python benchmarks/bench_pipeline.py --jobs 20 --videos 4 --speedup 20
+"""
+import argparse
+import asyncio
+import collections
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def make_source(path: str, duration: int, pattern: str):
+    import ffmpeg
+    video = ffmpeg.input(f'{pattern}=duration={duration}:size=320x240:rate=5', f='lavfi')
+    audio = ffmpeg.input(f'sine=frequency={random.randint(200, 800)}:duration={duration}', f='lavfi')
+    (ffmpeg.output(video, audio, path, vcodec='libx264', preset='ultrafast', g=10, acodec='aac')
+           .overwrite_output()
+           .run(quiet=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--videos', type=int, default=4)
+    parser.add_argument('--waves', type=int, default=2)
+    parser.add_argument('--duration', type=int, default=9 * 60, help='source length in seconds')
+    parser.add_argument('--speedup', type=float, default=20)
+    parser.add_argument('--quota-rpm', type=float, default=15, help='our limiter, in requests per simulated minute')
+    parser.add_argument('--server-rpm', type=float, default=0, help='fake Gemini 429s above this rate (0 = off)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='random 429 probability per call')
+    parser.add_argument('--text', action='store_true', help='use the text response format instead of JSON')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    # Configure before main is imported: its module-level singletons read the environment
+    os.environ.update({
+        'ANALYSIS_BACKEND': 'fake',
+        'FAKE_GEMINI_SPEEDUP': str(args.speedup),
+        'FAKE_GEMINI_RPM': str(args.server_rpm),
+        'FAKE_GEMINI_429_RATE': str(args.rate_limit_rate),
+        'GEMINI_RPM': str(args.quota_rpm * args.speedup),
+        'GEMINI_TPM': str(1_000_000 * args.speedup),
+    })
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    os.chdir(workdir)
+    os.makedirs('clips')
+    sys.path.insert(0, BACKEND_DIR)
+    import main as app
+
+    app.file_waiter.min_delay /= args.speedup
+    app.file_waiter.max_delay /= args.speedup
+
+    print(f"Generating {args.videos} synthetic {args.duration}s sources in {workdir}")
+    patterns = ['testsrc', 'testsrc2', 'smptebars', 'rgbtestsrc']
+    sources = {}
+    for i in range(args.videos):
+        path = os.path.abspath(f'source_{i}.mp4')
+        make_source(path, args.duration, patterns[i % len(patterns)])
+        sources[f'https://www.youtube.com/watch?v=bench{i}'] = {
+            'id': f'bench{i}', 'title': f'Bench video {i}', 'duration': args.duration,
+            'extractor_key': 'Youtube', 'filesize': os.path.getsize(path), 'path': path,
+        }
+
+    # Only the YouTube side is replaced; everything from admission to the highlights reel runs for real
+    app.metadata_cache.probe = lambda url: sources[url]
+    app.source_cache.fetch = lambda url, format_spec='best', info=None: (sources[url]['path'], sources[url])
+    app.source_cache.release = lambda path: None
+    app.fetch_transcript = lambda info: None
+
+    options = {'useTranscript': False, 'structuredOutput': not args.text}
+    urls = list(sources)
+
+    async def run_job(job_id, url):
+        app.active_jobs[job_id] = app.ProcessingJob()
+        started = time.monotonic()
+        await app.process_video_task(job_id, url, options)
+        return app.active_jobs[job_id], time.monotonic() - started
+
+    print(f"{'wave':<6}{'ok':>5}{'failed':>8}{'p50 s':>8}{'p95 s':>8}{'wall s':>8}{'gemini':>8}{'429s':>6}"
+          f"{'reused':>8}{'cached':>8}")
+    for wave in range(1, args.waves + 1):
+        before = app.analysis_backend.get_stats()
+        reused_before = app.remote_files.get_stats()['hits']
+        cached_before = app.analysis_cache.get_stats()['hits']
+
+        async def run_wave():
+            return await asyncio.gather(*(
+                run_job(f'w{wave}-{i}', urls[i % len(urls)]) for i in range(args.jobs)
+            ))
+
+        wave_started = time.monotonic()
+        results = asyncio.run(run_wave())
+        wall = time.monotonic() - wave_started
+
+        after = app.analysis_backend.get_stats()
+        ok = [seconds for job, seconds in results if job.state == 'completed']
+        errors = collections.Counter(job.error for job, _ in results if job.state != 'completed')
+        p95 = sorted(ok)[max(0, int(len(ok) * 0.95) - 1)] if ok else 0
+        print(f"{wave:<6}{len(ok):>5}{sum(errors.values()):>8}{statistics.median(ok) if ok else 0:>8.1f}{p95:>8.1f}"
+              f"{wall:>8.1f}{after['calls'] - before['calls']:>8}{after['rate_limited'] - before['rate_limited']:>6}"
+              f"{app.remote_files.get_stats()['hits'] - reused_before:>8}"
+              f"{app.analysis_cache.get_stats()['hits'] - cached_before:>8}")
+        for error, count in errors.most_common(3):
+            print(f"      {count} x {error}")
+
+    quota = app.gemini_quota.get_stats()
+    print(f"quota: {quota['waited']} waits, {quota['seconds_waited']:.1f}s waiting in total, "
+          f"file waiter polls: {app.file_waiter.get_stats()['polls']}")
+
+
+if __name__ == '__main__':
+    main()
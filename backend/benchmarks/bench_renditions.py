@@ -0,0 +1,94 @@
+"""Benchmark rendering a clip's platform formats one ffmpeg process each against utils.renditions.
+
+Renders --clips clips of --seconds from a generated source of --height
+in every rendition (9:16, 1:1 and 16:9 at each height), two ways: one
+ffmpeg process per rendition, each decoding the clip again, and
+RenditionRenderer, which decodes it once and splits the frames between
+the encoders. Both get the same --threads.
+
+    python benchmarks/bench_renditions.py --clips 3 --seconds 30 --height 1080
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import ffmpeg
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.ffmpeg_async import run_ffmpeg
+from utils.renditions import RENDITION_CRF, RenditionRenderer, rendition_geometry, renditions_for
+
+# Between them these ask for every rendition
+PLATFORMS = ['TikTok', 'Instagram', 'YouTube']
+
+
+def make_source(path, seconds, height):
+    width = height * 16 // 9
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate=30:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '60', '-c:a', 'aac', path,
+    ], check=True)
+
+
+async def per_rendition(source, clips, work_dir, threads):
+    stream = ffmpeg.probe(source, select_streams='v:0')['streams'][0]
+    for number, (start, end) in enumerate(clips):
+        for rendition in renditions_for(PLATFORMS):
+            crop, size = rendition_geometry(rendition, int(stream['width']), int(stream['height']))
+            clip = ffmpeg.input(source, ss=start, t=end - start)
+            video = clip['v:0'].filter('crop', crop[0], crop[1]).filter('scale', size[0], size[1]).filter('setsar', 1)
+            await run_ffmpeg(
+                ffmpeg.output(video, clip['a?'], os.path.join(work_dir, f'clip_{number}_{rendition.name}.mp4'),
+                              vcodec='libx264', preset='veryfast', crf=RENDITION_CRF, pix_fmt='yuv420p',
+                              threads=threads, acodec='copy')
+                      .overwrite_output()
+            )
+
+
+async def one_decode(source, clips, work_dir, threads):
+    renderer = RenditionRenderer(threads=threads)
+    for number, (start, end) in enumerate(clips):
+        if not await renderer.render(source, start, end, os.path.join(work_dir, f'clip_{number}'), PLATFORMS):
+            raise SystemExit('RenditionRenderer failed; see the log')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clips', type=int, default=3)
+    parser.add_argument('--seconds', type=int, default=30)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=2)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_renditions_')
+    try:
+        source = os.path.join(work_dir, 'source.mp4')
+        print(f"Generating a {args.height}p source...")
+        make_source(source, args.clips * args.seconds, args.height)
+        clips = [(number * args.seconds, (number + 1) * args.seconds) for number in range(args.clips)]
+        names = ', '.join(rendition.name for rendition in renditions_for(PLATFORMS))
+        print(f"{args.clips} clips of {args.seconds} s, renditions {names}; {args.threads} threads, "
+              f"best of {args.repeat}")
+        for name, render in [('one process per rendition', per_rendition),
+                             ('RenditionRenderer', one_decode)]:
+            best = None
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                asyncio.run(render(source, clips, work_dir, args.threads))
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:<28}{best:>8.2f} s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
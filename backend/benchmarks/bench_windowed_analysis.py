@@ -0,0 +1,108 @@
+"""Benchmark single-pass against windowed Gemini analysis of a long video, offline.
+
+Each window is uploaded, waited on with FileWaiter against FakeFileService and
+then "analyzed" with a latency proportional to its length. The fake model
+reports every planted moment that falls inside the window, so moments in the
+overlaps are found twice and show how much the merge has to clean up. All
+time constants are divided by --speedup.
+
+    python benchmarks/bench_windowed_analysis.py --minutes 120 --windows 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.fake_file_service import FakeFileService
+from utils.file_waiter import FileWaiter
+from utils.windowed_analysis import DEFAULT_OVERLAP_SECONDS, plan_windows, analyze_windowed
+
+GEMINI_PROCESSING_RATE = 8 * 1024 ** 2
+UPLOAD_RATE = 20 * 1024 ** 2
+# Simulated generate_content latency: fixed overhead plus time per minute of video
+GENERATE_BASE_SECONDS = 10
+GENERATE_SECONDS_PER_MINUTE = 6
+
+
+def window_seconds_for(duration, count, overlap):
+    """Window length that makes plan_windows produce exactly count windows"""
+    if count == 1:
+        return duration
+    return (duration - overlap) / count + overlap
+
+
+def run(duration, bytes_per_second, count, moments, speedup):
+    service = FakeFileService(processing_rate=GEMINI_PROCESSING_RATE * speedup, latency=0.05 / speedup)
+    waiter = FileWaiter(
+        service.get_file,
+        min_delay=1.0 / speedup,
+        max_delay=5.0 / speedup,
+        processing_rate=GEMINI_PROCESSING_RATE * speedup,
+    )
+    overlap = DEFAULT_OVERLAP_SECONDS if count > 1 else 0
+    windows = plan_windows(duration, window_seconds_for(duration, count, overlap), overlap)
+    reported = 0
+
+    async def analyze_window(start, end):
+        nonlocal reported
+        size = int((end - start) * bytes_per_second)
+        await asyncio.sleep(size / UPLOAD_RATE / speedup)
+        remote_file = await waiter.wait_active(service.upload_file(size_bytes=size), size)
+        minutes = (end - start) / 60
+        await asyncio.sleep((GENERATE_BASE_SECONDS + GENERATE_SECONDS_PER_MINUTE * minutes) / speedup)
+        found = [
+            {'start_time': m['start_time'] - start, 'end_time': m['end_time'] - start,
+             'viral_potential': m['viral_potential']}
+            for m in moments if m['start_time'] >= start and m['end_time'] <= end
+        ]
+        reported += len(found)
+        assert remote_file.state.name == "ACTIVE"
+        # Simulated windows start exactly on their start; real ones start on the keyframe before it
+        return start, found
+
+    started = time.monotonic()
+    clips = asyncio.run(analyze_windowed(windows, analyze_window))
+    return {
+        'windows': len(windows),
+        'wall': (time.monotonic() - started) * speedup,
+        'reported': reported,
+        'merged': len(clips),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=float, default=120)
+    parser.add_argument('--mbps', type=float, default=2.5, help='source bitrate in megabits per second')
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--moments', type=int, default=30)
+    parser.add_argument('--speedup', type=float, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    duration = args.minutes * 60
+    # One moment per slot so that any clips merged away are duplicates from overlaps
+    slot = duration / args.moments
+    moments = []
+    for i in range(args.moments):
+        length = random.uniform(30, min(180, slot))
+        start = i * slot + random.uniform(0, slot - length)
+        moments.append({'start_time': start, 'end_time': start + length,
+                        'viral_potential': random.randint(1, 10)})
+
+    print(f"{args.minutes:.0f} min video at {args.mbps} Mbps with {args.moments} planted moments, "
+          f"times in simulated seconds")
+    print(f"{'windows':<10}{'wall':>8}{'speedup':>9}{'reported':>10}{'merged':>8}")
+    baseline = None
+    for count in args.windows:
+        r = run(duration, args.mbps * 1e6 / 8, count, moments, args.speedup)
+        baseline = baseline or r['wall']
+        print(f"{r['windows']:<10}{r['wall']:>8.1f}{baseline / r['wall']:>8.1f}x{r['reported']:>10}{r['merged']:>8}")
+
+
+if __name__ == '__main__':
+    main()
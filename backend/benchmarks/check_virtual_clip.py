@@ -0,0 +1,196 @@
+"""Check that utils.virtual_clip builds MP4s that ffprobe reads and ffmpeg decodes, then check parse_range.
+
+Generates sources the way encoders commonly lay them out (no B-frames,
+B-frames, an audio track that starts after the video, moov at the front)
+and builds clips from each: one starting on a keyframe, one starting
+mid-GOP and one running past the end of the source. Each clip must
+probe with the same streams as its source at the length asked for,
+decode without errors, show the same frames as decoding the source from
+the clip's start, and come out the same when it is read back in ranges.
+Exits non-zero if any check fails.
+
+    python benchmarks/check_virtual_clip.py --seconds 12
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.virtual_clip import Mp4Source, build_virtual_clip, parse_range
+
+FPS = 30
+# Keyframes every 2 s, so clips starting on an odd second start mid-GOP
+GOP_FRAMES = 60
+LATE_AUDIO_SECONDS = 2.5
+# ffprobe durations are rounded to the last audio frame or so
+DURATION_TOLERANCE = 0.1
+# Frames compared against the source at the start of each clip
+COMPARED_FRAMES = 45
+
+SOURCES = {
+    'no_bframes': ['-bf', '0'],
+    'bframes': ['-bf', '3'],
+    'faststart_bframes': ['-bf', '3', '-movflags', '+faststart'],
+    'late_audio': ['-bf', '3'],
+}
+
+# (header, size, expected) where expected is (first, last), None or ValueError
+RANGE_CASES = [
+    (None, 1000, None),
+    ('', 1000, None),
+    ('items=0-1', 1000, None),
+    ('bytes=0-0', 1000, (0, 0)),
+    ('bytes=0-', 1000, (0, 999)),
+    ('bytes=100-199', 1000, (100, 199)),
+    ('bytes= 100-199', 1000, (100, 199)),
+    ('bytes=999-', 1000, (999, 999)),
+    ('bytes=500-5000', 1000, (500, 999)),
+    ('bytes=-10', 1000, (990, 999)),
+    ('bytes=-5000', 1000, (0, 999)),
+    ('bytes=-0', 1000, ValueError),
+    ('bytes=1000-', 1000, ValueError),
+    ('bytes=1000-2000', 1000, ValueError),
+    ('bytes=0-1,5-6', 1000, None),
+    ('bytes=5-2', 1000, None),
+    ('bytes=-', 1000, None),
+    ('bytes=abc-', 1000, None),
+    ('bytes=1-2-3', 1000, None),
+    ('bytes=+1-2', 1000, None),
+]
+
+
+def make_source(path, seconds, encoder_args, audio_offset=0.0):
+    audio_input = ['-itsoffset', str(audio_offset)] if audio_offset else []
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size=640x360:rate={FPS}:duration={seconds}',
+        *audio_input, '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds - audio_offset}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(GOP_FRAMES), '-keyint_min', str(GOP_FRAMES),
+        '-sc_threshold', '0', *encoder_args, '-c:a', 'aac', path,
+    ], check=True)
+
+
+def probe(path):
+    result = subprocess.run(['ffprobe', '-v', 'error', '-show_streams', '-show_format', '-of', 'json', path],
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise ValueError(f"ffprobe failed: {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+
+def frame_hashes(path, start=None):
+    """MD5 of each of the first COMPARED_FRAMES decoded video frames, from start if given"""
+    seek = ['-ss', f'{start:.6f}'] if start is not None else []
+    result = subprocess.run(['ffmpeg', '-v', 'error', *seek, '-i', path, '-map', '0:v:0',
+                             '-frames:v', str(COMPARED_FRAMES), '-f', 'framemd5', '-'],
+                            capture_output=True, text=True, check=True)
+    return [line.rsplit(',', 1)[1].strip() for line in result.stdout.splitlines() if line and not line.startswith('#')]
+
+
+def check_clip(source_path, source, start, end, work_dir, rng):
+    """Problems found with the clip of source_path from start to end; empty if none"""
+    clip = build_virtual_clip(source, start, end)
+    clip_path = os.path.join(work_dir, 'clip.mp4')
+    with open(clip_path, 'wb') as f:
+        for chunk in clip.iter_bytes(0, clip.size - 1):
+            f.write(chunk)
+    if os.path.getsize(clip_path) != clip.size:
+        return [f"wrote {os.path.getsize(clip_path)} bytes of {clip.size}"]
+
+    problems = []
+    try:
+        info = probe(clip_path)
+    except ValueError as e:
+        return [str(e)]
+    source_info = probe(source_path)
+    expected_duration = min(end, float(source_info['format']['duration'])) - start
+    duration = float(info['format']['duration'])
+    if abs(duration - expected_duration) > DURATION_TOLERANCE:
+        problems.append(f"duration {duration:.3f} s, expected {expected_duration:.3f} s")
+    codecs = sorted(stream['codec_type'] for stream in info['streams'])
+    if codecs != sorted(stream['codec_type'] for stream in source_info['streams']):
+        problems.append(f"streams {codecs}")
+
+    # A track that starts late in the source must start as late in the clip
+    video_start = min(float(s['start_time']) for s in source_info['streams'] if s['codec_type'] == 'video')
+    for stream in info['streams']:
+        source_stream = next(s for s in source_info['streams'] if s['codec_type'] == stream['codec_type'])
+        expected_start = max(0.0, float(source_stream['start_time']) - video_start - start)
+        if abs(float(stream['start_time']) - expected_start) > DURATION_TOLERANCE:
+            problems.append(f"{stream['codec_type']} starts at {float(stream['start_time']):.3f} s, "
+                            f"expected {expected_start:.3f} s")
+
+    decode = subprocess.run(['ffmpeg', '-v', 'error', '-xerror', '-i', clip_path, '-f', 'null', '-'],
+                            capture_output=True, text=True)
+    if decode.returncode or decode.stderr.strip():
+        problems.append(f"decode errors: {decode.stderr.strip().splitlines()[-1:] or decode.returncode}")
+
+    if frame_hashes(clip_path) != frame_hashes(source_path, start):
+        problems.append(f"first {COMPARED_FRAMES} frames differ from the source's at {start} s")
+
+    # Read back in random ranges, the way a player seeks through a preview
+    whole = b''.join(clip.iter_bytes(0, clip.size - 1))
+    cuts = sorted(rng.sample(range(1, clip.size), min(20, clip.size - 1)))
+    pieces = b''.join(b''.join(clip.iter_bytes(first, last - 1)) for first, last in zip([0] + cuts, cuts + [clip.size]))
+    if pieces != whole:
+        problems.append("bytes read in ranges differ from the whole clip")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=12, help='length of each generated source')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    logging.disable(logging.CRITICAL)
+
+    failures = 0
+    checks = 0
+    work_dir = tempfile.mkdtemp(prefix='check_virtual_clip_')
+    try:
+        for name, encoder_args in SOURCES.items():
+            source_path = os.path.join(work_dir, f'{name}.mp4')
+            make_source(source_path, args.seconds, encoder_args,
+                        LATE_AUDIO_SECONDS if name == 'late_audio' else 0.0)
+            source = Mp4Source(source_path)
+            clips = [
+                (2.0, 5.0),
+                (3.0 + 10 / FPS, 7.5),
+                (args.seconds - 3.0, args.seconds + 5.0),
+            ]
+            if name == 'late_audio':
+                # Starts before the audio does, then once it is playing
+                clips += [(1.0, 4.0), (LATE_AUDIO_SECONDS + 1.0, LATE_AUDIO_SECONDS + 3.0)]
+            for start, end in clips:
+                checks += 1
+                problems = check_clip(source_path, source, start, end, work_dir, rng)
+                print(f"{name:<20}{start:>7.3f} -{end:>7.3f}  {'OK' if not problems else 'FAIL'}")
+                for problem in problems:
+                    print(f"    {problem}")
+                failures += bool(problems)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for header, size, expected in RANGE_CASES:
+        checks += 1
+        try:
+            result = parse_range(header, size)
+        except ValueError:
+            result = ValueError
+        if result != expected:
+            failures += 1
+            print(f"FAIL parse_range({header!r}, {size}): expected {expected}, got {result}")
+
+    print(f"{checks} checks: {'OK' if not failures else f'{failures} failures'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
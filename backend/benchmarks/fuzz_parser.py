@@ -0,0 +1,120 @@
+"""Check utils.gemini_parser against the response corpus, then fuzz it.
+
+Each fixtures/responses/NAME.txt is a model reply in the text format and
+NAME.json the clips it must parse to. Every case is then mutated --rounds
+times in ways the model varies its output (emphasis, list markers, dash
+style, line endings, streamed chunk boundaries), which must not change the
+clips, and in ways that break it (truncation, injected noise), which must
+not raise. Exits non-zero on the first mismatch.
+
+    python benchmarks/fuzz_parser.py --rounds 500
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.gemini_parser import RANGE_PATTERN, StreamingClipParser, parse_gemini_response
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'responses')
+
+NOISE = ['**', '`', '\n\n', ':', ' - ', '12:', '1:2', '–', 'Description:', '99:99 - 00:00', '\r', '\t', '#']
+
+
+def load_corpus():
+    cases = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.txt'))):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            text = f.read()
+        with open(path[:-4] + '.json', 'r', encoding='utf-8') as f:
+            cases.append((os.path.basename(path), text, json.load(f)))
+    return cases
+
+
+def parse_streamed(text, rng):
+    """Feed text in random-sized chunks, the way a streamed response arrives"""
+    parser = StreamingClipParser()
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 64)
+        parser.feed(text[position:position + size])
+        position += size
+    parser.close()
+    return parser.clips
+
+
+def restyle_line(line, rng):
+    """Markup the model adds around a line without changing what it says"""
+    stripped = line.strip()
+    if not stripped:
+        return line
+    if RANGE_PATTERN.search(stripped) and not stripped.lower().startswith(('description', 'timestamp')):
+        dash = rng.choice(['-', '–', '—', ' - ', ' – '])
+        stripped = RANGE_PATTERN.sub(lambda m: f"{m.group(1)}{dash}{m.group(2)}", stripped)
+        return rng.choice(['{}', '**{}**', '### {}', '{}:', '`{}`'] ).format(stripped)
+    if ':' in stripped and not stripped.startswith(('-', '*')):
+        label, value = stripped.split(':', 1)
+        return rng.choice(['{}:{}', '**{}:**{}', '- {}:{}', '- **{}:**{}', '  {}:{}']).format(label, value)
+    return line
+
+
+def restyle(text, rng):
+    lines = [restyle_line(line, rng) for line in text.replace('\r\n', '\n').split('\n')]
+    return rng.choice(['\n', '\r\n']).join(lines)
+
+
+def break_text(text, rng):
+    """Corrupt the reply; the parser may drop clips but must not raise"""
+    text = list(text[:rng.randint(0, len(text))] if rng.random() < 0.5 else text)
+    for _ in range(rng.randint(1, 20)):
+        text.insert(rng.randint(0, len(text)), rng.choice(NOISE))
+    return ''.join(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=200, help='mutations per corpus case')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    logging.disable(logging.CRITICAL)
+
+    cases = load_corpus()
+    failures = 0
+    for name, text, expected in cases:
+        checks = [('corpus', text), ('streamed', None)]
+        checks += [(f'restyled #{i}', restyle(text, rng)) for i in range(args.rounds)]
+        for label, variant in checks:
+            clips = parse_streamed(text, rng) if variant is None else parse_gemini_response(variant)
+            if clips != expected:
+                failures += 1
+                print(f"FAIL {name} ({label}): expected {len(expected)} clips, got {len(clips)}")
+                if variant is not None:
+                    print('    ' + '\n    '.join(variant.splitlines()[:12]))
+                break
+
+        for i in range(args.rounds):
+            broken = break_text(text, rng)
+            try:
+                batch = parse_gemini_response(broken)
+                streamed = parse_streamed(broken, rng)
+            except Exception as e:
+                failures += 1
+                print(f"FAIL {name} (broken #{i}): {type(e).__name__}: {e}\n{broken!r}")
+                break
+            if batch != streamed:
+                failures += 1
+                print(f"FAIL {name} (broken #{i}): streamed and whole-text parses differ\n{broken!r}")
+                break
+
+    print(f"{len(cases)} corpus cases, {args.rounds} restyled and {args.rounds} broken variants each: "
+          f"{'OK' if not failures else f'{failures} failures'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -30,6 +30,9 @@ CREATE TABLE monthly_usage (
     UNIQUE(user_id, month)
 );
 
+-- Per-job Gemini tokens, upload bytes and estimated cost (video_history itself is managed in Supabase)
+ALTER TABLE IF EXISTS video_history ADD COLUMN IF NOT EXISTS gemini_usage JSONB;
+
 -- Create indexes
 CREATE INDEX idx_clips_user_id ON clips(user_id);
 CREATE INDEX idx_users_email ON users(email);
@@ -0,0 +1,212 @@
+import asyncio
+import collections
+import glob
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Optional
+import google.generativeai as genai
+from google.api_core.exceptions import NotFound, ResourceExhausted
+
+from utils.fake_file_service import FakeFileService
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'fixtures', 'gemini')
+
+USAGE_FIELDS = ('prompt_token_count', 'candidates_token_count', 'cached_content_token_count', 'total_token_count')
+
+
+def request_kind(contents, generation_config=None) -> str:
+    """Which fixture set a request draws from: 'structured', 'repair' or 'text'"""
+    if isinstance(contents, list) and len(contents) > 1 and all(isinstance(turn, dict) for turn in contents):
+        return 'repair'
+    mime_type = getattr(generation_config, 'response_mime_type', None)
+    if isinstance(generation_config, dict):
+        mime_type = generation_config.get('response_mime_type')
+    return 'structured' if mime_type == 'application/json' else 'text'
+
+
+class GeminiBackend:
+    """The real Gemini API, optionally saving every response as a fixture for FakeGeminiBackend"""
+
+    def __init__(self, record_dir: Optional[str] = None):
+        self.record_dir = record_dir
+        self.counter = itertools.count(1)
+
+    def upload_file(self, path: str):
+        return genai.upload_file(path=path)
+
+    def get_file(self, name: str):
+        return genai.get_file(name)
+
+    def delete_file(self, name: str):
+        return genai.delete_file(name)
+
+    def generative_model(self, model_name: str):
+        model = genai.GenerativeModel(model_name)
+        if not self.record_dir:
+            return model
+        return RecordingModel(model, model_name, self)
+
+    def record(self, kind: str, model_name: str, response, latency: float):
+        os.makedirs(self.record_dir, exist_ok=True)
+        fixture = {
+            'kind': kind,
+            'model': model_name,
+            'latency_seconds': round(latency, 3),
+            'text': response.text,
+            'usage_metadata': {field: getattr(response.usage_metadata, field) for field in USAGE_FIELDS},
+        }
+        path = os.path.join(self.record_dir, f"{kind}_{int(time.time())}_{next(self.counter)}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(fixture, f, indent=2)
+        logging.info(f"Recorded Gemini fixture {path}")
+
+
+class RecordingModel:
+    """GenerativeModel wrapper that records non-streamed responses"""
+
+    def __init__(self, model, model_name: str, backend: GeminiBackend):
+        self.model = model
+        self.model_name = model_name
+        self.backend = backend
+
+    async def generate_content_async(self, contents, **kwargs):
+        started = time.monotonic()
+        response = await self.model.generate_content_async(contents, **kwargs)
+        if not kwargs.get('stream'):
+            kind = request_kind(contents, kwargs.get('generation_config'))
+            self.backend.record(kind, self.model_name, response, time.monotonic() - started)
+        return response
+
+
+class FakeGeminiBackend(FakeFileService):
+    """Offline Gemini: simulated uploads and PROCESSING plus recorded responses.
+
+    Responses are replayed round-robin from the fixture files for the
+    request's kind (see request_kind), after the latency recorded with
+    them. With requests_per_minute set, calls over that rate fail with
+    ResourceExhausted like a real 429; rate_limit_rate adds random 429s on
+    top. Every duration is divided by speedup.
+    """
+
+    def __init__(self, fixtures_dir: str = FIXTURES_DIR, speedup: float = 1.0,
+                 upload_rate: float = 20 * 1024 ** 2, processing_rate: float = 8 * 1024 ** 2,
+                 latency: float = 0.05, failure_rate: float = 0.0,
+                 requests_per_minute: Optional[float] = None, rate_limit_rate: float = 0.0):
+        super().__init__(processing_rate=processing_rate * speedup, latency=latency / speedup,
+                         failure_rate=failure_rate, upload_rate=upload_rate * speedup)
+        self.speedup = speedup
+        self.requests_per_minute = requests_per_minute
+        self.rate_limit_rate = rate_limit_rate
+        self.recent_requests = collections.deque()
+        self.generate_stats = {'calls': 0, 'rate_limited': 0}
+        self.fixtures = self._load_fixtures(fixtures_dir)
+        self.fixture_lock = threading.Lock()
+
+    def generative_model(self, model_name: str):
+        return FakeModel(self, model_name)
+
+    def next_fixture(self, kind: str) -> dict:
+        with self.fixture_lock:
+            fixtures = self.fixtures.get(kind) or self.fixtures.get('structured' if kind == 'repair' else kind)
+            if not fixtures:
+                raise ValueError(f"No '{kind}' Gemini fixtures loaded")
+            return next(fixtures)
+
+    def check_rate_limit(self):
+        now = time.monotonic()
+        window = 60 / self.speedup
+        with self.lock:
+            self.generate_stats['calls'] += 1
+            while self.recent_requests and self.recent_requests[0] <= now - window:
+                self.recent_requests.popleft()
+            over_limit = self.requests_per_minute and len(self.recent_requests) >= self.requests_per_minute
+            if over_limit or random.random() < self.rate_limit_rate:
+                self.generate_stats['rate_limited'] += 1
+                raise ResourceExhausted("Resource has been exhausted (e.g. check quota).")
+            self.recent_requests.append(now)
+
+    def check_files(self, contents):
+        """Fail like Gemini does when a request references a file that is gone or not ACTIVE"""
+        parts = []
+        for item in contents if isinstance(contents, list) else [contents]:
+            parts.extend(item.get('parts', []) if isinstance(item, dict) else [item])
+        for part in parts:
+            name = getattr(part, 'name', None)
+            if isinstance(name, str) and name.startswith('files/'):
+                if self.get_file(name).state.name != "ACTIVE":
+                    raise ValueError(f"File {name} is not in an ACTIVE state")
+
+    def get_file(self, name: str):
+        try:
+            return super().get_file(name)
+        except KeyError:
+            raise NotFound(f"File {name} not found")
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {**self.generate_stats, 'get_calls': self.get_calls, 'files': len(self.files)}
+
+    @staticmethod
+    def _load_fixtures(fixtures_dir: str) -> dict:
+        by_kind = {}
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, '*.json'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                fixture = json.load(f)
+            by_kind.setdefault(fixture['kind'], []).append(fixture)
+        logging.info(f"Loaded Gemini fixtures from {fixtures_dir}: "
+                     f"{ {kind: len(fixtures) for kind, fixtures in by_kind.items()} }")
+        return {kind: itertools.cycle(fixtures) for kind, fixtures in by_kind.items()}
+
+
+class FakeModel:
+    """generate_content_async over FakeGeminiBackend fixtures"""
+
+    def __init__(self, backend: FakeGeminiBackend, model_name: str):
+        self.backend = backend
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        self.backend.check_rate_limit()
+        await asyncio.to_thread(self.backend.check_files, contents)
+        fixture = self.backend.next_fixture(request_kind(contents, generation_config))
+        usage_metadata = SimpleNamespace(**fixture['usage_metadata'])
+        if stream:
+            return FakeStreamResponse(fixture['text'], usage_metadata, fixture['latency_seconds'] / self.backend.speedup)
+        await asyncio.sleep(fixture['latency_seconds'] / self.backend.speedup)
+        return SimpleNamespace(text=fixture['text'], usage_metadata=usage_metadata)
+
+
+class FakeStreamResponse:
+    """Async iterator of text chunks spread over the recorded latency"""
+
+    def __init__(self, text: str, usage_metadata, latency: float, chunks: int = 8):
+        self.text = text
+        self.usage_metadata = usage_metadata
+        self.latency = latency
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        size = max(1, -(-len(self.text) // self.chunks))
+        for start in range(0, len(self.text), size):
+            await asyncio.sleep(self.latency / self.chunks)
+            yield SimpleNamespace(text=self.text[start:start + size])
+
+
+def create_analysis_backend(name: str):
+    """Backend selected by ANALYSIS_BACKEND: 'gemini' (default) or 'fake' for offline runs"""
+    if name == 'fake':
+        return FakeGeminiBackend(
+            fixtures_dir=os.getenv("FAKE_GEMINI_FIXTURES", FIXTURES_DIR),
+            speedup=float(os.getenv("FAKE_GEMINI_SPEEDUP", "1")),
+            requests_per_minute=float(os.getenv("FAKE_GEMINI_RPM", "0")) or None,
+            rate_limit_rate=float(os.getenv("FAKE_GEMINI_429_RATE", "0")),
+        )
+    if name != 'gemini':
+        raise ValueError(f"Unknown analysis backend: {name}")
+    return GeminiBackend(record_dir=os.getenv("GEMINI_RECORD_FIXTURES"))
@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+class AnalysisCache:
+    """SQLite cache of Gemini analyses keyed by content, prompt version and model.
+
+    Stores the raw response text alongside the parsed clips so a hit can go
+    straight to clip cutting. Least-recently-used rows are evicted once the
+    stored text goes over max_bytes.
+    """
+
+    def __init__(self, db_path: str = 'downloads/analysis_cache.db', max_bytes: int = 256 * 1024 ** 2):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    content_key TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    response_text TEXT NOT NULL,
+                    clips TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (content_key, prompt_version, model)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_last_used ON analyses(last_used)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, content_key: str, prompt_version: str, model: str) -> Optional[tuple]:
+        """Return (response_text, clips) for a previous analysis, or None"""
+        with self.lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT response_text, clips FROM analyses WHERE content_key = ? AND prompt_version = ? AND model = ?",
+                (content_key, prompt_version, model)
+            ).fetchone()
+            if not row:
+                self.stats['misses'] += 1
+                return None
+            conn.execute(
+                "UPDATE analyses SET last_used = ? WHERE content_key = ? AND prompt_version = ? AND model = ?",
+                (time.time(), content_key, prompt_version, model)
+            )
+            self.stats['hits'] += 1
+        logging.info(f"Analysis cache hit for {content_key[:16]} ({prompt_version}, {model})")
+        return row[0], json.loads(row[1])
+
+    def put(self, content_key: str, prompt_version: str, model: str, response_text: str, clips: list):
+        """Store an analysis and evict old ones if the cache is over budget"""
+        clips_json = json.dumps(clips)
+        size = len(response_text.encode('utf-8')) + len(clips_json.encode('utf-8'))
+        now = time.time()
+        with self.lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_key, prompt_version, model, response_text, clips_json, size, now, now)
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM analyses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for row_key, row_version, row_model, row_size in conn.execute(
+                "SELECT content_key, prompt_version, model, size FROM analyses ORDER BY last_used"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute(
+                    "DELETE FROM analyses WHERE content_key = ? AND prompt_version = ? AND model = ?",
+                    (row_key, row_version, row_model)
+                )
+                total -= row_size
+                self.stats['evictions'] += 1
+
+    def get_stats(self) -> dict:
+        with self.lock, self._connect() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analyses").fetchone()
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                'entries': entries,
+                'total_bytes': total,
+                'max_bytes': self.max_bytes,
+            }
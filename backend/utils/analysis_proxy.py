@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import ffmpeg
+
+from utils.ffmpeg_async import run_ffmpeg
+
+# Gemini samples video at about 1 frame per second, so anything denser is wasted upload
+VIDEO_PROXY_FPS = 1
+VIDEO_PROXY_HEIGHT = 360
+
+PROXY_MODES = ('video', 'audio')
+
+
+async def create_analysis_proxy(video_path: str, mode: str, output_dir: str, threads: int = 0) -> str:
+    """Transcode video_path into a small file for Gemini analysis.
+
+    'video' keeps a low-fps, low-resolution picture with mono audio; 'audio'
+    keeps only a speech-quality audio track. Timestamps match the source.
+    threads caps the video encoder's threads (0 lets ffmpeg choose).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(video_path))[0]
+
+    if mode == 'video':
+        output_path = os.path.join(output_dir, f"{name}_analysis.mp4")
+        await run_ffmpeg(
+            ffmpeg.input(video_path)
+                  .output(output_path,
+                          vf=f'fps={VIDEO_PROXY_FPS},scale=-2:{VIDEO_PROXY_HEIGHT}',
+                          vcodec='libx264',
+                          preset='veryfast',
+                          crf=32,
+                          threads=threads,
+                          acodec='aac',
+                          audio_bitrate='32k',
+                          ac=1)
+                  .overwrite_output()
+        )
+    elif mode == 'audio':
+        output_path = os.path.join(output_dir, f"{name}_analysis.m4a")
+        await run_ffmpeg(
+            ffmpeg.input(video_path)
+                  .output(output_path,
+                          vn=None,
+                          acodec='aac',
+                          audio_bitrate='48k',
+                          ac=1,
+                          ar=16000)
+                  .overwrite_output()
+        )
+    else:
+        raise ValueError(f"Unknown analysis proxy mode: {mode}")
+
+    logging.info(f"Created {mode} analysis proxy: {output_path} "
+                 f"({os.path.getsize(output_path)} bytes, source {os.path.getsize(video_path)} bytes)")
+    return output_path
+
+
+class UploadStats:
+    """Upload bytes and time-to-ACTIVE per analysis proxy mode"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.modes = {}
+
+    def record(self, mode: str, upload_bytes: int, seconds_to_active: float):
+        with self.lock:
+            stats = self.modes.setdefault(mode, {'uploads': 0, 'upload_bytes': 0, 'seconds_to_active': 0.0})
+            stats['uploads'] += 1
+            stats['upload_bytes'] += upload_bytes
+            stats['seconds_to_active'] += seconds_to_active
+        logging.info(f"Uploaded {upload_bytes} bytes ({mode}), ACTIVE after {seconds_to_active:.1f}s")
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                mode: {
+                    **stats,
+                    'avg_upload_bytes': stats['upload_bytes'] / stats['uploads'],
+                    'avg_seconds_to_active': stats['seconds_to_active'] / stats['uploads'],
+                }
+                for mode, stats in self.modes.items()
+            }
@@ -0,0 +1,199 @@
+import csv
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import ffmpeg
+
+from utils.ffmpeg_async import run_ffmpeg
+from utils.keyframe_index import KeyframeIndex
+
+# Clips closer than this are read as one stretch of the source rather than seeked to separately
+MAX_GROUP_GAP_SECONDS = 30
+
+# How much of the source is scanned to estimate its keyframe interval
+KEYFRAME_PROBE_SECONDS = 30
+# Longest keyframe interval allowed for; stream-copied clips can only start on a keyframe
+MAX_KEYFRAME_INTERVAL = 10
+
+PTS_TIME_PATTERN = re.compile(r'pts_time:\s*(-?[\d.]+)')
+
+
+def plan_groups(clips: list, max_gap: float = MAX_GROUP_GAP_SECONDS, keyframes: KeyframeIndex = None) -> list:
+    """Indexes of clips grouped into stretches of the source that are read in one pass.
+
+    Clips are taken in start order; one joins the previous group when it
+    starts at most max_gap after that group ends. A clip overlapping the
+    group cannot be split out of the same stream and starts a new one; with
+    keyframes, neither can one whose keyframe comes before the previous
+    clip's segment ends.
+    """
+    groups = []
+    group_end = None
+    for index in sorted(range(len(clips)), key=lambda i: clips[i]['start_time']):
+        clip = clips[index]
+        start = keyframes.before(clip['start_time']) if keyframes else clip['start_time']
+        if groups and group_end <= start and clip['start_time'] <= group_end + max_gap:
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+        group_end = keyframes.after(clip['end_time']) if keyframes else clip['end_time']
+    return groups
+
+
+def group_origin(clips: list, group: list, keyframes: KeyframeIndex = None) -> float:
+    """Where the group's input is seeked to: its first keyframe when known, so nothing is pre-rolled"""
+    start = clips[group[0]]['start_time']
+    return keyframes.before(start) if keyframes else start
+
+
+def split_on(keyframes: KeyframeIndex, keyframe: float, origin: float) -> float:
+    """A split time the muxer resolves to keyframe.
+
+    Output timestamps can be shifted by a few milliseconds (audio priming,
+    timebase rounding), so the time is put halfway back to the keyframe
+    before rather than on the keyframe itself.
+    """
+    previous = keyframes.before(keyframe - 0.001)
+    return (previous + keyframe) / 2 - origin
+
+
+def split_times(clips: list, group: list, lead: float, keyframes: KeyframeIndex = None) -> list:
+    """Segment muxer split points for one group, relative to group_origin.
+
+    The muxer splits at the first keyframe at or after each time. Every clip
+    ends with a split. A later clip gets a split on the keyframe at or
+    before its start when keyframes are known, or else lead seconds before
+    its start, so it begins where a seeked cut would.
+    """
+    origin = group_origin(clips, group, keyframes)
+    times = []
+    for position, index in enumerate(group):
+        clip = clips[index]
+        if position:
+            previous_end = clips[group[position - 1]]['end_time']
+            if keyframes:
+                start = keyframes.before(clip['start_time'])
+                # Unless the previous clip's end split already lands on that keyframe
+                if start > keyframes.after(previous_end):
+                    times.append(split_on(keyframes, start, origin))
+            # The previous clip's end split already lands close enough to this start
+            elif clip['start_time'] - lead > previous_end:
+                times.append(clip['start_time'] - lead - origin)
+        if keyframes:
+            times.append(split_on(keyframes, keyframes.after(clip['end_time']), origin))
+        else:
+            times.append(clip['end_time'] - origin)
+    return [round(t, 3) for t in times[:-1]]
+
+
+async def keyframe_interval(video_path: str) -> float:
+    """Longest gap between keyframes at the start of video_path, in seconds (0 if unknown)"""
+    try:
+        _, stderr = await run_ffmpeg(
+            ffmpeg.input(video_path, t=KEYFRAME_PROBE_SECONDS, skip_frame='nokey')
+                  .output('-', map='0:v:0', vf='showinfo', f='null')
+        )
+    except ffmpeg.Error as e:
+        logging.warning(f"Could not read keyframes of {video_path}: {e}")
+        return 0
+    times = sorted(float(t) for t in PTS_TIME_PATTERN.findall(stderr.decode('utf-8', 'replace')))
+    if len(times) < 2:
+        return MAX_KEYFRAME_INTERVAL if times else 0
+    return min(MAX_KEYFRAME_INTERVAL, max(b - a for a, b in zip(times, times[1:])))
+
+
+def read_segment_list(path: str) -> list:
+    """(filename, start, end) rows of a segment muxer csv list"""
+    with open(path, 'r', newline='') as f:
+        return [(row[0], float(row[1]), float(row[2])) for row in csv.reader(f) if len(row) >= 3]
+
+
+async def extract_clips(video_path: str, clips: list, output_paths: list,
+                        max_gap: float = MAX_GROUP_GAP_SECONDS, keyframes: KeyframeIndex = None) -> list:
+    """Stream-copy every clip of video_path with a single ffmpeg process.
+
+    Each group of nearby clips is one input seeked to its first clip and
+    cut by the segment muxer; the unwanted stretches between clips are
+    discarded. Splits land on keyframes from keyframes when given, or on
+    ones estimated from the start of the source. Returns the path written
+    for each clip, in the order of clips, with None for any clip the batch
+    could not produce so the caller can cut it on its own. Never raises.
+    """
+    results = [None] * len(clips)
+    if not clips:
+        return results
+    work_dir = tempfile.mkdtemp(prefix='.extract_', dir=os.path.dirname(output_paths[0]) or '.')
+    try:
+        lead = 0 if keyframes else await keyframe_interval(video_path)
+        groups = plan_groups(clips, max_gap, keyframes)
+        outputs = []
+        for number, group in enumerate(groups):
+            start = group_origin(clips, group, keyframes)
+            end = max(clips[index]['end_time'] for index in group)
+            segment_options = {'segment_list': os.path.join(work_dir, f'group_{number}.csv'),
+                               'segment_list_type': 'csv', 'reset_timestamps': 1}
+            times = split_times(clips, group, lead, keyframes)
+            if times:
+                segment_options['segment_times'] = ','.join(str(t) for t in times)
+            else:
+                # A lone clip is a single segment
+                segment_options['segment_time'] = end - start + MAX_KEYFRAME_INTERVAL
+            source = ffmpeg.input(video_path, ss=start, t=end - start)
+            outputs.append(
+                ffmpeg.output(source['v?'], source['a?'], os.path.join(work_dir, f'group_{number}_%03d.mp4'),
+                              f='segment', c='copy', **segment_options)
+            )
+        await run_ffmpeg(ffmpeg.merge_outputs(*outputs).overwrite_output())
+
+        for number, group in enumerate(groups):
+            origin = group_origin(clips, group, keyframes)
+            segments = read_segment_list(os.path.join(work_dir, f'group_{number}.csv'))
+            for index in group:
+                clip = clips[index]
+                # Segment bounds drift from the requested times by up to a keyframe interval
+                middle = (clip['start_time'] + clip['end_time']) / 2 - origin
+                for filename, segment_start, segment_end in segments:
+                    if segment_start <= middle < segment_end:
+                        os.replace(os.path.join(work_dir, filename), output_paths[index])
+                        results[index] = output_paths[index]
+                        break
+    except (ffmpeg.Error, OSError, ValueError) as e:
+        logging.error(f"Batch clip extraction failed: {e}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    logging.info(f"Extracted {sum(1 for path in results if path)}/{len(clips)} clips in one ffmpeg pass")
+    return results
+
+
+class ExtractionStats:
+    """Clips cut by batch extraction and how many fell back to a cut of their own"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.clips = 0
+        self.extracted = 0
+        self.seconds = 0.0
+
+    def record(self, clips: int, extracted: int, seconds: float):
+        with self.lock:
+            self.batches += 1
+            self.clips += clips
+            self.extracted += extracted
+            self.seconds += seconds
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'batches': self.batches,
+                'clips': self.clips,
+                'extracted': self.extracted,
+                'fallbacks': self.clips - self.extracted,
+                'seconds': round(self.seconds, 2),
+            }
+
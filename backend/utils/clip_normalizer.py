@@ -0,0 +1,208 @@
+import bisect
+import logging
+import threading
+from typing import Optional
+
+# The prompt asks for clips between 1 and 5 minutes
+MIN_CLIP_SECONDS = 60
+MAX_CLIP_SECONDS = 5 * 60
+
+# MM:SS only resolves to the second, so a whole-second end means "until the end of that second"
+END_PAD_SECONDS = 1
+
+# Ranges whose starts and ends are this close are the same moment reported twice
+DUPLICATE_TOLERANCE_SECONDS = 1
+
+# Overlapping more than this share of the shorter clip makes two clips one moment
+MERGE_OVERLAP_RATIO = 0.5
+
+
+def seconds(value: float):
+    value = round(value, 3)
+    return int(value) if value == int(value) else value
+
+
+def clip_length(clip: dict) -> float:
+    return clip['end_time'] - clip['start_time']
+
+
+def overlap_ratio(a: dict, b: dict) -> float:
+    overlap = min(a['end_time'], b['end_time']) - max(a['start_time'], b['start_time'])
+    return max(0.0, overlap) / min(clip_length(a), clip_length(b))
+
+
+class ClipSet:
+    """Non-overlapping clips on one video's timeline, kept sorted by start.
+
+    add() fits each suggestion in: the end is adjusted, the length brought
+    within [min_seconds, max_seconds] and everything clamped to the video's
+    duration. A suggestion that duplicates or sits inside a kept clip is
+    absorbed into it. One that mostly overlaps a kept clip is merged with
+    the clips it overlaps when the union still fits max_seconds; otherwise
+    it is trimmed to the largest uncovered gap, merged after all if that gap
+    is shorter than min_seconds but the union fits, or dropped. With
+    merge=False kept clips are never changed, for clips that are already
+    being cut.
+    """
+
+    def __init__(self, duration: Optional[float] = None, min_seconds: float = MIN_CLIP_SECONDS,
+                 max_seconds: float = MAX_CLIP_SECONDS):
+        self.duration = duration or None
+        self.min_seconds = min(min_seconds, self.duration) if self.duration else min_seconds
+        self.max_seconds = max_seconds
+        self.starts = []
+        self.clips = []
+        self.stats = {
+            'suggested': 0, 'suggested_seconds': 0.0,
+            'duplicates': 0, 'nested': 0, 'merged': 0, 'trimmed': 0, 'dropped': 0,
+            'extended': 0, 'shortened': 0, 'clamped': 0,
+        }
+
+    def normalize(self, clips: list) -> list:
+        """Add every clip, best first so they claim their range; returns the kept clips by start time"""
+        for clip in sorted(clips, key=lambda clip: clip.get('viral_potential', 0), reverse=True):
+            self.add(clip)
+        logging.info(f"Normalized {len(clips)} suggested clips into {len(self.clips)}")
+        return self.sorted_clips()
+
+    def sorted_clips(self) -> list:
+        return [dict(clip) for clip in self.clips]
+
+    def get_stats(self) -> dict:
+        return {**self.stats, 'kept': len(self.clips), 'kept_seconds': sum(clip_length(clip) for clip in self.clips)}
+
+    def add(self, clip: dict, merge: bool = True) -> Optional[dict]:
+        """Fit one clip in; returns the clip as kept, or None if it was absorbed or dropped"""
+        self.stats['suggested'] += 1
+        clip = self._bounded(dict(clip))
+        if clip is None:
+            self.stats['dropped'] += 1
+            return None
+        self.stats['suggested_seconds'] += clip_length(clip)
+
+        overlapping = self._overlapping(clip['start_time'], clip['end_time'])
+        if not overlapping:
+            return self._insert(clip)
+
+        for index in overlapping:
+            kept = self.clips[index]
+            if (abs(kept['start_time'] - clip['start_time']) <= DUPLICATE_TOLERANCE_SECONDS
+                    and abs(kept['end_time'] - clip['end_time']) <= DUPLICATE_TOLERANCE_SECONDS):
+                self.stats['duplicates'] += 1
+                self._absorb(kept, clip)
+                return None
+            if kept['start_time'] <= clip['start_time'] and clip['end_time'] <= kept['end_time']:
+                self.stats['nested'] += 1
+                self._absorb(kept, clip)
+                return None
+
+        start = min(clip['start_time'], self.clips[overlapping[0]]['start_time'])
+        end = max(clip['end_time'], self.clips[overlapping[-1]]['end_time'])
+        can_merge = merge and end - start <= self.max_seconds
+        if can_merge and any(overlap_ratio(clip, self.clips[index]) > MERGE_OVERLAP_RATIO for index in overlapping):
+            return self._merge(clip, overlapping, start, end)
+
+        gap_start, gap_end = self._largest_gap(clip, overlapping)
+        if gap_end - gap_start >= self.min_seconds:
+            self.stats['trimmed'] += 1
+            clip['start_time'], clip['end_time'] = seconds(gap_start), seconds(gap_end)
+            return self._insert(clip)
+        if can_merge:
+            return self._merge(clip, overlapping, start, end)
+        self.stats['dropped'] += 1
+        return None
+
+    def _bounded(self, clip: dict) -> Optional[dict]:
+        start = max(0.0, float(clip['start_time']))
+        end = float(clip['end_time'])
+        if end == int(end):
+            end += END_PAD_SECONDS
+        if self.duration:
+            if start >= self.duration:
+                return None
+            if end > self.duration:
+                self.stats['clamped'] += 1
+                end = self.duration
+        if end <= start:
+            return None
+
+        if end - start > self.max_seconds:
+            self.stats['shortened'] += 1
+            end = start + self.max_seconds
+        elif end - start < self.min_seconds:
+            # Grow around the middle of the moment, shifted back inside the video if needed
+            self.stats['extended'] += 1
+            middle = (start + end) / 2
+            start = max(0.0, middle - self.min_seconds / 2)
+            end = start + self.min_seconds
+            if self.duration and end > self.duration:
+                end = self.duration
+                start = max(0.0, end - self.min_seconds)
+
+        clip['start_time'], clip['end_time'] = seconds(start), seconds(end)
+        return clip
+
+    def _overlapping(self, start: float, end: float) -> list:
+        """Indexes of kept clips overlapping [start, end); kept clips never overlap each other"""
+        index = max(0, bisect.bisect_right(self.starts, start) - 1)
+        indexes = []
+        while index < len(self.clips) and self.clips[index]['start_time'] < end:
+            if self.clips[index]['end_time'] > start:
+                indexes.append(index)
+            index += 1
+        return indexes
+
+    def _insert(self, clip: dict) -> dict:
+        index = bisect.bisect_left(self.starts, clip['start_time'])
+        self.starts.insert(index, clip['start_time'])
+        self.clips.insert(index, clip)
+        return clip
+
+    def _absorb(self, kept: dict, clip: dict):
+        """Fold what a redundant clip adds into the kept one"""
+        if clip.get('viral_potential', 0) > kept.get('viral_potential', 0):
+            kept['viral_potential'] = clip['viral_potential']
+            kept['description'] = clip.get('description', kept.get('description', ''))
+        kept['platforms'] = list(dict.fromkeys(kept.get('platforms', []) + clip.get('platforms', [])))
+
+    def _merge(self, clip: dict, overlapping: list, start: float, end: float) -> dict:
+        self.stats['merged'] += len(overlapping)
+        merged = [self.clips[index] for index in overlapping]
+        for index in reversed(overlapping):
+            del self.clips[index]
+            del self.starts[index]
+        # The highest-rated part describes the whole
+        best = max(merged + [clip], key=lambda part: part.get('viral_potential', 0))
+        union = {**best, 'start_time': seconds(start), 'end_time': seconds(end)}
+        for part in merged + [clip]:
+            self._absorb(union, part)
+        return self._insert(union)
+
+    def _largest_gap(self, clip: dict, overlapping: list) -> tuple:
+        """Longest stretch of the clip not covered by the kept clips it overlaps"""
+        gaps = []
+        cursor = clip['start_time']
+        for index in overlapping:
+            kept = self.clips[index]
+            gaps.append((cursor, min(kept['start_time'], clip['end_time'])))
+            cursor = max(cursor, kept['end_time'])
+        gaps.append((cursor, clip['end_time']))
+        return max(gaps, key=lambda gap: gap[1] - gap[0])
+
+
+class ClipStats:
+    """Running totals of ClipSet.stats across jobs"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def record(self, stats: dict):
+        with self.lock:
+            self.totals['jobs'] = self.totals.get('jobs', 0) + 1
+            for key, value in stats.items():
+                self.totals[key] = self.totals.get(key, 0) + value
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return dict(self.totals)
@@ -0,0 +1,70 @@
+import itertools
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeFileService:
+    """In-process stand-in for the Gemini Files API, for benchmarking without a network.
+
+    Uploaded files stay PROCESSING for size / processing_rate seconds (with
+    some jitter) and then turn ACTIVE, or FAILED with probability failure_rate.
+    Every get_file call costs latency seconds, like a real round trip, and
+    with upload_rate set an upload blocks for size / upload_rate seconds.
+    """
+
+    def __init__(self, processing_rate: float = 8 * 1024 ** 2, latency: float = 0.05,
+                 failure_rate: float = 0.0, jitter: float = 0.2, upload_rate: float = None):
+        self.processing_rate = processing_rate
+        self.upload_rate = upload_rate
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+        self.files = {}
+        self.get_calls = 0
+
+    def upload_file(self, path: str = None, size_bytes: int = None):
+        """Register an upload; pass size_bytes to simulate a file that does not exist locally"""
+        size = size_bytes if size_bytes is not None else os.path.getsize(path)
+        if self.upload_rate:
+            time.sleep(size / self.upload_rate)
+        processing = size / self.processing_rate * random.uniform(1 - self.jitter, 1 + self.jitter)
+        name = f"files/fake-{next(self.counter)}"
+        with self.lock:
+            self.files[name] = {
+                'size_bytes': size,
+                'ready_at': time.monotonic() + processing,
+                'final_state': 'FAILED' if random.random() < self.failure_rate else 'ACTIVE',
+            }
+        return self._snapshot(name)
+
+    def get_file(self, name: str):
+        time.sleep(self.latency)
+        with self.lock:
+            self.get_calls += 1
+            if name not in self.files:
+                raise KeyError(f"File not found: {name}")
+        return self._snapshot(name)
+
+    def delete_file(self, name: str):
+        with self.lock:
+            self.files.pop(name, None)
+
+    def ready_at(self, name: str) -> float:
+        """time.monotonic() at which the file leaves PROCESSING"""
+        with self.lock:
+            return self.files[name]['ready_at']
+
+    def _snapshot(self, name: str):
+        with self.lock:
+            entry = self.files[name]
+            state = 'PROCESSING' if time.monotonic() < entry['ready_at'] else entry['final_state']
+            return SimpleNamespace(
+                name=name,
+                size_bytes=entry['size_bytes'],
+                state=SimpleNamespace(name=state),
+            )
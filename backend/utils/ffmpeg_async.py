@@ -0,0 +1,26 @@
+import asyncio
+import ffmpeg
+
+
+async def run_ffmpeg(stream) -> tuple:
+    """Run a compiled ffmpeg-python stream as an asyncio subprocess.
+
+    Behaves like stream.run(capture_stdout=True, capture_stderr=True) but
+    does not block the event loop; raises ffmpeg.Error on a non-zero exit.
+    Cancelling the awaiting task kills the ffmpeg process.
+    """
+    args = stream.compile()
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise ffmpeg.Error(args[0], stdout, stderr)
+    return stdout, stderr
@@ -0,0 +1,133 @@
+import asyncio
+import collections
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+# A stream copy mostly waits on the disk; two fit in one core
+COPY_WEIGHT = 0.5
+# libx264 gains little past a few threads per encode, so several narrower encodes use cores better
+MAX_ENCODE_THREADS = 4
+
+
+class FfmpegPool:
+    """Process-wide limit on the ffmpeg work running at once, measured in cores.
+
+    Every ffmpeg run holds a weight while it runs: COPY_WEIGHT for a stream
+    copy, and encode_threads for an encode told to use that many threads.
+    All jobs share one pool, so the limit covers the load of every job, not
+    just one. Waiters are served first come first served; a heavy encode at
+    the head of the queue is not overtaken by lighter copies behind it.
+    """
+
+    def __init__(self, cores: Optional[int] = None):
+        self.capacity = float(cores or os.cpu_count() or 1)
+        self.encode_threads = max(1, min(MAX_ENCODE_THREADS, int(self.capacity)))
+        self.running = 0.0
+        self.waiters = collections.deque()
+        self.stats = {'runs': 0, 'waited': 0, 'seconds_waited': 0.0, 'peak_running': 0.0}
+
+    @asynccontextmanager
+    async def slot(self, weight: float = COPY_WEIGHT):
+        """Hold weight cores of the pool for the duration of one ffmpeg run"""
+        # A run wider than the pool would wait forever; it gets the whole pool instead
+        weight = min(weight, self.capacity)
+        started = time.monotonic()
+        if self.waiters or self.running + weight > self.capacity:
+            granted = asyncio.get_running_loop().create_future()
+            entry = (weight, granted)
+            self.waiters.append(entry)
+            self.stats['waited'] += 1
+            try:
+                await granted
+            except asyncio.CancelledError:
+                if entry in self.waiters:
+                    self.waiters.remove(entry)
+                    self._dispatch()
+                elif granted.done() and not granted.cancelled():
+                    # Granted between the cancel and this handler; hand the weight back
+                    self._release(weight)
+                raise
+        else:
+            self._take(weight)
+        self.stats['seconds_waited'] += time.monotonic() - started
+        try:
+            yield
+        finally:
+            self._release(weight)
+
+    def _take(self, weight: float):
+        self.running += weight
+        self.stats['runs'] += 1
+        self.stats['peak_running'] = max(self.stats['peak_running'], self.running)
+
+    def _release(self, weight: float):
+        self.running -= weight
+        self._dispatch()
+
+    def _dispatch(self):
+        """Start waiters from the head of the queue while they fit"""
+        while self.waiters:
+            weight, granted = self.waiters[0]
+            if granted.done():
+                # Its task was cancelled and has not cleaned up yet
+                self.waiters.popleft()
+                continue
+            if self.running + weight > self.capacity:
+                break
+            self.waiters.popleft()
+            self._take(weight)
+            granted.set_result(True)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            'seconds_waited': round(self.stats['seconds_waited'], 2),
+            'capacity': self.capacity,
+            'encode_threads': self.encode_threads,
+            'running': self.running,
+            'queued': len(self.waiters),
+        }
+
+
+class OrderedTasks:
+    """One job's concurrent work; results come back in the order it was started.
+
+    on_progress(done, started) is called each time a task finishes, so a
+    job's status reflects what has actually completed rather than which
+    task happened to start last.
+    """
+
+    def __init__(self, on_progress: Optional[Callable[[int, int], None]] = None):
+        self.tasks = []
+        self.done = 0
+        self.on_progress = on_progress
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def start(self, coro):
+        task = asyncio.create_task(coro)
+        task.add_done_callback(self._finished)
+        self.tasks.append(task)
+
+    def _finished(self, task: asyncio.Task):
+        self.done += 1
+        if self.on_progress:
+            try:
+                self.on_progress(self.done, len(self.tasks))
+            except Exception as e:
+                logging.error(f"Progress callback failed: {e}")
+
+    async def results(self) -> list:
+        return await asyncio.gather(*self.tasks)
+
+    async def cancel(self):
+        """Cancel the tasks still running and wait until they have stopped"""
+        # Cancelled tasks are not progress; the job's message is about to say why they stopped
+        self.on_progress = None
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
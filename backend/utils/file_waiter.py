@@ -0,0 +1,67 @@
+import asyncio
+import random
+from typing import Callable
+
+
+class FileWaiter:
+    """Waits for uploaded Gemini files to leave PROCESSING.
+
+    Waits run on the caller's event loop, so any number of jobs waiting on
+    Gemini costs no threads beyond the polls themselves. The first poll is
+    scheduled from the file size and a running estimate of Gemini's
+    processing rate, later polls back off exponentially with jitter, and
+    each wait has a deadline. A wait is cancelled by cancelling the task
+    running it. All state lives on the event loop that calls it.
+    """
+
+    def __init__(self, get_file: Callable, min_delay: float = 1.0, max_delay: float = 5.0,
+                 processing_rate: float = 8 * 1024 ** 2, deadline: float = 15 * 60):
+        self.get_file = get_file
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        # Rough bytes per second Gemini gets through while PROCESSING
+        self.processing_rate = processing_rate
+        self.deadline = deadline
+        self.in_flight = 0
+        self.stats = {'waits': 0, 'polls': 0, 'timeouts': 0, 'cancelled': 0}
+
+    def first_delay(self, size_bytes: int) -> float:
+        """Delay before the first poll: a bit less than the expected processing time"""
+        return max(self.min_delay, 0.8 * size_bytes / self.processing_rate)
+
+    async def wait_active(self, remote_file, size_bytes: int = 0, deadline: float = None):
+        """Poll until remote_file is no longer PROCESSING and return its latest state"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        give_up_at = started + (deadline or self.deadline)
+        delay = self.first_delay(size_bytes)
+        backoff = self.min_delay
+        polls = 0
+        self.stats['waits'] += 1
+        self.in_flight += 1
+        try:
+            while remote_file.state.name == "PROCESSING":
+                remaining = give_up_at - loop.time()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise TimeoutError(f"Gemini file {remote_file.name} still PROCESSING after deadline")
+                await asyncio.sleep(min(delay, remaining))
+                remote_file = await loop.run_in_executor(None, self.get_file, remote_file.name)
+                polls += 1
+                self.stats['polls'] += 1
+                backoff = min(self.max_delay, backoff * 2)
+                delay = random.uniform(backoff / 2, backoff)
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        if size_bytes and polls:
+            # Track how fast Gemini is actually processing so the next first poll lands closer
+            observed_rate = size_bytes / max(loop.time() - started, self.min_delay)
+            self.processing_rate = 0.8 * self.processing_rate + 0.2 * observed_rate
+        return remote_file
+
+    def get_stats(self) -> dict:
+        return {**self.stats, 'in_flight': self.in_flight}
@@ -0,0 +1,321 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+import google.generativeai as genai
+
+# Gemini deletes uploaded files 48 hours after upload
+GEMINI_FILE_TTL = 48 * 60 * 60
+
+_digest_lock = threading.Lock()
+_digests = {}
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, memoized per (path, size, mtime)"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _digest_lock:
+        if memo_key in _digests:
+            return _digests[memo_key]
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digest_lock:
+        _digests[memo_key] = digest
+    return digest
+
+
+class RemoteFileCache:
+    """Persistent map from content key to an uploaded Gemini file.
+
+    Entries are dropped margin seconds before Gemini's own expiry so a job
+    never starts analysis on a file that is about to disappear.
+    """
+
+    def __init__(self, index_path: str = 'downloads/gemini_files.json', margin: int = 2 * 60 * 60,
+                 get_file: Callable = genai.get_file):
+        self.index_path = index_path
+        self.get_file = get_file
+        self.margin = margin
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0}
+        self._load_index()
+
+    def get(self, key: str):
+        """Return the ACTIVE remote file for key, or None if it must be uploaded again"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry['expires_at'] - self.margin <= time.time():
+                self.entries.pop(key)
+                self.stats['expired'] += 1
+                self._save_index()
+                entry = None
+            if not entry:
+                self.stats['misses'] += 1
+                return None
+
+        try:
+            remote_file = self.get_file(entry['name'])
+        except Exception as e:
+            logging.info(f"Cached Gemini file {entry['name']} is gone: {e}")
+            remote_file = None
+
+        with self.lock:
+            if remote_file is None or remote_file.state.name != "ACTIVE":
+                self.entries.pop(key, None)
+                self.stats['misses'] += 1
+                self._save_index()
+                return None
+            self.stats['hits'] += 1
+        logging.info(f"Reusing uploaded Gemini file {entry['name']}")
+        return remote_file
+
+    def put(self, key: str, remote_file):
+        """Remember an ACTIVE uploaded file under key"""
+        expiration = getattr(remote_file, 'expiration_time', None)
+        expires_at = expiration.timestamp() if expiration else time.time() + GEMINI_FILE_TTL
+        with self.lock:
+            self.entries[key] = {'name': remote_file.name, 'expires_at': expires_at}
+            self._save_index()
+
+    def discard(self, name: str):
+        """Forget every key that points at the named remote file"""
+        with self.lock:
+            keys = [key for key, entry in self.entries.items() if entry['name'] == name]
+            for key in keys:
+                self.entries.pop(key)
+            if keys:
+                self._save_index()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+            }
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading Gemini file index: {e}")
+
+    def _save_index(self):
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logging.error(f"Error saving Gemini file index: {e}")
+
+
+class GeminiFileRegistry:
+    """Tracks which jobs use which uploaded Gemini files and deletes them once unused.
+
+    A job holds a lease on every file it uploads or reuses. The lease ends
+    when the job calls release_job, or after lease seconds if it never does.
+    A file with no live leases is kept until its retain_until time so later
+    jobs can reuse it, then deleted by a background reaper in batches. When
+    the registered files exceed max_bytes, unleased files are deleted early,
+    the ones closest to their retain_until first. A leased file is never
+    deleted.
+    """
+
+    def __init__(self, delete_file: Callable, index_path: str = 'downloads/gemini_registry.json',
+                 max_bytes: int = 18 * 1024 ** 3, lease: int = 3 * 60 * 60, interval: float = 60,
+                 batch_size: int = 16, on_delete: Optional[Callable[[str], None]] = None):
+        self.delete_file = delete_file
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.lease = lease
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_delete = on_delete
+        self.lock = threading.Lock()
+        self.files = {}
+        # Names being or already deleted; Gemini never reuses a file name
+        self.deleted = OrderedDict()
+        self.wake = threading.Event()
+        self.reaper = None
+        self.stats = {'registered': 0, 'reused': 0, 'deleted': 0, 'evicted_for_space': 0,
+                      'expired': 0, 'delete_errors': 0}
+        self._load_index()
+
+    def register(self, name: str, job_id: str, size_bytes: int, expires_at: Optional[float] = None):
+        """Record a file job_id just uploaded, leased to that job; see retain() for keeping it afterwards"""
+        now = time.time()
+        with self.lock:
+            self.files[name] = {
+                'size_bytes': size_bytes,
+                'owners': {job_id: now + self.lease},
+                'retain_until': now,
+                'expires_at': expires_at or now + GEMINI_FILE_TTL,
+            }
+            self.stats['registered'] += 1
+            self._save_index()
+        self._ensure_reaper()
+
+    def acquire(self, name: str, job_id: str) -> bool:
+        """Lease an already-uploaded file for job_id; False if it has been reaped and must be uploaded again"""
+        now = time.time()
+        with self.lock:
+            if name in self.deleted:
+                return False
+            # Files uploaded before the registry existed are adopted with an unknown size
+            entry = self.files.setdefault(name, {
+                'size_bytes': 0, 'owners': {}, 'retain_until': now, 'expires_at': now + GEMINI_FILE_TTL,
+            })
+            entry['owners'][job_id] = now + self.lease
+            self.stats['reused'] += 1
+            self._save_index()
+        self._ensure_reaper()
+        return True
+
+    def retain(self, name: str, retain_seconds: float):
+        """Keep a file around for reuse until retain_seconds from now (capped at Gemini's expiry)"""
+        with self.lock:
+            entry = self.files.get(name)
+            if entry:
+                entry['retain_until'] = min(time.time() + retain_seconds, entry['expires_at'])
+                self._save_index()
+
+    def release_job(self, job_id: str):
+        """End job_id's leases; files nobody else holds become eligible for reaping"""
+        with self.lock:
+            released = [entry for entry in self.files.values() if entry['owners'].pop(job_id, None)]
+            if released:
+                self._save_index()
+        if released:
+            self.wake.set()
+
+    def reap(self) -> list:
+        """Delete one batch of unused files and return their names"""
+        now = time.time()
+        with self.lock:
+            # Past Gemini's own expiry there is nothing left to delete
+            for name in [name for name, entry in self.files.items() if entry['expires_at'] <= now]:
+                self.files.pop(name)
+                self._mark_deleted(name)
+                self.stats['expired'] += 1
+
+            unleased = sorted(
+                (entry['retain_until'], name) for name, entry in self.files.items()
+                if all(lease_end <= now for lease_end in entry['owners'].values())
+            )
+            batch = [name for retain_until, name in unleased if retain_until <= now]
+            over = sum(entry['size_bytes'] for entry in self.files.values()) - self.max_bytes
+            for retain_until, name in unleased:
+                if over <= 0:
+                    break
+                if retain_until > now:
+                    batch.append(name)
+                    self.stats['evicted_for_space'] += 1
+                over -= self.files[name]['size_bytes']
+            batch = batch[:self.batch_size]
+
+            for name in batch:
+                self.files.pop(name)
+                self._mark_deleted(name)
+            if batch:
+                self._save_index()
+
+        if not batch:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(batch), 4)) as pool:
+            results = list(pool.map(self._delete, batch))
+        deleted = [name for name, ok in zip(batch, results) if ok]
+        logging.info(f"Reaped {len(deleted)} of {len(batch)} Gemini files")
+        return deleted
+
+    def get_stats(self) -> dict:
+        now = time.time()
+        with self.lock:
+            return {
+                **self.stats,
+                'files': len(self.files),
+                'bytes': sum(entry['size_bytes'] for entry in self.files.values()),
+                'leased': sum(
+                    1 for entry in self.files.values()
+                    if any(lease_end > now for lease_end in entry['owners'].values())
+                ),
+            }
+
+    def _delete(self, name: str) -> bool:
+        if self.on_delete:
+            self.on_delete(name)
+        try:
+            self.delete_file(name)
+        except Exception as e:
+            # Most likely already gone; Gemini removes it at expiry either way
+            logging.info(f"Could not delete Gemini file {name}: {e}")
+            with self.lock:
+                self.stats['delete_errors'] += 1
+            return False
+        with self.lock:
+            self.stats['deleted'] += 1
+        return True
+
+    def _mark_deleted(self, name: str):
+        self.deleted[name] = True
+        while len(self.deleted) > 10000:
+            self.deleted.popitem(last=False)
+
+    def _ensure_reaper(self):
+        with self.lock:
+            if self.reaper is not None:
+                return
+            self.reaper = threading.Thread(target=self._run_reaper, name='gemini-file-reaper', daemon=True)
+            self.reaper.start()
+        logging.info("Started Gemini file reaper")
+
+    def _run_reaper(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                # Keep going while full batches come back
+                while len(self.reap()) >= self.batch_size:
+                    pass
+            except Exception as e:
+                logging.error(f"Gemini file reaper error: {e}")
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.files = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading Gemini file registry: {e}")
+            return
+        # Jobs do not survive a restart, so neither do their leases
+        for entry in self.files.values():
+            entry['owners'] = {}
+
+    def _save_index(self):
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.files, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logging.error(f"Error saving Gemini file registry: {e}")
@@ -1,58 +1,147 @@
+import logging
 import re
-from datetime import datetime
-from typing import List, Dict
-
-def parse_timestamp(timestamp: str) -> float:
-    """Convert timestamp string to seconds."""
-    try:
-        time_parts = timestamp.split(':')
-        if len(time_parts) == 2:
-            minutes, seconds = time_parts
-            return int(minutes) * 60 + float(seconds)
-        elif len(time_parts) == 3:
-            hours, minutes, seconds = time_parts
-            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
-    except ValueError:
-        return 0
+from typing import List, Dict, Union
 
-def parse_gemini_response(response_text: str) -> List[Dict]:
-    """Parse Gemini's response into structured clip data."""
-    clips = []
-    current_clip = {}
-    
-    # Split response into clip segments
-    segments = response_text.split('\n\n')
-    
-    for segment in segments:
-        lines = segment.strip().split('\n')
-        
-        # Parse timestamp line
-        timestamp_match = re.match(r'(\d{1,2}:\d{2}(?::\d{2})?) - (\d{1,2}:\d{2}(?::\d{2})?)', lines[0])
-        if timestamp_match:
-            start_time, end_time = timestamp_match.groups()
-            current_clip = {
-                'start_time': parse_timestamp(start_time),
-                'end_time': parse_timestamp(end_time),
+# Bump when the clip dicts the parsers produce change meaning so cached clip lists are not reused
+CLIP_FORMAT_VERSION = 'clips-v2'
+
+# MM:SS or H:MM:SS, optionally with fractional seconds
+TIMESTAMP = r'(?:\d{1,2}:)?\d{1,2}:\d{2}(?:\.\d+)?'
+TIMESTAMP_PATTERN = re.compile(TIMESTAMP)
+# "00:42 - 02:05", "1:02:03.5 – 1:04:00", "0:42 to 2:05"; not part of a longer number
+RANGE = rf'(?<![\d.])(?<!\d:)(?P<start>{TIMESTAMP})[ \t]*(?:-|–|—|to)[ \t]*(?P<end>{TIMESTAMP})(?!\d|:\d)'
+RANGE_PATTERN = re.compile(RANGE, re.IGNORECASE)
+# Bullet, number or heading marker and emphasis before the text of a line
+LEAD = r'^[ \t]*(?:(?:[-*+•>]|\d+[.)]|#+)[ \t]+)?[*_`]*'
+FIELD_LABELS = {'description': 'description', 'viral_potential': 'viral potential', 'platforms': '(?:best )?platforms'}
+
+
+def field_alternatives(prefix: str = '') -> str:
+    # One named group per field, so match.lastgroup says which field a line sets
+    return '|'.join(rf'{label}[*_`]*[ \t]*:(?P<{prefix}{field}>[^\n]*)' for field, label in FIELD_LABELS.items())
+
+
+# One match per line that matters; anything else is skipped inside the regex engine.
+# A labelled line is a field even if its text mentions a time range, a line with a
+# range starts a clip, and failing both a label later in the line still counts
+LINE_PATTERN = re.compile(
+    rf'{LEAD}(?:{field_alternatives()}|[^\n]*?{RANGE}|[^\n]*?(?:{field_alternatives("late_")}))',
+    re.IGNORECASE | re.MULTILINE,
+)
+NUMBER_PATTERN = re.compile(r'\d+')
+PLATFORM_SEPARATOR_PATTERN = re.compile(r'[,;/|]|\s+and\s+')
+
+FIELD_GROUPS = {**{field: field for field in FIELD_LABELS}, **{f'late_{field}': field for field in FIELD_LABELS}}
+CLIP_FIELDS = ('description', 'viral_potential', 'platforms')
+
+
+def timestamp_seconds(timestamp: str) -> Union[int, float]:
+    """Seconds from a string already known to match TIMESTAMP"""
+    *hours, minutes, seconds = timestamp.split(':')
+    seconds = float(seconds) if '.' in seconds else int(seconds)
+    if seconds >= 60:
+        raise ValueError(f"seconds out of range in {timestamp!r}")
+    return (int(hours[0]) * 3600 if hours else 0) + int(minutes) * 60 + seconds
+
+
+def parse_timestamp(value: Union[str, int, float]) -> Union[int, float]:
+    """Seconds from MM:SS, H:MM:SS (optionally with fractional seconds) or a plain number"""
+    if isinstance(value, (int, float)):
+        return value
+    value = value.strip()
+    if not TIMESTAMP_PATTERN.fullmatch(value):
+        raise ValueError(f"expected MM:SS or H:MM:SS, got {value!r}")
+    return timestamp_seconds(value)
+
+
+def parse_platforms(value: str) -> List[str]:
+    platforms = (platform.strip() for platform in PLATFORM_SEPARATOR_PATTERN.split(value.rstrip(' .')))
+    return [platform for platform in platforms if platform]
+
+
+class StreamingClipParser:
+    """Single-pass parser for the text response format, fed whole or in streamed chunks.
+
+    feed() takes text as it arrives and returns the clips whose block is
+    complete: either all of Description / Viral Potential / Best Platforms
+    have been seen, or the next timestamp line has started. close() flushes
+    the last clip. Every clip emitted is also kept in self.clips.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.current_clip = None
+        self.seen_fields = set()
+        self.clips = []
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        end = self.buffer.rfind('\n')
+        if end < 0:
+            return []
+        lines, self.buffer = self.buffer[:end], self.buffer[end + 1:]
+        emitted = len(self.clips)
+        self._parse_lines(lines)
+        return self.clips[emitted:]
+
+    def close(self) -> list:
+        emitted = len(self.clips)
+        self._parse_lines(self.buffer)
+        self.buffer = ''
+        self._emit()
+        return self.clips[emitted:]
+
+    def _emit(self):
+        if self.current_clip:
+            self.clips.append(self.current_clip)
+        self.current_clip = None
+        self.seen_fields = set()
+
+    def _parse_lines(self, text: str):
+        for match in LINE_PATTERN.finditer(text):
+            group = match.lastgroup
+            if group == 'end':
+                self._start_clip(match.group('start'), match.group('end'))
+            elif self.current_clip:
+                # Leftover emphasis and the \r of \r\n line endings
+                self._set_field(FIELD_GROUPS[group], match.group(group).strip(' \t\r*_`'))
+
+    def _set_field(self, field: str, value: str):
+        clip = self.current_clip
+        if field == 'description':
+            clip['description'] = value
+        elif field == 'viral_potential':
+            number = NUMBER_PATTERN.search(value)
+            if number:
+                clip['viral_potential'] = int(number.group())
+            else:
+                logging.error(f"Error parsing viral potential: {value!r}")
+        else:
+            clip['platforms'] = parse_platforms(value)
+        self.seen_fields.add(field)
+
+        if len(self.seen_fields) == len(CLIP_FIELDS):
+            self._emit()
+
+    def _start_clip(self, start_str: str, end_str: str):
+        self._emit()
+        try:
+            self.current_clip = {
+                'start_time': timestamp_seconds(start_str),
+                'end_time': timestamp_seconds(end_str),
+                'original_end': end_str,
                 'description': '',
-                'viral_score': 0,
+                'viral_potential': 0,
                 'platforms': []
             }
-            
-            # Parse remaining lines
-            for line in lines[1:]:
-                if line.startswith('Description:'):
-                    current_clip['description'] = line.replace('Description:', '').strip()
-                elif line.startswith('Viral Potential:'):
-                    try:
-                        score = int(re.search(r'\d+', line).group())
-                        current_clip['viral_score'] = min(max(score, 1), 10)
-                    except (AttributeError, ValueError):
-                        current_clip['viral_score'] = 5
-                elif line.startswith('Best Platforms:'):
-                    platforms = line.replace('Best Platforms:', '').strip()
-                    current_clip['platforms'] = [p.strip() for p in platforms.split(',')]
-            
-            if current_clip['end_time'] > current_clip['start_time']:
-                clips.append(current_clip)
-    
-    return clips
\ No newline at end of file
+        except ValueError as e:
+            logging.error(f"Error parsing timestamp: {e}")
+
+
+def parse_gemini_response(response_text: str) -> List[Dict]:
+    """Parse Gemini's text response into structured clip data"""
+    parser = StreamingClipParser()
+    parser.feed(response_text)
+    parser.close()
+    logging.info(f"Parsed {len(parser.clips)} clips from a {len(response_text)} character response")
+    return parser.clips
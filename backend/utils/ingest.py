@@ -0,0 +1,44 @@
+import copy
+import logging
+import os
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import download_range_func
+
+# Smallest rendition that still has both audio and video, used for analysis only
+PROXY_FORMAT = 'worst[height>=240][vcodec!=none][acodec!=none]/worst[vcodec!=none][acodec!=none]/worst'
+
+
+def download_sections(url: str, ranges: list, output_dir: str, format_spec: str = 'best', info: dict = None) -> list:
+    """Download only the given (start, end) second ranges of url at format_spec.
+
+    info may be metadata already probed for url, to skip a second extraction.
+
+    Returns the downloaded file path for each range, in the same order as ranges
+    (None where a range could not be downloaded).
+    """
+    unique_ranges = list(dict.fromkeys(ranges))
+    ydl_opts = {
+        'format': format_spec,
+        'quiet': True,
+        'no_warnings': True,
+        'outtmpl': os.path.join(output_dir, 'clip_%(section_start)s_%(section_end)s.%(ext)s'),
+        'download_ranges': download_range_func(None, unique_ranges),
+        'force_keyframes_at_cuts': True,
+    }
+
+    with YoutubeDL(ydl_opts) as ydl:
+        if info is None:
+            info = ydl.extract_info(url, download=True)
+        else:
+            info = ydl.process_ie_result(copy.deepcopy(info), download=True)
+
+    # yt-dlp records one requested download per section, in range order
+    section_paths = {}
+    for requested_range, download in zip(unique_ranges, info.get('requested_downloads', [])):
+        path = download.get('filepath')
+        if path and os.path.exists(path):
+            section_paths[requested_range] = path
+
+    total_bytes = sum(os.path.getsize(p) for p in section_paths.values())
+    logging.info(f"Downloaded {len(section_paths)}/{len(unique_ranges)} sections ({total_bytes} bytes)")
+    return [section_paths.get(r) for r in ranges]
@@ -0,0 +1,180 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from contextlib import nullcontext
+from typing import Callable, Optional
+
+# Bump when the sidecar layout changes so stale indexes are rebuilt
+KEYFRAME_INDEX_VERSION = 1
+# Written next to the source it indexes, e.g. downloads/cache/Youtube_abc_22.mp4.keyframes.json
+INDEX_SUFFIX = '.keyframes.json'
+
+# ffprobe prints times to the microsecond
+TIME_TOLERANCE = 1e-6
+
+
+class KeyframeIndex:
+    """Keyframe times and byte offsets of a source's first video stream.
+
+    Times are seconds on the same scale as ffmpeg's -ss, i.e. with the
+    container's start_time already subtracted.
+    """
+
+    def __init__(self, keyframes: list, positions: list, duration: float, packets: int):
+        self.keyframes = keyframes
+        self.positions = positions
+        self.duration = duration
+        self.packets = packets
+
+    def before(self, t: float) -> float:
+        """The keyframe at or before t, where a stream copy reaching t has to start"""
+        index = bisect.bisect_right(self.keyframes, t + TIME_TOLERANCE) - 1
+        return self.keyframes[index] if index >= 0 else 0.0
+
+    def after(self, t: float) -> float:
+        """The keyframe at or after t; the end of the stream if there is none"""
+        index = bisect.bisect_left(self.keyframes, t - TIME_TOLERANCE)
+        return self.keyframes[index] if index < len(self.keyframes) else self.duration
+
+    def position(self, t: float) -> Optional[int]:
+        """Byte offset of the keyframe at or before t, if ffprobe reported one"""
+        index = bisect.bisect_right(self.keyframes, t + TIME_TOLERANCE) - 1
+        return self.positions[max(0, index)] if self.positions else None
+
+    def to_dict(self) -> dict:
+        return {'keyframes': self.keyframes, 'positions': self.positions,
+                'duration': self.duration, 'packets': self.packets}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'KeyframeIndex':
+        return cls(data['keyframes'], data['positions'], data['duration'], data['packets'])
+
+
+async def build_keyframe_index(video_path: str) -> KeyframeIndex:
+    """Read every video packet's time, offset and flags with ffprobe; nothing is decoded"""
+    process = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,pos,flags:format=start_time,duration',
+        '-of', 'csv=p=0', video_path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    keyframes, packets = [], 0
+    start_time, duration = 0.0, 0.0
+    # Read as it streams; a long source has hundreds of thousands of packets
+    async for line in process.stdout:
+        fields = line.decode('ascii', 'replace').strip().split(',')
+        if len(fields) == 3:
+            packets += 1
+            pts_time, pos, flags = fields
+            if 'K' in flags and pts_time != 'N/A':
+                keyframes.append((float(pts_time), int(pos) if pos != 'N/A' else None))
+        elif len(fields) == 2:
+            start_time = float(fields[0]) if fields[0] != 'N/A' else 0.0
+            duration = float(fields[1]) if fields[1] != 'N/A' else 0.0
+    stderr = await process.stderr.read()
+    if await process.wait() != 0:
+        raise RuntimeError(f"ffprobe failed on {video_path}: {stderr.decode('utf-8', 'replace').strip()}")
+    if not keyframes:
+        raise RuntimeError(f"No video keyframes found in {video_path}")
+
+    # Packets arrive in decode order; B-frames put presentation times out of order
+    keyframes.sort(key=lambda keyframe: keyframe[0])
+    times = [round(t - start_time, 6) for t, _ in keyframes]
+    offsets = [pos for _, pos in keyframes]
+    return KeyframeIndex(times, offsets if None not in offsets else [], duration, packets)
+
+
+class KeyframeIndexStore:
+    """Keyframe indexes built once per source and kept on disk next to it.
+
+    get() loads the sidecar written by an earlier job when it still matches
+    the source's size and modification time, and otherwise runs ffprobe
+    inside slot() (a context manager such as FfmpegPool.slot) and writes a
+    new one. Jobs asking for the same source at once share one build. All
+    state lives on the event loop that calls it.
+    """
+
+    def __init__(self, slot: Optional[Callable] = None):
+        self.slot = slot or nullcontext
+        self.building = {}
+        self.stats = {
+            'loaded': 0, 'built': 0, 'failed': 0, 'build_seconds': 0.0,
+            'cuts': 0, 'snapped': 0, 'start_lead_seconds': 0.0, 'max_start_lead_seconds': 0.0,
+        }
+
+    async def get(self, video_path: str) -> Optional[KeyframeIndex]:
+        """The index for video_path, or None if it cannot be built (cuts then seek as before)"""
+        index = await asyncio.to_thread(self._load, video_path)
+        if index:
+            self.stats['loaded'] += 1
+            return index
+        build = self.building.get(video_path)
+        if build is None:
+            build = asyncio.ensure_future(self._build(video_path))
+            self.building[video_path] = build
+            build.add_done_callback(lambda _: self.building.pop(video_path, None))
+        return await asyncio.shield(build)
+
+    def record_cut(self, start_lead: float):
+        """Count how far a cut's start was moved back to reach a keyframe"""
+        self.stats['cuts'] += 1
+        if start_lead > TIME_TOLERANCE:
+            self.stats['snapped'] += 1
+        self.stats['start_lead_seconds'] += start_lead
+        self.stats['max_start_lead_seconds'] = max(self.stats['max_start_lead_seconds'], start_lead)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            'build_seconds': round(self.stats['build_seconds'], 2),
+            'start_lead_seconds': round(self.stats['start_lead_seconds'], 2),
+            'building': len(self.building),
+        }
+
+    async def _build(self, video_path: str) -> Optional[KeyframeIndex]:
+        started = time.monotonic()
+        try:
+            async with self.slot():
+                index = await build_keyframe_index(video_path)
+        except (OSError, RuntimeError, ValueError) as e:
+            self.stats['failed'] += 1
+            logging.warning(f"Could not index keyframes of {video_path}: {e}")
+            return None
+        elapsed = time.monotonic() - started
+        self.stats['built'] += 1
+        self.stats['build_seconds'] += elapsed
+        logging.info(f"Indexed {len(index.keyframes)} keyframes in {index.packets} packets of {video_path} "
+                     f"({elapsed:.2f}s)")
+        await asyncio.to_thread(self._save, video_path, index)
+        return index
+
+    def _load(self, video_path: str) -> Optional[KeyframeIndex]:
+        try:
+            with open(video_path + INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            stat = os.stat(video_path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading keyframe index for {video_path}: {e}")
+            return None
+        # A re-downloaded source gets a new index
+        if (data.get('version') != KEYFRAME_INDEX_VERSION or data.get('size') != stat.st_size
+                or data.get('mtime_ns') != stat.st_mtime_ns):
+            return None
+        return KeyframeIndex.from_dict(data)
+
+    def _save(self, video_path: str, index: KeyframeIndex):
+        try:
+            stat = os.stat(video_path)
+            tmp_path = video_path + INDEX_SUFFIX + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': KEYFRAME_INDEX_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                           **index.to_dict()}, f)
+            os.replace(tmp_path, video_path + INDEX_SUFFIX)
+        except OSError as e:
+            logging.error(f"Error saving keyframe index for {video_path}: {e}")
@@ -0,0 +1,97 @@
+import copy
+import logging
+import threading
+import time
+from typing import Optional
+from yt_dlp import YoutubeDL
+
+from utils.singleflight import normalize_url
+
+# Per-tier limits checked before anything is downloaded
+TIER_LIMITS = {
+    'free': {'max_duration': 30 * 60, 'max_filesize': 1 * 1024 ** 3},
+    'regular': {'max_duration': 2 * 60 * 60, 'max_filesize': 4 * 1024 ** 3},
+    'pro': {'max_duration': 6 * 60 * 60, 'max_filesize': 16 * 1024 ** 3},
+}
+
+
+class MetadataCache:
+    """Caches metadata-only extract_info results so the real download can reuse them.
+
+    Entries expire after ttl seconds because extracted stream URLs go stale.
+    """
+
+    def __init__(self, ttl: int = 30 * 60):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def probe(self, url: str) -> dict:
+        """Return metadata for url without downloading any media"""
+        key = normalize_url(url)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry['fetched_at'] < self.ttl:
+                return entry['info']
+
+        ydl_opts = {
+            'format': 'best',
+            'quiet': True,
+            'no_warnings': True,
+        }
+        with YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+
+        with self.lock:
+            self.entries = {
+                k: e for k, e in self.entries.items()
+                if time.time() - e['fetched_at'] < self.ttl
+            }
+            self.entries[key] = {'info': info, 'fetched_at': time.time()}
+        return info
+
+
+def estimate_filesize(info: dict) -> Optional[int]:
+    """Best guess at the download size of the selected format(s) in bytes"""
+    formats = info.get('requested_formats') or [info]
+    total = 0
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and info.get('duration'):
+            # tbr is in kbit/s
+            size = fmt['tbr'] * 1000 / 8 * info['duration']
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+
+def select_format(info: dict, format_spec: str) -> dict:
+    """info with format_spec's format(s) selected instead of the probe's, without downloading anything"""
+    with YoutubeDL({'format': format_spec, 'quiet': True, 'no_warnings': True}) as ydl:
+        return ydl.process_ie_result(copy.deepcopy(info), download=False)
+
+
+def check_admission(info: dict, tier: str, format_spec: str = 'best') -> Optional[str]:
+    """Return the reason a job should be rejected for this tier, or None if it may proceed.
+
+    The size limit is checked against format_spec, the format the job will
+    actually download; info is the probe's metadata, selected with 'best'.
+    """
+    limits = TIER_LIMITS.get(tier, TIER_LIMITS['free'])
+
+    if info.get('is_live') or info.get('live_status') in ('is_live', 'is_upcoming'):
+        return "Live streams can't be processed until the broadcast has ended"
+
+    duration = info.get('duration')
+    if duration and duration > limits['max_duration']:
+        return (f"Video is {int(duration // 60)} minutes long; the {tier} plan allows up to "
+                f"{limits['max_duration'] // 60} minutes")
+
+    filesize = estimate_filesize(info if format_spec == 'best' else select_format(info, format_spec))
+    if filesize and filesize > limits['max_filesize']:
+        return (f"Video is about {filesize / 1024 ** 3:.1f} GB; the {tier} plan allows up to "
+                f"{limits['max_filesize'] / 1024 ** 3:.0f} GB")
+
+    logging.info(f"Admitted {info.get('id')} for {tier} tier (duration={duration}, filesize={filesize})")
+    return None
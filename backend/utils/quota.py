@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+# Lower value is served first; unknown tiers queue behind free
+TIER_PRIORITY = {'pro': 0, 'regular': 1, 'free': 2}
+
+# Rough Gemini 1.5 token costs, used to reserve tokens/min before a request is sent
+VIDEO_TOKENS_PER_SECOND = 300
+AUDIO_TOKENS_PER_SECOND = 32
+RESPONSE_TOKEN_ALLOWANCE = 2048
+
+
+def estimate_tokens(duration: float = 0, analysis_mode: str = 'none', text: str = '') -> int:
+    """Expected prompt plus response tokens for one generate_content call"""
+    per_second = AUDIO_TOKENS_PER_SECOND if analysis_mode == 'audio' else VIDEO_TOKENS_PER_SECOND
+    # About four characters per token for English text
+    return int(duration * per_second) + len(text) // 4 + RESPONSE_TOKEN_ALLOWANCE
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, holding at most one minute's worth"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken; 0 if it can be taken now"""
+        self._refill()
+        # A request larger than the bucket waits for a full bucket rather than forever
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Give back (positive) or charge (negative) tokens once the real cost is known"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class QuotaManager:
+    """Process-wide limiter for Gemini requests/min, tokens/min and concurrent uploads.
+
+    Jobs that cannot go yet wait in one queue per kind ('generate' or
+    'upload'), ordered by subscription tier and then arrival, so a pro job
+    never waits behind a free one. on_position(n) is called whenever a
+    waiter's place in its queue changes. All state lives on the event loop
+    that calls it; limits are per process, not per cluster.
+    """
+
+    def __init__(self, requests_per_minute: float = 15, tokens_per_minute: float = 1_000_000,
+                 max_concurrent_uploads: int = 4):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrent_uploads = max_concurrent_uploads
+        self.active_uploads = 0
+        self.counter = itertools.count()
+        self.queues = {'generate': [], 'upload': []}
+        self.timers = {}
+        self.stats = {
+            'generate_granted': 0, 'upload_granted': 0,
+            'waited': 0, 'seconds_waited': 0.0, 'tokens_reserved': 0, 'tokens_returned': 0,
+        }
+        self.waited_by_tier = {}
+
+    @asynccontextmanager
+    async def generate(self, tier: str, estimated_tokens: int, on_position: Optional[Callable[[int], None]] = None):
+        """Reserve one request and estimated_tokens; yields a callback taking the actual token count"""
+        await self._acquire('generate', tier, estimated_tokens, on_position)
+        self.stats['tokens_reserved'] += estimated_tokens
+
+        def used(actual_tokens: int):
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+            self.stats['tokens_returned'] += estimated_tokens - actual_tokens
+            self._dispatch('generate')
+
+        yield used
+
+    @asynccontextmanager
+    async def upload(self, tier: str, on_position: Optional[Callable[[int], None]] = None):
+        """Hold one of the concurrent upload slots"""
+        await self._acquire('upload', tier, 0, on_position)
+        try:
+            yield
+        finally:
+            self.active_uploads -= 1
+            self._dispatch('upload')
+
+    async def _acquire(self, kind: str, tier: str, amount: int, on_position):
+        loop = asyncio.get_running_loop()
+        entry = [TIER_PRIORITY.get(tier, len(TIER_PRIORITY)), next(self.counter), amount,
+                 loop.create_future(), on_position, tier]
+        heapq.heappush(self.queues[kind], entry)
+        started = time.monotonic()
+        self._dispatch(kind)
+        granted = entry[3]
+        if not granted.done():
+            self.stats['waited'] += 1
+            logging.info(f"Waiting for Gemini {kind} capacity ({tier} tier)")
+        try:
+            await granted
+        except asyncio.CancelledError:
+            if entry in self.queues[kind]:
+                self.queues[kind].remove(entry)
+                heapq.heapify(self.queues[kind])
+                self._dispatch(kind)
+            elif kind == 'upload' and granted.done() and not granted.cancelled():
+                # Granted between the cancel and this handler; hand the slot back
+                self.active_uploads -= 1
+                self._dispatch(kind)
+            raise
+
+        waited = time.monotonic() - started
+        self.stats['seconds_waited'] += waited
+        self.waited_by_tier[tier] = self.waited_by_tier.get(tier, 0.0) + waited
+
+    def _dispatch(self, kind: str):
+        """Grant waiters from the head of the queue for as long as capacity allows"""
+        queue = self.queues[kind]
+        while queue:
+            _, _, amount, granted, _, _ = queue[0]
+            if granted.done():
+                # Its task was cancelled and has not cleaned up yet
+                heapq.heappop(queue)
+                continue
+            if kind == 'upload':
+                if self.active_uploads >= self.max_concurrent_uploads:
+                    break
+                self.active_uploads += 1
+            else:
+                delay = max(self.requests.wait_time(1), self.tokens.wait_time(amount))
+                if delay > 0:
+                    self._schedule(kind, delay)
+                    break
+                self.requests.take(1)
+                self.tokens.take(amount)
+            heapq.heappop(queue)
+            self.stats[f'{kind}_granted'] += 1
+            granted.set_result(True)
+
+        for position, entry in enumerate(sorted(queue), start=1):
+            if entry[4]:
+                entry[4](position)
+
+    def _schedule(self, kind: str, delay: float):
+        loop = asyncio.get_running_loop()
+        timer = self.timers.get(kind)
+        # A handle past its due time belongs to a loop that stopped before running it
+        if timer is not None and not timer.cancelled() and timer.when() > loop.time():
+            return
+
+        def wake():
+            self.timers.pop(kind, None)
+            self._dispatch(kind)
+
+        self.timers[kind] = loop.call_later(delay, wake)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            'queued': {kind: len(queue) for kind, queue in self.queues.items()},
+            'active_uploads': self.active_uploads,
+            'seconds_waited_by_tier': dict(self.waited_by_tier),
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import re
+import time
+from contextlib import nullcontext
+from typing import Callable, List, NamedTuple, Optional
+
+import ffmpeg
+
+from utils.ffmpeg_async import run_ffmpeg
+
+
+class Rendition(NamedTuple):
+    """One output format: aspect_ratio is for display, width x height is the largest size rendered"""
+    name: str
+    aspect_ratio: str
+    width: int
+    height: int
+
+
+RENDITIONS = (
+    Rendition('vertical', '9:16', 1080, 1920),
+    Rendition('square', '1:1', 1080, 1080),
+    Rendition('landscape_1080', '16:9', 1920, 1080),
+    Rendition('landscape_720', '16:9', 1280, 720),
+    Rendition('landscape_480', '16:9', 854, 480),
+)
+
+# Whole words of a platform name, first match wins, so "YouTube Shorts" is vertical before "YouTube" is landscape
+PLATFORM_RENDITIONS = (
+    ({'tiktok', 'reels', 'shorts', 'stories', 'snapchat'}, ('vertical',)),
+    ({'instagram', 'facebook', 'linkedin'}, ('square',)),
+    ({'youtube', 'twitter', 'x', 'vimeo'}, ('landscape_1080', 'landscape_720', 'landscape_480')),
+)
+
+# Renditions are uploaded as they are, so they get a little more quality than a preview would
+RENDITION_CRF = 20
+
+
+def renditions_for(platforms: List[str]) -> List[Rendition]:
+    """The renditions a clip's platforms call for, in RENDITIONS order; none for unknown platforms"""
+    names = set()
+    for platform in platforms:
+        words = set(re.findall(r'[a-z0-9]+', platform.lower()))
+        for keywords, rendition_names in PLATFORM_RENDITIONS:
+            if words & keywords:
+                names.update(rendition_names)
+                break
+    return [rendition for rendition in RENDITIONS if rendition.name in names]
+
+
+def even(value: float) -> int:
+    """Nearest even size of at least 2; libx264 needs even dimensions for 4:2:0"""
+    return max(2, int(round(value / 2)) * 2)
+
+
+def rendition_geometry(rendition: Rendition, width: int, height: int) -> tuple:
+    """((crop_w, crop_h), (out_w, out_h)) for a width x height source.
+
+    The source is center-cropped to the rendition's aspect ratio, then
+    scaled down to the rendition's size; a smaller source is not scaled
+    up, so its renditions come out at the cropped size.
+    """
+    aspect = rendition.width / rendition.height
+    if width / height > aspect:
+        crop = (even(height * aspect), even(height))
+    else:
+        crop = (even(width), even(width / aspect))
+    out_height = min(rendition.height, crop[1])
+    return crop, (even(out_height * aspect), even(out_height))
+
+
+class RenditionRenderer:
+    """Every platform format of a clip from a single decode of its source.
+
+    The clip's stretch of the source is decoded once; a split filter feeds
+    one crop+scale branch and libx264 encode per rendition, all in one
+    ffmpeg process, so N renditions cost one decode rather than N. Audio is
+    copied into each. Renditions that would come out the same size as one
+    already planned (a small source is never scaled up) are left out. The
+    process runs inside slot(threads) (see FfmpegPool.slot) with the
+    threads shared between its encoders.
+    """
+
+    def __init__(self, slot: Optional[Callable] = None, threads: int = 0):
+        self.slot = slot or nullcontext
+        self.threads = threads
+        self.stats = {'renders': 0, 'renditions': 0, 'failures': 0, 'decoded_seconds': 0.0,
+                      'encoded_seconds': 0.0, 'seconds': 0.0}
+
+    async def render(self, video_path: str, start: float, end: float, output_prefix: str,
+                     platforms: List[str]) -> List[dict]:
+        """Render start-end of video_path for platforms to output_prefix_<name>.mp4.
+
+        Returns one dict per rendition written (name, aspect_ratio, width,
+        height, url), or an empty list if none are needed or the render
+        failed. Never raises.
+        """
+        renditions = renditions_for(platforms)
+        if not renditions:
+            return []
+        started = time.monotonic()
+        try:
+            stream = (await asyncio.to_thread(ffmpeg.probe, video_path, select_streams='v:0'))['streams'][0]
+            planned, sizes = [], set()
+            for rendition in renditions:
+                crop, size = rendition_geometry(rendition, int(stream['width']), int(stream['height']))
+                if size not in sizes:
+                    sizes.add(size)
+                    planned.append((rendition, crop, size, f"{output_prefix}_{rendition.name}.mp4"))
+
+            source = ffmpeg.input(video_path, ss=start, t=end - start)
+            video = source['v:0']
+            branches = [video] if len(planned) == 1 else video.filter_multi_output('split', len(planned))
+            threads = max(1, (self.threads or 1) // len(planned))
+            outputs = []
+            for number, (rendition, crop, size, path) in enumerate(planned):
+                branch = (branches[number]
+                          .filter('crop', crop[0], crop[1])
+                          .filter('scale', size[0], size[1])
+                          .filter('setsar', 1))
+                outputs.append(ffmpeg.output(branch, source['a?'], path, vcodec='libx264', preset='veryfast',
+                                             crf=RENDITION_CRF, pix_fmt='yuv420p', threads=threads, acodec='copy'))
+            async with self.slot(self.threads or 1):
+                await run_ffmpeg(ffmpeg.merge_outputs(*outputs).overwrite_output())
+        except (ffmpeg.Error, OSError, ValueError, KeyError, IndexError) as e:
+            if isinstance(e, ffmpeg.Error) and e.stderr:
+                e = e.stderr.decode('utf-8', 'replace').strip().splitlines()[-1]
+            logging.warning(f"Rendering {video_path} {start}-{end} for {platforms} failed: {e}")
+            self.stats['failures'] += 1
+            return []
+
+        elapsed = time.monotonic() - started
+        self.stats['renders'] += 1
+        self.stats['renditions'] += len(planned)
+        self.stats['decoded_seconds'] += end - start
+        self.stats['encoded_seconds'] += (end - start) * len(planned)
+        self.stats['seconds'] += elapsed
+        logging.info(f"Rendered {', '.join(rendition.name for rendition, *_ in planned)} of {video_path} "
+                     f"{start}-{end} from one decode ({elapsed:.2f}s)")
+        return [{'name': rendition.name, 'aspect_ratio': rendition.aspect_ratio,
+                 'width': size[0], 'height': size[1], 'url': path}
+                for rendition, _, size, path in planned]
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            # Decodes a separate ffmpeg run per rendition would have added
+            'decodes_saved': self.stats['renditions'] - self.stats['renders'],
+            'decoded_seconds': round(self.stats['decoded_seconds'], 2),
+            'encoded_seconds': round(self.stats['encoded_seconds'], 2),
+            'seconds': round(self.stats['seconds'], 2),
+        }
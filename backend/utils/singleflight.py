@@ -0,0 +1,65 @@
+import hashlib
+import json
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtu.be'}
+
+# Query parameters that never change which video is served
+TRACKING_PARAMS = {'si', 'feature', 'pp', 'ab_channel', 'fbclid', 'gclid', 't', 'start'}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a video URL so trivially different links compare equal"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+
+    if host in YOUTUBE_HOSTS:
+        video_id = None
+        path_parts = [p for p in parts.path.split('/') if p]
+        if host == 'youtu.be' and path_parts:
+            video_id = path_parts[0]
+        elif len(path_parts) >= 2 and path_parts[0] in ('shorts', 'embed', 'live', 'v'):
+            video_id = path_parts[1]
+        else:
+            video_id = dict(parse_qsl(parts.query)).get('v')
+        if video_id:
+            return f"https://www.youtube.com/watch?v={video_id}"
+
+    query = [
+        (k, v) for k, v in sorted(parse_qsl(parts.query))
+        if k not in TRACKING_PARAMS and not k.startswith('utm_')
+    ]
+    return urlunsplit((parts.scheme.lower(), host, parts.path.rstrip('/'), urlencode(query), ''))
+
+
+def request_key(url: str, options: dict) -> str:
+    """Key identifying identical submissions: normalized URL plus options"""
+    payload = json.dumps({'url': normalize_url(url), 'options': options}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class InFlightJobs:
+    """Maps request keys to the job currently processing them"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.keys = {}
+
+    def attach_or_register(self, key: str, job_id: str) -> str:
+        """Return the running job for key, or register job_id as its owner and return it"""
+        with self.lock:
+            existing = self.jobs.get(key)
+            if existing:
+                return existing
+            self.jobs[key] = job_id
+            self.keys[job_id] = key
+            return job_id
+
+    def finish(self, job_id: str):
+        """Stop routing new submissions to job_id"""
+        with self.lock:
+            key = self.keys.pop(job_id, None)
+            if key and self.jobs.get(key) == job_id:
+                del self.jobs[key]
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+from typing import Callable, Optional
+
+import ffmpeg
+
+from utils.ffmpeg_async import run_ffmpeg
+from utils.keyframe_index import TIME_TOLERANCE, KeyframeIndex
+
+# libx264 profile for each profile ffprobe reports; the re-encoded head must decode like the copied rest
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+    'High 10': 'high10',
+    'High 4:2:2': 'high422',
+    'High 4:4:4 Predictive': 'high444',
+}
+# The head is at most one GOP, so it can afford a quality where the switch to copied frames is not visible
+HEAD_CRF = 16
+# The head stops this far before the keyframe the copy starts on, well under any frame duration
+HEAD_END_MARGIN = 0.001
+
+
+def head_encode_options(stream: dict, threads: int = 0) -> dict:
+    """libx264 options matching the source's video stream as reported by ffprobe"""
+    options = {
+        'vcodec': 'libx264',
+        'preset': 'veryfast',
+        'crf': HEAD_CRF,
+        'threads': threads,
+        'pix_fmt': stream['pix_fmt'],
+        # Filtering the head drops the stream's rate, which would otherwise fall back to 25 fps
+        'r': stream['r_frame_rate'],
+        # Same timescale as the source so the copied frames keep their exact timestamps
+        'video_track_timescale': int(stream['time_base'].split('/')[1]),
+    }
+    if stream.get('profile') in X264_PROFILES:
+        options['profile:v'] = X264_PROFILES[stream['profile']]
+    if stream.get('level', 0) > 0:
+        options['level'] = f"{stream['level'] / 10:g}"
+    return options
+
+
+class SmartRenderer:
+    """Clips that start exactly on the requested frame without a full transcode.
+
+    Only the frames from the start up to the next keyframe are re-encoded,
+    with codec parameters matching the source; the rest of the clip is
+    stream-copied from that keyframe and the pieces are joined with the
+    concat demuxer, which carries each piece's own SPS/PPS over. Audio is
+    copied straight from the source. H.264 sources only. Encodes run inside
+    slot(threads) and copies inside slot() (see FfmpegPool.slot).
+    """
+
+    def __init__(self, slot: Optional[Callable] = None, threads: int = 0):
+        self.slot = slot or nullcontext
+        self.threads = threads
+        self.stats = {'renders': 0, 'fallbacks': 0, 'encoded_seconds': 0.0, 'copied_seconds': 0.0, 'seconds': 0.0}
+
+    async def render(self, video_path: str, start: float, end: float, output_path: str,
+                     keyframes: KeyframeIndex) -> Optional[str]:
+        """Cut start-end of video_path into output_path.
+
+        Returns output_path, or None if the source cannot be smart-rendered
+        or a step failed, so the caller can fall back to a keyframe cut.
+        Never raises.
+        """
+        started = time.monotonic()
+        work_dir = tempfile.mkdtemp(prefix='.smart_', dir=os.path.dirname(output_path) or '.')
+        try:
+            stream = (await asyncio.to_thread(ffmpeg.probe, video_path, select_streams='v:0'))['streams'][0]
+            if stream.get('codec_name') != 'h264':
+                raise ValueError(f"cannot match {stream.get('codec_name')} video")
+            timescale = int(stream['time_base'].split('/')[1])
+
+            # The keyframe where copying can take over, unless the clip ends first
+            copy_start = min(keyframes.after(start), end)
+            pieces = []
+            if copy_start - start > TIME_TOLERANCE:
+                pieces.append(self._encode_head(video_path, start, copy_start, stream,
+                                                os.path.join(work_dir, 'head.mp4')))
+            if end - copy_start > TIME_TOLERANCE:
+                pieces.append(self._copy_tail(video_path, copy_start, end, os.path.join(work_dir, 'tail.mp4')))
+            tasks = [asyncio.create_task(piece) for piece in pieces]
+            try:
+                piece_paths = await asyncio.gather(*tasks)
+            except BaseException:
+                # The other piece still holds a pool slot and writes into work_dir; stop it before cleanup
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+            concat_file = os.path.join(work_dir, 'pieces.txt')
+            with open(concat_file, 'w', encoding='utf-8') as f:
+                for piece_path in piece_paths:
+                    f.write(f"file '{os.path.basename(piece_path)}'\n")
+            video = ffmpeg.input(concat_file, format='concat', safe=0)
+            source = ffmpeg.input(video_path, ss=start, t=end - start)
+            async with self.slot():
+                await run_ffmpeg(
+                    ffmpeg.output(video['v'], source['a?'], output_path, c='copy', video_track_timescale=timescale)
+                          .overwrite_output()
+                )
+        except (ffmpeg.Error, OSError, ValueError, KeyError, IndexError) as e:
+            if isinstance(e, ffmpeg.Error) and e.stderr:
+                e = e.stderr.decode('utf-8', 'replace').strip().splitlines()[-1]
+            logging.warning(f"Smart render of {video_path} {start}-{end} failed: {e}")
+            self.stats['fallbacks'] += 1
+            return None
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        elapsed = time.monotonic() - started
+        self.stats['renders'] += 1
+        self.stats['encoded_seconds'] += copy_start - start
+        self.stats['copied_seconds'] += end - copy_start
+        self.stats['seconds'] += elapsed
+        logging.info(f"Smart-rendered {video_path} {start}-{end}: {copy_start - start:.2f}s re-encoded, "
+                     f"{end - copy_start:.2f}s copied ({elapsed:.2f}s)")
+        return output_path
+
+    async def _encode_head(self, video_path: str, start: float, end: float, stream: dict, head_path: str) -> str:
+        source = ffmpeg.input(video_path, ss=start, t=end - start)
+        # Trimmed by timestamp rather than -t, which can round in the keyframe the tail starts with
+        video = (source['v:0']
+                 .filter('trim', end=round(end - start - HEAD_END_MARGIN, 6))
+                 .filter('setpts', 'PTS-STARTPTS'))
+        async with self.slot(self.threads or 1):
+            await run_ffmpeg(
+                ffmpeg.output(video, head_path, **head_encode_options(stream, self.threads))
+                      .overwrite_output()
+            )
+        return head_path
+
+    async def _copy_tail(self, video_path: str, start: float, end: float, tail_path: str) -> str:
+        # start is a keyframe, so the copy begins with a decodable frame and nothing before it
+        source = ffmpeg.input(video_path, ss=start, t=end - start)
+        async with self.slot():
+            await run_ffmpeg(ffmpeg.output(source['v:0'], tail_path, c='copy').overwrite_output())
+        return tail_path
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            'encoded_seconds': round(self.stats['encoded_seconds'], 2),
+            'copied_seconds': round(self.stats['copied_seconds'], 2),
+            'seconds': round(self.stats['seconds'], 2),
+        }
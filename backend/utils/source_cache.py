@@ -0,0 +1,220 @@
+import copy
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from yt_dlp import YoutubeDL
+
+
+class SourceCache:
+    """Disk cache of downloaded source videos shared by every job.
+
+    Files are named after the extractor's canonical video id and the selected
+    format, so the same video requested through different URLs (youtu.be,
+    watch?v=, shorts/...) resolves to the same entry. Entries are evicted
+    least-recently-used once the total size goes over max_bytes; entries that
+    a running job still holds are never evicted. Neither are entries held by
+    a file that depends on them (see hold()) for as long as that file
+    exists, which can keep the cache over max_bytes. Files derived from an
+    entry and named after it (NAME.*, such as its keyframe index) go with it.
+    """
+
+    def __init__(self, cache_dir: str = 'downloads/cache', max_bytes: int = 20 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.entries = {}
+        self.pins = {}
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'bytes_downloaded': 0,
+            'bytes_saved': 0,
+            'seconds_saved': 0.0,
+        }
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def ydl_opts(self, format_spec: str = 'best') -> dict:
+        """yt-dlp options that download straight into the cache directory"""
+        return {
+            'format': format_spec,
+            'quiet': True,
+            'no_warnings': True,
+            'outtmpl': os.path.join(self.cache_dir, '%(extractor_key)s_%(id)s_%(format_id)s.%(ext)s'),
+        }
+
+    def fetch(self, url: str, format_spec: str = 'best', info: dict = None):
+        """Return (video_path, info) for url, downloading only on a cache miss.
+
+        info may be metadata already probed for url; it is reused instead of
+        running the extractor again. The returned path is pinned until
+        release() is called with it.
+        """
+        with YoutubeDL(self.ydl_opts(format_spec)) as ydl:
+            if info is None:
+                info = ydl.extract_info(url, download=False)
+            else:
+                # Re-run format selection for format_spec on the probed metadata
+                info = ydl.process_ie_result(copy.deepcopy(info), download=False)
+            video_path = ydl.prepare_filename(info)
+            name = os.path.basename(video_path)
+
+            with self._key_lock(name):
+                if self._checkout(name, video_path):
+                    logging.info(f"Source cache hit: {name}")
+                    return video_path, info
+
+                logging.info(f"Source cache miss, downloading: {name}")
+                started = time.time()
+                ydl.process_ie_result(info, download=True)
+                self._insert(name, video_path, time.time() - started)
+
+        return video_path, info
+
+    def release(self, video_path: str):
+        """Drop a job's hold on a cached file so it becomes evictable again"""
+        if not video_path:
+            return
+        name = os.path.basename(video_path)
+        with self.lock:
+            if self.pins.get(name, 0) > 1:
+                self.pins[name] -= 1
+            else:
+                self.pins.pop(name, None)
+            self._evict()
+
+    def hold(self, video_path: str, holder_path: str) -> bool:
+        """Keep a cached file for as long as holder_path exists, across restarts; False if it is not cached.
+
+        For files that point into the source rather than copy it, such as
+        virtual clip manifests. drop() ends the hold early.
+        """
+        name = os.path.basename(video_path)
+        with self.lock:
+            entry = self.entries.get(name)
+            if not entry:
+                return False
+            holders = entry.setdefault('holders', [])
+            if holder_path not in holders:
+                holders.append(holder_path)
+                self._save_index()
+            return True
+
+    def drop(self, video_path: str, holder_path: str):
+        """End a hold(), making the cached file evictable again once nothing else holds it"""
+        name = os.path.basename(video_path)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry and holder_path in entry.get('holders', []):
+                entry['holders'].remove(holder_path)
+                self._evict()
+
+    def touch(self, video_path: str):
+        """Mark a cached file as just used, e.g. by a clip served from it, so it is evicted last"""
+        name = os.path.basename(video_path)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry:
+                entry['last_used'] = time.time()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'total_bytes': sum(e['size'] for e in self.entries.values()),
+                'held_entries': sum(1 for e in self.entries.values() if e.get('holders')),
+                'held_bytes': sum(e['size'] for e in self.entries.values() if e.get('holders')),
+                'max_bytes': self.max_bytes,
+            }
+
+    def _key_lock(self, name: str) -> threading.Lock:
+        # One lock per entry so concurrent misses on the same video download it once
+        with self.lock:
+            return self.key_locks.setdefault(name, threading.Lock())
+
+    def _checkout(self, name: str, video_path: str) -> bool:
+        with self.lock:
+            entry = self.entries.get(name)
+            if not entry or not os.path.exists(video_path):
+                self.entries.pop(name, None)
+                self.stats['misses'] += 1
+                return False
+            entry['last_used'] = time.time()
+            self.pins[name] = self.pins.get(name, 0) + 1
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += entry['size']
+            self.stats['seconds_saved'] += entry['download_seconds']
+            self._save_index()
+            return True
+
+    def _insert(self, name: str, video_path: str, download_seconds: float):
+        size = os.path.getsize(video_path)
+        with self.lock:
+            self.entries[name] = {
+                'size': size,
+                'last_used': time.time(),
+                'download_seconds': download_seconds,
+            }
+            self.pins[name] = self.pins.get(name, 0) + 1
+            self.stats['bytes_downloaded'] += size
+            self._evict()
+
+    def _evict(self):
+        """Delete least-recently-used unpinned entries until under max_bytes. Caller holds self.lock"""
+        total = sum(e['size'] for e in self.entries.values())
+        candidates = sorted(
+            (name for name in self.entries if name not in self.pins and not self._held(name)),
+            key=lambda name: self.entries[name]['last_used']
+        )
+        for name in candidates:
+            if total <= self.max_bytes:
+                break
+            entry = self.entries.pop(name)
+            total -= entry['size']
+            path = os.path.join(self.cache_dir, name)
+            for evicted_path in [path] + glob.glob(glob.escape(path) + '.*'):
+                try:
+                    os.remove(evicted_path)
+                except OSError as e:
+                    logging.error(f"Error evicting cached source {name}: {e}")
+            self.stats['evictions'] += 1
+            logging.info(f"Evicted cached source: {name} ({entry['size']} bytes)")
+        self._save_index()
+
+    def _held(self, name: str) -> bool:
+        """Whether any holder of the entry still exists; holders that are gone are forgotten. Caller holds self.lock"""
+        entry = self.entries[name]
+        if entry.get('holders'):
+            entry['holders'] = [path for path in entry['holders'] if os.path.exists(path)]
+        return bool(entry.get('holders'))
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            self.entries = {
+                name: entry for name, entry in entries.items()
+                if os.path.exists(os.path.join(self.cache_dir, name))
+            }
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading source cache index: {e}")
+
+    def _save_index(self):
+        try:
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logging.error(f"Error saving source cache index: {e}")
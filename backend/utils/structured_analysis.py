@@ -0,0 +1,202 @@
+import json
+import logging
+import re
+import threading
+from typing import Awaitable, Callable, List, Optional
+import google.generativeai as genai
+from typing_extensions import TypedDict
+from pydantic import BaseModel, Field, ValidationError, ValidationInfo, field_validator, model_validator
+
+from utils.gemini_parser import parse_platforms, parse_timestamp
+
+# Bump when STRUCTURED_OUTPUT_FORMAT or the repair prompt changes so cached analyses are not reused
+STRUCTURED_PROMPT_VERSION = 'structured-v1'
+
+STRUCTURED_OUTPUT_FORMAT = """Reply with a JSON array with one object per moment:
+        start, end: where the clip starts and ends in the video, as MM:SS (or H:MM:SS past the first hour)
+        description: what happens in this clip
+        viral_potential: an integer from 1 to 10
+        platforms: the social platforms it suits best"""
+
+# Slack allowed past the known duration before an end time is rejected
+DURATION_TOLERANCE_SECONDS = 2
+
+
+# response_schema handed to Gemini. A docstring here would be sent along as the schema
+# description, and the SDK needs typing_extensions.TypedDict before Python 3.12
+class ClipSchema(TypedDict):
+    start: str
+    end: str
+    description: str
+    viral_potential: int
+    platforms: List[str]
+
+
+def structured_generation_config() -> genai.GenerationConfig:
+    return genai.GenerationConfig(response_mime_type="application/json", response_schema=list[ClipSchema])
+
+
+class ClipSuggestion(BaseModel):
+    """One moment from a structured response, checked against the video it describes"""
+    start: float
+    end: float
+    original_end: str = ''
+    description: str = Field(min_length=1)
+    viral_potential: int = Field(ge=1, le=10)
+    platforms: List[str] = []
+
+    @model_validator(mode='before')
+    @classmethod
+    def keep_original_end(cls, data):
+        if isinstance(data, dict) and 'end' in data:
+            data = {**data, 'original_end': str(data['end'])}
+        return data
+
+    @field_validator('start', 'end', mode='before')
+    @classmethod
+    def parse_times(cls, value):
+        # ValueError becomes a validation error on this entry; anything else would fail the whole reply
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError(f"expected MM:SS or H:MM:SS, got {value!r}")
+        return parse_timestamp(value)
+
+    @field_validator('platforms', mode='before')
+    @classmethod
+    def split_platforms(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return parse_platforms(value)
+        if not isinstance(value, list) or not all(isinstance(p, str) for p in value if p is not None):
+            raise ValueError(f"expected a list of platform names, got {value!r}")
+        return [p.strip() for p in value if p and p.strip()]
+
+    @model_validator(mode='after')
+    def check_range(self, info: ValidationInfo):
+        if self.end <= self.start:
+            raise ValueError(f"end ({self.original_end}) is not after start")
+        duration = (info.context or {}).get('duration')
+        if duration and self.end > duration + DURATION_TOLERANCE_SECONDS:
+            raise ValueError(f"end ({self.original_end}) is past the end of the video ({duration:.0f}s)")
+        return self
+
+    def to_clip(self) -> dict:
+        """Clip dict in the shape parse_gemini_response produces"""
+        def seconds(value: float):
+            return int(value) if value == int(value) else value
+        return {
+            'start_time': seconds(self.start),
+            'end_time': seconds(self.end),
+            'original_end': self.original_end,
+            'description': self.description.strip(),
+            'viral_potential': self.viral_potential,
+            'platforms': self.platforms,
+        }
+
+
+def parse_structured_response(response_text: str, duration: Optional[float] = None) -> tuple:
+    """Validate a JSON reply; returns (clips, errors) where errors lists what to re-ask for.
+
+    Each error is (item, message); item is None when the reply as a whole
+    could not be used.
+    """
+    text = response_text.strip()
+    # JSON mode should not add code fences, but strip them if it does
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text)
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError as e:
+        return [], [(None, f"reply is not valid JSON: {e}")]
+    if isinstance(items, dict):
+        items = items.get('clips', [items])
+    if not isinstance(items, list):
+        return [], [(None, "reply is not a JSON array")]
+
+    clips, errors = [], []
+    for item in items:
+        try:
+            clips.append(ClipSuggestion.model_validate(item, context={'duration': duration}).to_clip())
+        except ValidationError as e:
+            problems = '; '.join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'clip'}: {error['msg']}" for error in e.errors()
+            )
+            errors.append((item, problems))
+    return clips, errors
+
+
+def build_repair_prompt(errors: list) -> str:
+    """Follow-up asking the model to redo only the entries that failed validation"""
+    if any(item is None for item, _ in errors):
+        problems = '; '.join(message for item, message in errors if item is None)
+        return f"""Your reply could not be used: {problems}.
+        Reply again with the complete JSON array only."""
+
+    entries = '\n        '.join(f"- {json.dumps(item)}: {message}" for item, message in errors)
+    return f"""These entries from your reply are invalid:
+        {entries}
+
+        Reply with a JSON array containing corrected versions of only these entries, in the same format.
+        Leave out any entry that cannot be corrected."""
+
+
+async def analyze_structured(generate: Callable[[list], Awaitable], parts: list,
+                             duration: Optional[float] = None, max_retries: int = 2) -> tuple:
+    """Run a structured analysis, re-asking only for invalid entries up to max_retries times.
+
+    generate(contents) sends a multi-turn contents list to Gemini and returns
+    the response. Returns (response_text, clips, retries, dropped): entries
+    still invalid once the retry budget is spent are dropped, not fatal.
+    """
+    contents = [{'role': 'user', 'parts': parts}]
+    response = await generate(contents)
+    responses = [response.text]
+    clips, errors = parse_structured_response(response.text, duration)
+
+    retries = 0
+    while errors and retries < max_retries:
+        retries += 1
+        logging.info(f"Structured response had {len(errors)} invalid entries, re-asking (retry {retries})")
+        contents = contents + [
+            {'role': 'model', 'parts': [response.text]},
+            {'role': 'user', 'parts': [build_repair_prompt(errors)]},
+        ]
+        response = await generate(contents)
+        responses.append(response.text)
+        repaired, errors = parse_structured_response(response.text, duration)
+        clips.extend(repaired)
+
+    for item, message in errors:
+        logging.warning(f"Dropping invalid clip {item}: {message}")
+    clips.sort(key=lambda clip: clip['start_time'])
+    return '\n\n'.join(responses), clips, retries, len(errors)
+
+
+class ParseStats:
+    """How often analyses come back with nothing usable, per response format"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.modes = {}
+
+    def _mode(self, mode: str) -> dict:
+        return self.modes.setdefault(mode, {'jobs': 0, 'wasted_jobs': 0, 'retries': 0, 'dropped_clips': 0})
+
+    def record_attempt(self, mode: str, retries: int, dropped: int):
+        with self.lock:
+            stats = self._mode(mode)
+            stats['retries'] += retries
+            stats['dropped_clips'] += dropped
+
+    def record_job(self, mode: str, clip_count: int):
+        with self.lock:
+            stats = self._mode(mode)
+            stats['jobs'] += 1
+            if clip_count == 0:
+                stats['wasted_jobs'] += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                mode: {**stats, 'wasted_rate': stats['wasted_jobs'] / stats['jobs'] if stats['jobs'] else 0.0}
+                for mode, stats in self.modes.items()
+            }
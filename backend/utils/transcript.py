@@ -0,0 +1,117 @@
+import json
+import logging
+import re
+from typing import Optional
+from yt_dlp import YoutubeDL
+
+# Bump when build_transcript_prompt changes so cached analyses are not reused
+TRANSCRIPT_PROMPT_VERSION = 'transcript-v1'
+
+# Caption formats we know how to read, in order of preference
+SUPPORTED_FORMATS = ('json3', 'vtt')
+
+VTT_CUE_PATTERN = re.compile(r'(?:(\d+):)?(\d{2}):(\d{2})\.\d{3}\s+-->')
+VTT_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+def format_timestamp(seconds: float) -> str:
+    """Format seconds as MM:SS, or H:MM:SS past the hour"""
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def pick_captions(info: dict) -> Optional[dict]:
+    """Choose the best caption track from extract_info metadata.
+
+    Uploaded subtitles win over automatic captions; within each, the video's
+    own language is preferred, then English.
+    """
+    languages = [lang for lang in (info.get('language'), 'en') if lang]
+    for source in ('subtitles', 'automatic_captions'):
+        tracks = info.get(source) or {}
+        candidates = [lang for lang in languages if lang in tracks]
+        candidates += [lang for lang in tracks if lang.startswith('en') and lang not in candidates]
+        if source == 'subtitles':
+            candidates += [lang for lang in tracks if lang not in candidates]
+        for lang in candidates:
+            for ext in SUPPORTED_FORMATS:
+                for track in tracks[lang]:
+                    if track.get('ext') == ext and track.get('url'):
+                        logging.info(f"Using {source} track '{lang}' ({ext})")
+                        return track
+    return None
+
+
+def parse_json3(data: str) -> list:
+    """Parse YouTube json3 captions into (start_seconds, text) pairs"""
+    lines = []
+    for event in json.loads(data).get('events', []):
+        text = ''.join(seg.get('utf8', '') for seg in event.get('segs') or []).strip()
+        if text:
+            lines.append((event.get('tStartMs', 0) / 1000, ' '.join(text.split())))
+    return lines
+
+
+def parse_vtt(data: str) -> list:
+    """Parse WebVTT captions into (start_seconds, text) pairs"""
+    lines = []
+    start = None
+    for line in data.splitlines():
+        cue = VTT_CUE_PATTERN.match(line)
+        if cue:
+            hours, minutes, seconds = cue.groups()
+            start = int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+            continue
+        text = VTT_TAG_PATTERN.sub('', line).strip()
+        if start is None or not text:
+            continue
+        # Automatic captions repeat the previous line as they roll
+        if lines and lines[-1][1] == text:
+            continue
+        lines.append((start, text))
+    return lines
+
+
+def fetch_transcript(info: dict) -> Optional[str]:
+    """Return a timestamped transcript for the video, or None if it has no captions"""
+    track = pick_captions(info)
+    if not track:
+        return None
+
+    try:
+        with YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+            data = ydl.urlopen(track['url']).read().decode('utf-8')
+        lines = parse_json3(data) if track['ext'] == 'json3' else parse_vtt(data)
+    except Exception as e:
+        logging.error(f"Error fetching transcript: {e}")
+        return None
+
+    if not lines:
+        return None
+    logging.info(f"Fetched transcript with {len(lines)} lines")
+    return '\n'.join(f"[{format_timestamp(start)}] {text}" for start, text in lines)
+
+
+def build_transcript_prompt(transcript: str, output_format: str = None) -> str:
+    """Prompt asking Gemini to pick clips from a timestamped transcript"""
+    output_format = output_format or """For each moment, provide the information in EXACTLY this format:
+
+        MM:SS - MM:SS
+        Description: [Describe what happens in this clip]
+        Viral Potential: [Rate from 1-10]
+        Best Platforms: [List suitable social platforms]"""
+    return f"""Analyze this timestamped video transcript and identify the most engaging moments.
+        Each line starts with the time it is spoken in the video.
+        {output_format}
+
+        Keep clips between 1-5 minutes long.
+        Let them make sense in context of the video.
+        Start and end clips on the transcript timestamps, at the start of a sentence.
+        Focus on moments that would be engaging on social media.
+
+        Transcript:
+        {transcript}"""
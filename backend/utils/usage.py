@@ -0,0 +1,108 @@
+import threading
+from typing import Optional
+
+# Pay-as-you-go USD per million tokens: (prompts up to LONG_PROMPT_TOKENS, longer prompts)
+GEMINI_PRICING = {
+    'gemini-1.5-flash': {'input': (0.075, 0.15), 'output': (0.30, 0.60), 'cached': (0.01875, 0.0375)},
+    'gemini-1.5-pro': {'input': (1.25, 2.50), 'output': (5.00, 10.00), 'cached': (0.3125, 0.625)},
+}
+LONG_PROMPT_TOKENS = 128_000
+
+USAGE_FIELDS = ('calls', 'prompt_tokens', 'candidates_tokens', 'cached_tokens', 'total_tokens',
+                'uploads', 'upload_bytes', 'cost_usd')
+
+
+def estimate_cost(model: str, prompt_tokens: int, candidates_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """List-price cost of one generate call in USD, or None for a model without pricing"""
+    prices = GEMINI_PRICING.get(model)
+    if not prices:
+        return None
+    band = 1 if prompt_tokens > LONG_PROMPT_TOKENS else 0
+    return ((prompt_tokens - cached_tokens) * prices['input'][band]
+            + cached_tokens * prices['cached'][band]
+            + candidates_tokens * prices['output'][band]) / 1_000_000
+
+
+class JobUsage:
+    """Every Gemini call and upload made for one job"""
+
+    def __init__(self):
+        self.calls = []
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.reused_uploads = 0
+        self.cached_analysis = False
+
+    def record_generate(self, model: str, usage_metadata):
+        prompt_tokens = usage_metadata.prompt_token_count
+        candidates_tokens = usage_metadata.candidates_token_count
+        cached_tokens = usage_metadata.cached_content_token_count
+        self.calls.append({
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'candidates_tokens': candidates_tokens,
+            'cached_tokens': cached_tokens,
+            'total_tokens': usage_metadata.total_token_count,
+            'cost_usd': estimate_cost(model, prompt_tokens, candidates_tokens, cached_tokens),
+        })
+
+    def record_upload(self, upload_bytes: int, reused: bool = False):
+        if reused:
+            self.reused_uploads += 1
+            return
+        self.uploads += 1
+        self.upload_bytes += upload_bytes
+
+    def to_dict(self) -> dict:
+        totals = {
+            field: sum(call[field] for call in self.calls)
+            for field in ('prompt_tokens', 'candidates_tokens', 'cached_tokens', 'total_tokens')
+        }
+        return {
+            'models': sorted({call['model'] for call in self.calls}),
+            'calls': len(self.calls),
+            **totals,
+            'uploads': self.uploads,
+            'upload_bytes': self.upload_bytes,
+            'reused_uploads': self.reused_uploads,
+            'cached_analysis': self.cached_analysis,
+            'cost_usd': round(sum(call['cost_usd'] or 0 for call in self.calls), 6),
+            'call_details': list(self.calls),
+        }
+
+    def to_markdown(self) -> str:
+        usage = self.to_dict()
+        lines = [
+            "## Gemini Usage",
+            "",
+            f"Model: {', '.join(usage['models']) or 'none'}",
+            f"Calls: {usage['calls']}" + (" (analysis served from cache)" if usage['cached_analysis'] else ""),
+            f"Prompt Tokens: {usage['prompt_tokens']} ({usage['cached_tokens']} cached)",
+            f"Response Tokens: {usage['candidates_tokens']}",
+            f"Uploads: {usage['uploads']} ({usage['upload_bytes']} bytes), {usage['reused_uploads']} reused",
+            f"Estimated Cost: ${usage['cost_usd']:.4f}",
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+class UsageLedger:
+    """Running Gemini usage per subscription tier.
+
+    Only aggregates are kept, since they are published on /metrics; per-user
+    usage is stored with each job's video_history row instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_tier = {}
+
+    def record(self, tier: Optional[str], usage: dict):
+        with self.lock:
+            totals = self.by_tier.setdefault(tier or 'unknown', {})
+            totals['jobs'] = totals.get('jobs', 0) + 1
+            for field in USAGE_FIELDS:
+                totals[field] = totals.get(field, 0) + usage[field]
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {'by_tier': {tier: dict(totals) for tier, totals in self.by_tier.items()}}
@@ -0,0 +1,596 @@
+import bisect
+import collections
+import itertools
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from typing import Callable, Optional
+
+# Bump when the manifest layout changes
+VIRTUAL_CLIP_VERSION = 1
+# Written where the clip's MP4 would be, e.g. clips/Title_job/clip_1_61_131.mp4.virtual.json
+MANIFEST_SUFFIX = '.virtual.json'
+
+# Parsed sources and built clip headers kept in memory between the range requests of a preview
+SOURCE_CACHE_SIZE = 4
+CLIP_CACHE_SIZE = 64
+READ_CHUNK_BYTES = 256 * 1024
+
+# Tracks a virtual clip keeps; timecode, text and data tracks are dropped
+KEPT_HANDLERS = {b'vide', b'soun'}
+
+
+def iter_boxes(data, start: int = 0, end: Optional[int] = None):
+    """(type, box_start, payload_start, box_end) of each box in data[start:end]"""
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, start)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, start + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header or start + size > end:
+            raise ValueError(f"Truncated {kind.decode('latin-1')} box")
+        yield kind, start, start + header, start + size
+        start += size
+
+
+def child_boxes(data, start: int, end: int) -> dict:
+    """The first box of each type directly inside data[start:end]"""
+    boxes = {}
+    for kind, box_start, payload_start, box_end in iter_boxes(data, start, end):
+        boxes.setdefault(kind, (box_start, payload_start, box_end))
+    return boxes
+
+
+def box(kind: bytes, *payloads: bytes) -> bytes:
+    body = b''.join(payloads)
+    return struct.pack('>I4s', 8 + len(body), kind) + body
+
+
+def full_box(kind: bytes, version: int, *payloads: bytes) -> bytes:
+    return box(kind, struct.pack('>I', version << 24), *payloads)
+
+
+def big_endian_array(typecode: str, data) -> array:
+    values = array(typecode, bytes(data))
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+
+def with_duration(data, box_start: int, payload_start: int, box_end: int, duration: int) -> bytes:
+    """A copy of an mvhd, tkhd or mdhd box with its duration replaced"""
+    version = data[payload_start]
+    raw = bytearray(data[box_start:box_end])
+    offset = payload_start - box_start
+    if version == 1:
+        # tkhd has a track_ID and a reserved word where the others have a timescale
+        at = offset + 4 + 16 + (8 if data[box_start + 4:box_start + 8] == b'tkhd' else 4)
+        struct.pack_into('>Q', raw, at, duration)
+    else:
+        at = offset + 4 + 8 + (8 if data[box_start + 4:box_start + 8] == b'tkhd' else 4)
+        struct.pack_into('>I', raw, at, min(duration, 0xFFFFFFFF))
+    return bytes(raw)
+
+
+def run_lengths(values) -> list:
+    return [(sum(1 for _ in group), value) for value, group in itertools.groupby(values)]
+
+
+class Mp4Track:
+    """One track of a progressive MP4, its sample tables expanded to one entry per sample.
+
+    dts has one more entry than there are samples: the end of the last one.
+    Times are in the track's timescale; media_time and empty_seconds come
+    from its edit list.
+    """
+
+    def __init__(self, moov: bytes, boxes: dict, timescale: int, dts: array, cts: Optional[array],
+                 sizes: array, offsets: array, sync: Optional[array], media_time: int, empty_seconds: float):
+        self.moov = moov
+        self.boxes = boxes
+        self.timescale = timescale
+        self.dts = dts
+        self.cts = cts
+        self.sizes = sizes
+        self.offsets = offsets
+        self.sync = sync
+        self.media_time = media_time
+        self.empty_seconds = empty_seconds
+        # Presentation times of the samples a clip can start on, to search by time
+        starts = range(len(sizes)) if sync is None else sync
+        self.sync_times = array('q', (dts[i] + (cts[i] if cts else 0) for i in starts))
+
+    def first_seconds(self) -> float:
+        """When the track's first frame is presented"""
+        first = min(self.dts[i] + (self.cts[i] if self.cts else 0) for i in range(min(16, len(self.sizes))))
+        return self.empty_seconds + (first - self.media_time) / self.timescale
+
+    def ticks(self, seconds: float) -> int:
+        """A presentation time in seconds as a media time of this track"""
+        return round((seconds - self.empty_seconds) * self.timescale) + self.media_time
+
+    def sample_range(self, start: int, end: int) -> tuple:
+        """Samples [first, last) to present start-end, from the last sync sample at or before start"""
+        position = max(0, bisect.bisect_right(self.sync_times, start) - 1)
+        first = position if self.sync is None else self.sync[position]
+        if self.cts is None:
+            last = bisect.bisect_left(self.dts, end, 0, len(self.sizes))
+        else:
+            # With reordered frames the clip runs to the next sync sample so every frame before end is decodable
+            position = bisect.bisect_left(self.sync_times, end)
+            last = len(self.sizes) if position >= len(self.sync_times) else (
+                position if self.sync is None else self.sync[position])
+        return first, max(first, last)
+
+
+def parse_track(moov: bytes, start: int, end: int, movie_timescale: int) -> Optional[Mp4Track]:
+    trak = child_boxes(moov, start, end)
+    mdia = child_boxes(moov, *trak[b'mdia'][1:])
+    _, payload, _ = mdia[b'hdlr']
+    if moov[payload + 8:payload + 12] not in KEPT_HANDLERS:
+        return None
+    minf = child_boxes(moov, *mdia[b'minf'][1:])
+    stbl = child_boxes(moov, *minf[b'stbl'][1:])
+
+    _, payload, _ = mdia[b'mdhd']
+    version = moov[payload]
+    timescale = struct.unpack_from('>I', moov, payload + (20 if version == 1 else 12))[0]
+
+    _, payload, _ = stbl[b'stsd']
+    if struct.unpack_from('>I', moov, payload + 4)[0] != 1:
+        raise ValueError("Tracks with several sample descriptions are not supported")
+
+    if b'stsz' not in stbl:
+        raise ValueError("Only stsz sample sizes are supported")
+    _, payload, _ = stbl[b'stsz']
+    sample_size, count = struct.unpack_from('>II', moov, payload + 4)
+    if sample_size:
+        sizes = array('I', [sample_size]) * count
+    else:
+        sizes = big_endian_array('I', moov[payload + 12:payload + 12 + 4 * count])
+    if not count:
+        return None
+
+    _, payload, _ = stbl[b'stts']
+    entries = struct.iter_unpack('>II', moov[payload + 8:payload + 8 + 8 * struct.unpack_from('>I', moov, payload + 4)[0]])
+    dts = array('q', itertools.accumulate(
+        itertools.chain.from_iterable(itertools.repeat(delta, run) for run, delta in entries), initial=0))
+
+    cts = None
+    if b'ctts' in stbl:
+        _, payload, _ = stbl[b'ctts']
+        entries = struct.iter_unpack('>Ii', moov[payload + 8:payload + 8 + 8 * struct.unpack_from('>I', moov, payload + 4)[0]])
+        cts = array('q', itertools.chain.from_iterable(itertools.repeat(offset, run) for run, offset in entries))
+
+    sync = None
+    if b'stss' in stbl:
+        _, payload, _ = stbl[b'stss']
+        entry_count = struct.unpack_from('>I', moov, payload + 4)[0]
+        sync = array('q', (number - 1 for number in big_endian_array('I', moov[payload + 8:payload + 8 + 4 * entry_count])))
+
+    if b'stco' in stbl:
+        _, payload, _ = stbl[b'stco']
+        entry_count = struct.unpack_from('>I', moov, payload + 4)[0]
+        chunk_offsets = big_endian_array('I', moov[payload + 8:payload + 8 + 4 * entry_count])
+    else:
+        _, payload, _ = stbl[b'co64']
+        entry_count = struct.unpack_from('>I', moov, payload + 4)[0]
+        chunk_offsets = big_endian_array('Q', moov[payload + 8:payload + 8 + 8 * entry_count])
+    _, payload, _ = stbl[b'stsc']
+    chunks = list(struct.iter_unpack('>III', moov[payload + 8:payload + 8 + 12 * struct.unpack_from('>I', moov, payload + 4)[0]]))
+    offsets = array('Q')
+    sample = 0
+    for index, (first_chunk, per_chunk, _) in enumerate(chunks):
+        last_chunk = chunks[index + 1][0] - 1 if index + 1 < len(chunks) else len(chunk_offsets)
+        for chunk in range(first_chunk - 1, last_chunk):
+            offset = chunk_offsets[chunk]
+            for _ in range(per_chunk):
+                offsets.append(offset)
+                offset += sizes[sample]
+                sample += 1
+    if len(offsets) != count or len(dts) != count + 1 or (cts is not None and len(cts) != count):
+        raise ValueError("Sample tables disagree on the number of samples")
+
+    # An initial empty edit delays the track; the first media edit says where its media starts
+    media_time, empty_seconds = 0, 0.0
+    if b'edts' in trak:
+        edts = child_boxes(moov, *trak[b'edts'][1:])
+        if b'elst' in edts:
+            _, payload, _ = edts[b'elst']
+            version = moov[payload]
+            entry_format = '>QqI' if version == 1 else '>IiI'
+            entry_size = struct.calcsize(entry_format)
+            for index in range(struct.unpack_from('>I', moov, payload + 4)[0]):
+                duration, edit_time, _ = struct.unpack_from(entry_format, moov, payload + 8 + index * entry_size)
+                if edit_time == -1:
+                    empty_seconds += duration / movie_timescale
+                else:
+                    media_time = edit_time
+                    break
+
+    return Mp4Track(moov, {b'tkhd': trak[b'tkhd'], b'mdhd': mdia[b'mdhd'], b'hdlr': mdia[b'hdlr'],
+                           b'minf': mdia[b'minf'], b'stsd': stbl[b'stsd']}, timescale,
+                    dts, cts, sizes, offsets, sync, media_time, empty_seconds)
+
+
+class Mp4Source:
+    """The ftyp and moov of a progressive (not fragmented) MP4, with its tracks' sample tables"""
+
+    def __init__(self, video_path: str):
+        self.video_path = video_path
+        ftyp = moov = None
+        with open(video_path, 'rb') as f:
+            position, size = 0, os.fstat(f.fileno()).st_size
+            while position + 8 <= size and moov is None:
+                f.seek(position)
+                header = f.read(16)
+                box_size, kind = struct.unpack_from('>I4s', header)
+                if box_size == 1:
+                    box_size = struct.unpack_from('>Q', header, 8)[0]
+                elif box_size == 0:
+                    box_size = size - position
+                if box_size < 8:
+                    raise ValueError(f"Corrupt box in {video_path}")
+                if kind in (b'ftyp', b'moov'):
+                    f.seek(position)
+                    data = f.read(box_size)
+                    if kind == b'ftyp':
+                        ftyp = data
+                    else:
+                        moov = data
+                position += box_size
+        if ftyp is None or moov is None:
+            raise ValueError(f"{video_path} is not an MP4 with a moov box")
+        self.ftyp = ftyp
+        self.moov = moov
+
+        boxes = child_boxes(moov, 8, len(moov))
+        if b'mvex' in boxes:
+            raise ValueError(f"{video_path} is a fragmented MP4")
+        self.tracks = []
+        try:
+            self.mvhd = boxes[b'mvhd']
+            version = moov[self.mvhd[1]]
+            self.timescale, duration = struct.unpack_from(
+                '>IQ' if version == 1 else '>II', moov, self.mvhd[1] + (20 if version == 1 else 12))
+            self.duration = duration / self.timescale
+            for kind, _, payload_start, box_end in iter_boxes(moov, 8, len(moov)):
+                if kind == b'trak':
+                    track = parse_track(moov, payload_start, box_end, self.timescale)
+                    if track:
+                        self.tracks.append(track)
+        except (KeyError, IndexError, struct.error) as e:
+            raise ValueError(f"Unsupported sample tables in {video_path}: {e!r}")
+        if not self.tracks:
+            raise ValueError(f"No audio or video samples in {video_path}")
+        # Clip times are relative to the earliest track, as for ffmpeg's -ss
+        self.start_seconds = min(track.first_seconds() for track in self.tracks)
+
+
+class VirtualClip:
+    """A clip as an MP4 header built for it followed by byte ranges of its source"""
+
+    def __init__(self, video_path: str, header: bytes, ranges: list):
+        self.video_path = video_path
+        self.header = header
+        self.ranges = ranges
+        self.size = len(header) + sum(length for _, length in ranges)
+
+    def iter_bytes(self, first: int, last: int):
+        """The clip's bytes first through last, inclusive"""
+        if first < len(self.header):
+            yield self.header[first:last + 1]
+        position = len(self.header)
+        with open(self.video_path, 'rb') as f:
+            for source_offset, length in self.ranges:
+                if position > last:
+                    break
+                skip = max(0, first - position)
+                if skip < length:
+                    remaining = min(length, last + 1 - position) - skip
+                    f.seek(source_offset + skip)
+                    while remaining > 0:
+                        chunk = f.read(min(READ_CHUNK_BYTES, remaining))
+                        if not chunk:
+                            raise OSError(f"{self.video_path} is shorter than its index")
+                        remaining -= len(chunk)
+                        yield chunk
+                position += length
+
+
+def build_virtual_clip(source: Mp4Source, start: float, end: float) -> VirtualClip:
+    """An MP4 presenting start-end of source whose samples are read from the source as they are.
+
+    Each track is cut on a sync sample at or before start, and its edit
+    list skips to start exactly, so players show the clip from the
+    requested frame without anything being re-encoded.
+    """
+    end = min(end, source.duration)
+    if end <= start:
+        raise ValueError(f"Clip {start}-{end} is outside the source")
+    selected = []
+    for track in source.tracks:
+        first_tick = track.ticks(start + source.start_seconds)
+        first, last = track.sample_range(first_tick, track.ticks(end + source.start_seconds))
+        if last > first:
+            selected.append((track, first, last, first_tick - track.dts[first]))
+    if not selected:
+        raise ValueError(f"No samples between {start} and {end}")
+
+    # The payload is the source bytes holding the selected samples, with adjacent samples read as one range
+    spans = sorted({(track.offsets[i], track.sizes[i]) for track, first, last, _ in selected for i in range(first, last)})
+    ranges = []
+    for offset, size in spans:
+        if ranges and offset <= ranges[-1][0] + ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], offset + size - ranges[-1][0])
+        else:
+            ranges.append([offset, size])
+    range_starts = [offset for offset, _ in ranges]
+    range_positions = list(itertools.accumulate((length for _, length in ranges), initial=0))
+    payload_size = range_positions[-1]
+
+    def payload_position(offset: int) -> int:
+        index = bisect.bisect_right(range_starts, offset) - 1
+        return range_positions[index] + offset - range_starts[index]
+
+    moov = source.moov
+    movie_duration = round((end - start) * source.timescale)
+    tracks = []
+    for track, first, last, media_time in selected:
+        # Consecutive samples that stay adjacent in the payload share a chunk
+        chunk_positions, chunk_samples, chunk_end = [], [], None
+        for i in range(first, last):
+            position = payload_position(track.offsets[i])
+            if position == chunk_end:
+                chunk_samples[-1] += 1
+            else:
+                chunk_positions.append(position)
+                chunk_samples.append(1)
+            chunk_end = position + track.sizes[i]
+        sample_to_chunk, chunk_number = [], 1
+        for run, samples in run_lengths(chunk_samples):
+            sample_to_chunk.append(struct.pack('>III', chunk_number, samples, 1))
+            chunk_number += run
+
+        deltas = [track.dts[i + 1] - track.dts[i] for i in range(first, last)]
+        tables = [moov[slice(*track.boxes[b'stsd'][::2])]]
+        time_to_sample = run_lengths(deltas)
+        tables.append(full_box(b'stts', 0, struct.pack('>I', len(time_to_sample)),
+                               *(struct.pack('>II', run, delta) for run, delta in time_to_sample)))
+        if track.cts is not None:
+            offsets = run_lengths(track.cts[first:last])
+            tables.append(full_box(b'ctts', 1, struct.pack('>I', len(offsets)),
+                                   *(struct.pack('>Ii', run, offset) for run, offset in offsets)))
+        if track.sync is not None:
+            numbers = [i - first + 1 for i in track.sync[bisect.bisect_left(track.sync, first):bisect.bisect_left(track.sync, last)]]
+            tables.append(full_box(b'stss', 0, struct.pack('>I', len(numbers)), struct.pack(f'>{len(numbers)}I', *numbers)))
+        tables.append(full_box(b'stsc', 0, struct.pack('>I', len(sample_to_chunk)), *sample_to_chunk))
+        sizes = track.sizes[first:last]
+        tables.append(full_box(b'stsz', 0, struct.pack('>II', 0, len(sizes)), struct.pack(f'>{len(sizes)}I', *sizes)))
+        # Payload positions for now; moved past the header once its size is known
+        tables.append((b'co64', chunk_positions))
+
+        # A track starting after the clip does gets an empty edit for the gap
+        edits = []
+        if media_time < 0:
+            edits.append(struct.pack('>Qqi', round(-media_time / track.timescale * source.timescale), -1, 1 << 16))
+            media_time = 0
+        edits.append(struct.pack('>Qqi', movie_duration, media_time, 1 << 16))
+        edts = box(b'edts', full_box(b'elst', 1, struct.pack('>I', len(edits)), *edits))
+
+        media_header = [moov[box_start:box_end] for kind, box_start, _, box_end in iter_boxes(moov, *track.boxes[b'minf'][1:])
+                        if kind in (b'vmhd', b'smhd', b'dinf')]
+        tracks.append((
+            with_duration(moov, *track.boxes[b'tkhd'], movie_duration),
+            edts,
+            with_duration(moov, *track.boxes[b'mdhd'], track.dts[last] - track.dts[first]),
+            moov[slice(*track.boxes[b'hdlr'][::2])],
+            media_header,
+            tables,
+        ))
+
+    def build_moov(payload_start: int) -> bytes:
+        traks = []
+        for tkhd, edts, mdhd, hdlr, media_header, tables in tracks:
+            stbl = [table if isinstance(table, bytes) else full_box(
+                b'co64', 0, struct.pack('>I', len(table[1])), *(struct.pack('>Q', payload_start + p) for p in table[1]))
+                for table in tables]
+            traks.append(box(b'trak', tkhd, edts, box(b'mdia', mdhd, hdlr, box(b'minf', *media_header, box(b'stbl', *stbl)))))
+        return box(b'moov', with_duration(moov, *source.mvhd, movie_duration), *traks)
+
+    mdat_header = (struct.pack('>I4s', 8 + payload_size, b'mdat') if 8 + payload_size <= 0xFFFFFFFF
+                   else struct.pack('>I4sQ', 1, b'mdat', 16 + payload_size))
+    # Chunk offsets are fixed-width, so the moov is the same size whatever they hold
+    payload_start = len(source.ftyp) + len(build_moov(0)) + len(mdat_header)
+    header = source.ftyp + build_moov(payload_start) + mdat_header
+    return VirtualClip(source.video_path, header, [(offset, length) for offset, length in ranges])
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """(first, last) of a single-range Range header, None to send everything; ValueError if unsatisfiable.
+
+    Malformed headers and multiple ranges get None, so the whole clip is
+    sent as if there had been no Range header.
+    """
+    match = re.fullmatch(r'bytes=\s*(\d*)-(\d*)', header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise ValueError(header)
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+class VirtualClipStore:
+    """Clips kept as a manifest of their source and times instead of a cut MP4.
+
+    create() writes the manifest where the clip's file would be; open()
+    builds the clip's MP4 header from the source's sample tables so it can
+    be served straight from the source, and materialize() writes it out as
+    a regular file when it is downloaded or exported. touch(video_path) is
+    called whenever a clip is served so the source stays in its cache, and
+    hold(video_path, manifest_path) when a clip is created so the cache
+    keeps the source for as long as the manifest exists; materialize()
+    ends that with drop(video_path, manifest_path).
+    """
+
+    def __init__(self, touch: Optional[Callable[[str], None]] = None,
+                 hold: Optional[Callable[[str, str], bool]] = None,
+                 drop: Optional[Callable[[str, str], None]] = None):
+        self.touch = touch
+        self.hold = hold
+        self.drop = drop
+        self.lock = threading.Lock()
+        # Held while a source is parsed, so clips created at once share one parse
+        self.parse_lock = threading.Lock()
+        self.sources = collections.OrderedDict()
+        self.clips = collections.OrderedDict()
+        self.stats = {
+            'created': 0, 'unsupported': 0, 'opened': 0, 'missing_source': 0, 'materialized': 0,
+            'bytes_served': 0, 'parsed': 0, 'parse_seconds': 0.0,
+        }
+
+    def create(self, output_path: str, video_path: str, start: float, end: float) -> bool:
+        """Record output_path as a virtual clip; False if the source cannot be served that way"""
+        video_path = os.path.abspath(video_path)
+        manifest_path = os.path.abspath(output_path + MANIFEST_SUFFIX)
+        try:
+            self._clip(video_path, start, end)
+            tmp_path = manifest_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': VIRTUAL_CLIP_VERSION, 'source': video_path, 'start': start, 'end': end}, f)
+            os.replace(tmp_path, manifest_path)
+            if self.hold and not self.hold(video_path, manifest_path):
+                os.remove(manifest_path)
+                raise ValueError(f"{video_path} is not in the source cache")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Cannot keep {output_path} as a virtual clip: {e}")
+            with self.lock:
+                self.stats['unsupported'] += 1
+            return False
+        with self.lock:
+            self.stats['created'] += 1
+        return True
+
+    def manifest(self, output_path: str) -> Optional[dict]:
+        """The manifest of a virtual clip, or None if output_path is not one"""
+        try:
+            with open(output_path + MANIFEST_SUFFIX, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading virtual clip {output_path}: {e}")
+            return None
+        return manifest if manifest.get('version') == VIRTUAL_CLIP_VERSION else None
+
+    def open(self, output_path: str) -> Optional[VirtualClip]:
+        """The virtual clip at output_path, None if there is none; FileNotFoundError once its source is gone"""
+        manifest = self.manifest(output_path)
+        if manifest is None:
+            return None
+        if not os.path.exists(manifest['source']):
+            with self.lock:
+                self.stats['missing_source'] += 1
+            raise FileNotFoundError(f"Source of {output_path} is no longer cached")
+        if self.touch:
+            self.touch(manifest['source'])
+        clip = self._clip(manifest['source'], manifest['start'], manifest['end'])
+        with self.lock:
+            self.stats['opened'] += 1
+        return clip
+
+    def stream(self, clip: VirtualClip, first: int, last: int):
+        """clip.iter_bytes, counted as served"""
+        for chunk in clip.iter_bytes(first, last):
+            with self.lock:
+                self.stats['bytes_served'] += len(chunk)
+            yield chunk
+
+    def materialize(self, output_path: str) -> Optional[str]:
+        """Write the virtual clip at output_path out as a regular MP4; None if it is not one"""
+        clip = self.open(output_path)
+        if clip is None:
+            return None
+        folder = os.path.dirname(output_path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix='.materialize_', suffix='.mp4', dir=folder)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in clip.iter_bytes(0, clip.size - 1):
+                    f.write(chunk)
+            os.replace(tmp_path, output_path)
+        except OSError:
+            os.remove(tmp_path)
+            raise
+        manifest_path = os.path.abspath(output_path + MANIFEST_SUFFIX)
+        try:
+            os.remove(manifest_path)
+        except FileNotFoundError:
+            # Another download of the same clip got there first
+            return output_path
+        if self.drop:
+            self.drop(clip.video_path, manifest_path)
+        with self.lock:
+            self.stats['materialized'] += 1
+        logging.info(f"Materialized virtual clip {output_path} ({clip.size} bytes)")
+        return output_path
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {**self.stats, 'parse_seconds': round(self.stats['parse_seconds'], 2),
+                    'sources': len(self.sources), 'clips': len(self.clips)}
+
+    def _clip(self, video_path: str, start: float, end: float) -> VirtualClip:
+        stat = os.stat(video_path)
+        key = (video_path, stat.st_size, stat.st_mtime_ns, start, end)
+        with self.lock:
+            if key in self.clips:
+                self.clips.move_to_end(key)
+                return self.clips[key]
+        clip = build_virtual_clip(self._source(video_path, stat), start, end)
+        with self.lock:
+            self.clips[key] = clip
+            while len(self.clips) > CLIP_CACHE_SIZE:
+                self.clips.popitem(last=False)
+        return clip
+
+    def _source(self, video_path: str, stat: os.stat_result) -> Mp4Source:
+        # A re-downloaded source is parsed again
+        key = (video_path, stat.st_size, stat.st_mtime_ns)
+        with self.parse_lock:
+            with self.lock:
+                if key in self.sources:
+                    self.sources.move_to_end(key)
+                    return self.sources[key]
+            started = time.monotonic()
+            source = Mp4Source(video_path)
+            elapsed = time.monotonic() - started
+            logging.info(f"Parsed sample tables of {video_path} ({sum(len(t.sizes) for t in source.tracks)} samples, "
+                         f"{elapsed:.2f}s)")
+            with self.lock:
+                self.stats['parsed'] += 1
+                self.stats['parse_seconds'] += elapsed
+                self.sources[key] = source
+                while len(self.sources) > SOURCE_CACHE_SIZE:
+                    self.sources.popitem(last=False)
+        return source
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable
+import ffmpeg
+
+from utils.ffmpeg_async import run_ffmpeg
+from utils.keyframe_index import TIME_TOLERANCE, KeyframeIndex
+
+# Videos longer than this are analyzed in windows unless the job says otherwise
+WINDOWED_ANALYSIS_MIN_SECONDS = 45 * 60
+DEFAULT_WINDOW_SECONDS = 20 * 60
+DEFAULT_OVERLAP_SECONDS = 2 * 60
+# How far around a window's start its keyframe is looked for when there is no keyframe index
+KEYFRAME_LOOKBACK_SECONDS = 20
+
+
+def plan_windows(duration: float, window_seconds: float = DEFAULT_WINDOW_SECONDS,
+                 overlap_seconds: float = DEFAULT_OVERLAP_SECONDS) -> list:
+    """Split [0, duration) into (start, end) windows that overlap by overlap_seconds.
+
+    A remainder no longer than the overlap is added to the last window
+    instead of getting a window of its own, so that window can run up to
+    window_seconds + overlap_seconds.
+    """
+    step = window_seconds - overlap_seconds
+    windows = []
+    start = 0
+    while start + window_seconds + overlap_seconds < duration:
+        windows.append((start, start + window_seconds))
+        start += step
+    windows.append((start, duration))
+    return windows
+
+
+async def copy_start(video_path: str, t: float) -> float:
+    """The keyframe a stream copy seeked to t starts on, on -ss's scale.
+
+    That is the keyframe at or before t, or the first keyframe when t is
+    before it. Only the packets within KEYFRAME_LOOKBACK_SECONDS of t are
+    read; t itself is returned, with a warning, if no keyframe is that close.
+    """
+    # -read_intervals takes container timestamps, while -ss is relative to the container's start_time
+    start_time = float((await asyncio.to_thread(ffmpeg.probe, video_path))['format'].get('start_time') or 0)
+    lookback = max(0.0, t - KEYFRAME_LOOKBACK_SECONDS)
+    window = f"{start_time + lookback:.6f}%{start_time + t + KEYFRAME_LOOKBACK_SECONDS:.6f}"
+    packets = (await asyncio.to_thread(
+        ffmpeg.probe, video_path, select_streams='v:0', read_intervals=window, show_entries='packet=pts_time,flags'
+    )).get('packets', [])
+    keyframes = sorted(float(packet['pts_time']) - start_time for packet in packets
+                       if 'K' in packet.get('flags', '') and packet.get('pts_time', 'N/A') != 'N/A')
+    before = [keyframe for keyframe in keyframes if keyframe <= t + TIME_TOLERANCE]
+    if before:
+        return round(before[-1], 6)
+    if keyframes and lookback == 0:
+        return round(keyframes[0], 6)
+    logging.warning(f"No keyframe within {KEYFRAME_LOOKBACK_SECONDS}s before {t} in {video_path}")
+    return t
+
+
+async def cut_window(video_path: str, start: float, end: float, output_dir: str,
+                     keyframes: KeyframeIndex = None) -> tuple:
+    """Stream-copy [start, end) of video_path into its own file; returns (output_path, origin).
+
+    Stream copy starts on the keyframe at or before start, up to one GOP
+    before start; it is taken from keyframes when given and probed from the
+    source otherwise. origin is the source time of the window's t=0: that
+    keyframe, less the decode delay B-frames leave in front of it. Clip
+    times found in the window are offset by origin, not start.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    name, ext = os.path.splitext(os.path.basename(video_path))
+    output_path = os.path.join(output_dir, f"{name}_window_{int(start)}_{int(end)}{ext}")
+    if keyframes:
+        keyframe = max(keyframes.before(start), keyframes.keyframes[0])
+    else:
+        keyframe = await copy_start(video_path, start)
+    await run_ffmpeg(
+        ffmpeg.input(video_path, ss=start, t=end - start)
+              .output(output_path, c='copy', avoid_negative_ts='make_zero')
+              .overwrite_output()
+    )
+    stream = (await asyncio.to_thread(ffmpeg.probe, output_path, select_streams='v:0'))['streams']
+    video_start = float(stream[0].get('start_time') or 0) if stream else 0.0
+    return output_path, round(keyframe - video_start, 6)
+
+
+def offset_clips(clips: list, offset: float) -> list:
+    """Shift window-relative clip times back onto the source timeline"""
+    return [
+        {**clip, 'start_time': clip['start_time'] + offset, 'end_time': clip['end_time'] + offset}
+        for clip in clips
+    ]
+
+
+def overlap_ratio(a: dict, b: dict) -> float:
+    """Overlap of two clips as a fraction of the shorter one"""
+    overlap = min(a['end_time'], b['end_time']) - max(a['start_time'], b['start_time'])
+    shorter = min(a['end_time'] - a['start_time'], b['end_time'] - b['start_time'])
+    if overlap <= 0 or shorter <= 0:
+        return 0.0
+    return overlap / shorter
+
+
+def merge_window_clips(clip_lists: list, min_overlap: float = 0.5) -> list:
+    """Merge per-window clip lists, keeping one clip for each moment found twice.
+
+    Moments in the overlap between windows tend to be reported by both; when
+    two clips overlap by more than min_overlap of the shorter one, the one
+    with the higher viral potential wins.
+    """
+    merged = []
+    candidates = sorted(
+        (clip for clips in clip_lists for clip in clips),
+        key=lambda clip: clip.get('viral_potential', 0),
+        reverse=True
+    )
+    for clip in candidates:
+        if all(overlap_ratio(clip, kept) <= min_overlap for kept in merged):
+            merged.append(clip)
+    merged.sort(key=lambda clip: clip['start_time'])
+    return merged
+
+
+async def analyze_windowed(windows: list, analyze_window: Callable[[float, float], Awaitable[tuple]]) -> list:
+    """Analyze all windows concurrently and merge their clips onto one timeline.
+
+    analyze_window(start, end) returns (origin, clips), with clip times
+    relative to origin, the source time the window's file starts at (see
+    cut_window). A failed window is logged and skipped.
+    """
+    results = await asyncio.gather(
+        *(analyze_window(start, end) for start, end in windows),
+        return_exceptions=True
+    )
+    clip_lists = []
+    for (start, end), result in zip(windows, results):
+        if isinstance(result, Exception):
+            logging.error(f"Analysis of window {start}-{end} failed: {result}")
+            continue
+        origin, clips = result
+        clip_lists.append(offset_clips(clips, origin))
+
+    if not clip_lists:
+        raise Exception("Analysis failed for every window")
+    merged = merge_window_clips(clip_lists)
+    logging.info(f"Merged {sum(len(c) for c in clip_lists)} clips from {len(windows)} windows into {len(merged)}")
+    return merged
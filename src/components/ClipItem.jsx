@@ -5,7 +5,9 @@ function ClipItem({ clip, index, onPlay }) {
   const handleDownload = async (e) => {
     e.preventDefault();
     try {
-      const response = await fetch(clip.url, {
+      // Virtual clips are written out as regular files when they are downloaded
+      const downloadUrl = clip.url.includes('/virtual-clips/') ? `${clip.url}?download=1` : clip.url;
+      const response = await fetch(downloadUrl, {
         headers: {
           'ngrok-skip-browser-warning': 'true'
         }
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { supabase } from './supabase';
 
 const API_BASE_URL = 'http://localhost:5050';
 
@@ -20,9 +21,11 @@ const getFullUrl = (path) => {
 
 export const processVideo = async (url, options) => {
   try {
+    // The backend takes the user (and so the plan) from the session token, not from options
+    const { data: { session } } = await supabase.auth.getSession();
     const response = await fetch(`${API_URL}/process-video`, {
       method: 'POST',
-      headers: headers,
+      headers: session ? { ...headers, 'Authorization': `Bearer ${session.access_token}` } : headers,
       body: JSON.stringify({ url, options }),
     });
 